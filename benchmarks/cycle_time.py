@@ -0,0 +1,361 @@
+"""
+End-to-end cycle-time benchmark of the cartridge sequence.
+
+For each scenario (input tray size x defect rate), CartridgeSequencer runs a full
+tray against the simulated robot (robot/sim_robot.py) and the stand-in PLC
+(mqtt/fake_plc.py, through an in-process broker). The defect rate is the share of
+the cartridges rejected at the QR-Code check by the PLC, and again of those left
+at the anomaly check, so both output bins are used.
+
+Everything runs in one process on discrete-event virtual time (VirtualTimeLoop of
+robot/sim_robot.py): time only advances by the modeled durations (moves, gripper,
+PLC scans), so the results are the same on any host, run after run:
+
+- latency of each sequencer step (Step.MV_INPUT, Step.CHECK_QR, ...)
+- round trip time of each robot command, from its sending to its reply (commands
+  are pipelined, so it includes the time queued behind the previous ones)
+- cartridges per minute over the tray
+
+    python3 benchmarks/cycle_time.py [--trays 2x2,3x4] [--defect-rates 0,0.3]
+                                     [--output results.json]
+                                     [--baseline benchmarks/cycle_time_baseline.json]
+
+With --baseline, the throughput of every scenario is compared to the stored one,
+and the exit code is 1 if one of them regressed by more than --tolerance.
+--save-baseline stores the results as the new baseline.
+"""
+
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+from collections import defaultdict
+from contextlib import contextmanager
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "python"))
+sys.path.insert(0, os.path.join(ROOT, "robot"))
+sys.path.insert(0, os.path.join(ROOT, "mqtt"))
+
+from _async_robot_proxy import AsyncRobotProxy
+from _calibration import BinCalibration, CalibrationData
+from _custom_logger import LoggingInterface
+from _custom_types import JointState, Vec3
+from _inspection import Inspector, PlcInspector
+from _planner import RowOrderPlanner, TravelPlanner
+from _plc_client import PlcClient
+from _sequencer import CartridgeSequencer
+from _state import Step
+from _state_stream import RobotStateStream
+from fake_plc import FakePlc, LocalBroker
+from sim_robot import SimConfig, SimRobot, VirtualClock, run_virtual
+
+HOST = "127.0.0.1"
+PORT = 1510
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "cycle_time_baseline.json")
+
+# PLC scan cycle, in virtual time (s)
+PLC_SCAN_TIME = 0.01
+CELL_PITCH = 0.04
+
+
+def layout(nrow: int, ncol: int) -> CalibrationData:
+    """
+    Competition-like layout: input tray on one side of the checking pose, output
+    bins as large as the input tray on the other side.
+    """
+    home = JointState(*SimConfig.home)
+    return CalibrationData(
+        input_bin=BinCalibration(
+            Vec3(0.20, -0.25, 0.05), 0.05, CELL_PITCH, CELL_PITCH, nrow, ncol
+        ),
+        good_bin=BinCalibration(
+            Vec3(0.20, 0.10, 0.05), 0.05, CELL_PITCH, CELL_PITCH, nrow, ncol
+        ),
+        defect_bin=BinCalibration(
+            Vec3(-0.10, 0.20, 0.05), 0.05, CELL_PITCH, CELL_PITCH, nrow, ncol
+        ),
+        checking_approach=Vec3(0.25, 0.0, 0.25),
+        qr_checking=JointState(0.0, -1.2, 1.2, -1.5708, -1.5708, 0.0),
+        defect_checking=home,
+    )
+
+
+def stats(samples: list[float]) -> dict:
+    if len(samples) == 0:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "max": ordered[-1],
+    }
+
+
+class TimedProxy(AsyncRobotProxy):
+    """
+    Robot proxy recording the round trip time of every command.
+    """
+
+    def __init__(self, clock: VirtualClock, srv_ip: str, srv_port: int) -> None:
+        super().__init__(srv_ip, srv_port)
+        self.clock = clock
+        self.rtt: dict[str, list[float]] = defaultdict(list)
+
+    def submit(self, msg: str, resp: str | None = None) -> asyncio.Future:
+        sent = self.clock.now()
+        future = super().submit(msg, resp)
+        opcode = msg[:3]
+        future.add_done_callback(
+            lambda _: self.rtt[opcode].append(self.clock.now() - sent)
+        )
+        return future
+
+
+class TimedSequencer(CartridgeSequencer):
+    """
+    Cartridge sequencer recording the latency of every step.
+    """
+
+    def __init__(self, clock: VirtualClock, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.clock = clock
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.start = self.end = 0.0
+
+    @contextmanager
+    def __timed(self, step: Step):
+        start = self.clock.now()
+        yield
+        self.latency[step.name].append(self.clock.now() - start)
+
+    async def idle(self):
+        await super().idle()
+        self.start = self.clock.now()
+
+    async def go_input(self):
+        with self.__timed(Step.MV_INPUT):
+            await super().go_input()
+
+    async def check_qr(self):
+        with self.__timed(Step.CHECK_QR):
+            await super().check_qr()
+
+    async def check_anomaly(self):
+        with self.__timed(Step.CHECK_ANOMALIES):
+            await super().check_anomaly()
+
+    async def go_good_bin(self):
+        with self.__timed(Step.MV_GOOD_BIN):
+            await super().go_good_bin()
+
+    async def go_bad_bin(self):
+        with self.__timed(Step.MV_BAD_BIN):
+            await super().go_bad_bin()
+
+    async def cartridge_done(self):
+        await super().cartridge_done()
+        self.end = self.clock.now()
+
+
+class DefectRateInspector(PlcInspector):
+    """
+    QR-Code check through the stand-in PLC, and anomaly check detecting a defect
+    with the given probability (seeded, drawn apart from the PLC).
+    """
+
+    def __init__(self, plc: PlcClient, defect_rate: float, seed: int) -> None:
+        super().__init__(plc)
+        self.__defect_rate = defect_rate
+        self.__random = random.Random(f"anomalies-{seed}")
+
+    async def start_defect_check(self) -> asyncio.Future:
+        return Inspector._verdict(self.__random.random() < self.__defect_rate)
+
+
+async def _no_operator() -> str:
+    return ""
+
+
+async def run_scenario(nrow: int, ncol: int, defect_rate: float, args: Namespace):
+    clock = VirtualClock()
+
+    broker = LocalBroker()
+    fake_plc = FakePlc(
+        broker.client(),
+        scan_time=PLC_SCAN_TIME,
+        defect_rate=defect_rate,
+        seed=args.seed,
+    )
+    fake_plc.start()
+    plc = PlcClient("local", client=broker.client())
+    await plc.connect()
+
+    proxy = TimedProxy(clock, HOST, args.port)
+    proxy.prefer_binary = args.binary
+    proxy.prefer_events = args.events
+    await proxy.open_socket()
+    stream_port = None
+    if args.stream:
+        stream_port = args.port + 1
+        proxy.state_stream = RobotStateStream(HOST, stream_port)
+        await proxy.state_stream.open_socket()
+
+    robot = SimRobot(clock=clock)
+    await robot.start(HOST, args.port, stream_port)
+
+    sequencer = TimedSequencer(
+        clock,
+        proxy,
+        "",
+        inspector=DefectRateInspector(plc, defect_rate, args.seed),
+        overlap_inspection=args.overlap,
+        step_macros=args.macros,
+        planner=TravelPlanner() if args.plan_travel else RowOrderPlanner(),
+        # The operator starts the run and empties the bins instantly
+        operator_input=_no_operator,
+    )
+    sequencer.state.set_calibration(layout(nrow, ncol), force=True)
+    try:
+        await sequencer.run()
+    finally:
+        await proxy.close_socket()
+        if proxy.state_stream is not None:
+            await proxy.state_stream.close()
+        await robot.wait()
+        await plc.close()
+        fake_plc.stop()
+
+    n_cartridges = nrow * ncol
+    duration = sequencer.end - sequencer.start
+    return {
+        "tray": f"{nrow}x{ncol}",
+        "defect_rate": defect_rate,
+        "cartridges": n_cartridges,
+        "duration": duration,
+        "cartridges_per_min": 60 * n_cartridges / duration if duration > 0 else 0.0,
+        "steps": {step: stats(v) for step, v in sequencer.latency.items()},
+        "commands": {op: stats(v) for op, v in proxy.rtt.items()},
+    }
+
+
+def scenario_key(result: dict) -> str:
+    return f"{result['tray']}@{result['defect_rate']}"
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> bool:
+    """
+    Print the throughput of each scenario against the baseline.
+    Returns False if one of them regressed by more than the tolerance.
+    """
+    reference = {scenario_key(r): r for r in baseline["scenarios"]}
+    ok = True
+    for r in results:
+        key = scenario_key(r)
+        if key not in reference:
+            print(f"{key:<12} no baseline")
+            continue
+        old = reference[key]["cartridges_per_min"]
+        change = (r["cartridges_per_min"] - old) / old if old > 0 else 0.0
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        flag = "REGRESSION" if regressed else "ok"
+        print(
+            f"{key:<12} {r['cartridges_per_min']:7.2f} /min  "
+            f"baseline {old:7.2f} /min ({100 * change:+6.1f} %)  {flag}"
+        )
+    return ok
+
+
+def report(result: dict) -> None:
+    print(
+        f"tray {result['tray']:<6} defect rate {result['defect_rate']:4.2f}  "
+        f"{result['cartridges_per_min']:7.2f} cartridges/min "
+        f"({result['duration']:.2f} s for {result['cartridges']})"
+    )
+    for name, s in list(result["steps"].items()) + list(result["commands"].items()):
+        print(
+            f"    {name:<16} n={s['count']:<4} mean {s['mean']:.3f} s  "
+            f"p95 {s['p95']:.3f} s  max {s['max']:.3f} s"
+        )
+
+
+def parse_tray(tray: str) -> tuple[int, int]:
+    nrow, ncol = tray.lower().split("x")
+    return int(nrow), int(ncol)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--trays", default="2x2,3x4", help="Input tray sizes (NxM,...)")
+    parser.add_argument("--defect-rates", default="0,0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--overlap", action="store_true")
+    parser.add_argument("--plan-travel", action="store_true")
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--events", action="store_true")
+    parser.add_argument("--macros", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare to this baseline JSON file")
+    parser.add_argument(
+        "--save-baseline",
+        nargs="?",
+        const=DEFAULT_BASELINE,
+        help="Store the results as the baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="Throughput loss tolerated before reporting a regression",
+    )
+    args = parser.parse_args()
+
+    LoggingInterface.configure_lvl("error")
+
+    results = []
+    for tray in args.trays.split(","):
+        for rate in args.defect_rates.split(","):
+            result = run_virtual(run_scenario(*parse_tray(tray), float(rate), args))
+            report(result)
+            results.append(result)
+
+    options = [
+        "overlap",
+        "plan_travel",
+        "binary",
+        "events",
+        "macros",
+        "stream",
+        "seed",
+    ]
+    document = {
+        "python": platform.python_version(),
+        "options": {o: getattr(args, o) for o in options},
+        "scenarios": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("options") != document["options"]:
+            print("Warning: baseline measured with other options")
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
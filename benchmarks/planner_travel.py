@@ -0,0 +1,98 @@
+"""
+Benchmark of the travel saved by the travel-optimised cell planner.
+
+For each calibration layout, a full input tray is processed with the row order
+planner and with the travel planner, with the same random sequence of defects.
+The Cartesian travel between the input bin, the checking approach pose and the
+output bins is summed for each planner.
+
+    python3 benchmarks/planner_travel.py [calib files...] [--defect-rate 0.3]
+
+Without calibration files, calib/*.yaml and a sample competition layout are used.
+"""
+
+import glob
+import os
+import random
+import sys
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from _calibration import BinCalibration, CalibrationData
+from _custom_types import Vec3
+from _planner import RowOrderPlanner, TravelPlanner, travel
+from _state import APPROACH, Bin, State
+
+# Sample layout: 4x5 input tray, output bins on both sides of the checking pose
+SAMPLE_LAYOUT = CalibrationData(
+    input_bin=BinCalibration(Vec3(0.10, -0.30, 0.05), 0.05, 0.04, 0.04, 4, 5),
+    good_bin=BinCalibration(Vec3(0.25, 0.10, 0.05), 0.05, 0.04, 0.04, 4, 5),
+    defect_bin=BinCalibration(Vec3(-0.15, 0.10, 0.05), 0.05, 0.04, 0.04, 4, 5),
+    checking_approach=Vec3(0.05, 0.05, 0.25),
+)
+
+
+def tray_travel(calib: CalibrationData, planner: RowOrderPlanner, defects) -> float:
+    """
+    Total travel of the robot to process a full input tray.
+    """
+    state = State(calib)
+    checking = state.get_checking_approach_pos()
+    planner.reset()
+
+    distance = 0.0
+    position = checking
+    for defect in defects:
+        idx = planner.next_input(state)
+        if idx is None:
+            break
+        cell = state.poses(Bin.INPUT)[idx][APPROACH]
+        state.input_taken[idx] = True
+        distance += travel(position, cell) + travel(cell, checking)
+
+        bin = Bin.DEFECT if defect else Bin.GOOD
+        drop = planner.next_drop(state, bin)
+        if drop is None:
+            # Bin emptied by the operator
+            occupancy = state.occupancy(bin)
+            occupancy[:] = [False] * len(occupancy)
+            drop = planner.next_drop(state, bin)
+        state.occupancy(bin)[drop] = True
+        position = state.poses(bin)[drop][APPROACH]
+        distance += travel(checking, position)
+
+    return distance
+
+
+def report(name: str, calib: CalibrationData, defect_rate: float, seed: int) -> None:
+    rng = random.Random(seed)
+    n_cells = calib.input_bin.nrow * calib.input_bin.ncol
+    defects = [rng.random() < defect_rate for _ in range(n_cells)]
+
+    baseline = tray_travel(calib, RowOrderPlanner(), defects)
+    planned = tray_travel(calib, TravelPlanner(), defects)
+    saved = baseline - planned
+    ratio = 100 * saved / baseline if baseline > 0 else 0.0
+    print(
+        f"{name:<30} {n_cells:>5} cells  row order {baseline:8.3f} m  "
+        f"planned {planned:8.3f} m  saved {saved:7.3f} m ({ratio:5.1f} %)"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("calib", nargs="*", help="Calibration files")
+    parser.add_argument("--defect-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = args.calib
+    if len(files) == 0:
+        root = os.path.join(os.path.dirname(__file__), "..")
+        files = sorted(glob.glob(os.path.join(root, "calib", "*.yaml")))
+        report("sample layout", SAMPLE_LAYOUT, args.defect_rate, args.seed)
+
+    for f in files:
+        calib = CalibrationData.load_from_file(f)
+        report(os.path.basename(f), calib, args.defect_rate, args.seed)
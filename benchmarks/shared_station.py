@@ -0,0 +1,143 @@
+"""
+Benchmark of the inspection station shared by several robot cells.
+
+Every cell is a simulated robot (robot/sim_robot.py) connected to one CellServer,
+with its own sequencer and tray, and all of them inspect their cartridges at the
+same station. The cells run at different speeds (--speeds, fraction of the
+URScript default speeds), so they hold the station for different times. The run
+is done with each admission policy of InspectionStation: arrival order and
+shortest expected holding time first. Times are measured on the discrete virtual
+time of the simulator (see VirtualTimeLoop), independent of the host speed:
+
+- cartridges per minute of each cell
+- station utilisation, and waiting time of each cell before being admitted
+
+    python3 benchmarks/shared_station.py [--speeds 1,0.6,0.35] [--tray 3x4]
+                                         [--output results.json]
+"""
+
+import asyncio
+import json
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "python"))
+sys.path.insert(0, os.path.join(ROOT, "robot"))
+
+from _cell_server import CellServer
+from _custom_logger import LoggingInterface
+from _sequencer import CartridgeSequencer
+from _station import InspectionStation
+from cycle_time import _no_operator, layout, parse_tray
+from sim_robot import SimConfig, SimRobot, VirtualClock, run_virtual
+
+HOST = "127.0.0.1"
+PORT = 1530
+
+
+class TimedCell(CartridgeSequencer):
+    """
+    Cartridge sequencer recording the virtual time of its tray.
+    """
+
+    def __init__(self, clock: VirtualClock, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.clock = clock
+        self.start = self.end = 0.0
+
+    async def idle(self):
+        await super().idle()
+        self.start = self.clock.now()
+
+    async def cartridge_done(self):
+        await super().cartridge_done()
+        self.end = self.clock.now()
+
+
+async def run_policy(shortest_first: bool, args: Namespace) -> dict:
+    clock = VirtualClock()
+    nrow, ncol = parse_tray(args.tray)
+    speeds = [float(s) for s in args.speeds.split(",")]
+
+    station = InspectionStation(shortest_first, clock=clock.now)
+    server = CellServer(HOST, args.port)
+    cells: list[TimedCell] = []
+    for i in range(len(speeds)):
+        cell_id = f"cell{i}"
+        cell = TimedCell(
+            clock,
+            server.add_cell(cell_id),
+            "",
+            operator_input=_no_operator,
+            prefix=f"Sequencer {cell_id}",
+            station=station.add_cell(cell_id),
+        )
+        cell.state.set_calibration(layout(nrow, ncol), force=True)
+        cells.append(cell)
+    await server.open_socket()
+
+    robots = []
+    for i, speed in enumerate(speeds):
+        config = SimConfig(
+            joint_speed=SimConfig.joint_speed * speed,
+            linear_speed=SimConfig.linear_speed * speed,
+        )
+        robot = SimRobot(config, clock)
+        await robot.start(HOST, args.port, None, f"cell{i}")
+        robots.append(robot)
+
+    try:
+        await asyncio.gather(*(cell.run() for cell in cells))
+    finally:
+        await server.close_socket()
+        for robot in robots:
+            await robot.wait()
+
+    stats = station.stats()
+    result = {
+        "policy": "shortest_first" if shortest_first else "arrival_order",
+        "utilisation": stats["utilisation"],
+        "cells": {},
+    }
+    for cell, speed, (cell_id, access) in zip(cells, speeds, stats["cells"].items()):
+        duration = cell.end - cell.start
+        result["cells"][cell_id] = {
+            "speed": speed,
+            "cartridges_per_min": 60 * nrow * ncol / duration if duration > 0 else 0.0,
+            **access,
+        }
+    return result
+
+
+def report(result: dict) -> None:
+    print(f"{result['policy']:<15} station busy {100 * result['utilisation']:5.1f} %")
+    for cell_id, c in result["cells"].items():
+        print(
+            f"    {cell_id:<8} speed {c['speed']:4.2f}  "
+            f"{c['cartridges_per_min']:6.2f} cartridges/min  "
+            f"hold {c['hold_mean']:.2f} s  wait mean {c['wait']['mean']:7.1f} ms  "
+            f"max {c['wait']['max']:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--speeds", default="1,0.6,0.35", help="Speed of each cell")
+    parser.add_argument("--tray", default="3x4", help="Input tray size (NxM)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    LoggingInterface.configure_lvl("error")
+
+    results = []
+    for shortest_first in (False, True):
+        result = run_virtual(run_policy(shortest_first, args))
+        report(result)
+        results.append(result)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
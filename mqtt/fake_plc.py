@@ -0,0 +1,191 @@
+"""
+Stand-in for the PLC, to test the PLC handshake without hardware.
+
+It applies the command codes received on the PLC topic after one scan cycle,
+acknowledges each of them on the status topic and publishes a QR-Code on the PLC
+topic when asked to (code 3). It runs either against a real MQTT broker:
+
+    python3 mqtt/fake_plc.py --host 127.0.0.1
+
+or in-process through LocalBroker, which hands paho-like clients to both the
+PlcClient and the FakePlc.
+"""
+
+import asyncio
+import random
+from argparse import ArgumentParser
+from typing import Iterable
+
+TOPIC = "PLC"
+STATUS_TOPIC = "PLC/status"
+
+RESET = "0"
+TRIGGER_ON = "1"
+TRIGGER_OFF = "2"
+PUBLISH = "3"
+
+GOOD_QR = "32314BATCH0003606"
+BAD_QR = "32314WRONGBATCH0003607"
+
+
+class _Message:
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = topic
+        self.payload = payload
+
+
+class LocalBroker:
+    """
+    In-process MQTT broker, delivering every publication to the subscribed clients.
+    """
+
+    def __init__(self) -> None:
+        self.__clients: list["LocalMqttClient"] = []
+
+    def client(self) -> "LocalMqttClient":
+        """
+        Create a new client connected to this broker.
+        """
+        client = LocalMqttClient(self)
+        self.__clients.append(client)
+        return client
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        for client in self.__clients:
+            client.deliver(topic, payload)
+
+
+class LocalMqttClient:
+    """
+    Subset of the paho client API used by PlcClient and FakePlc.
+    """
+
+    def __init__(self, broker: LocalBroker) -> None:
+        self.__broker = broker
+        self.__topics: set[str] = set()
+        self.__connected = False
+        self.on_connect = None
+        self.on_message = None
+
+    def connect_async(self, host: str, port: int = 1883, *args, **kwargs) -> None:
+        pass
+
+    def loop_start(self) -> None:
+        self.__connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0, None)
+
+    def loop_stop(self) -> None:
+        self.__connected = False
+
+    def disconnect(self) -> None:
+        self.__connected = False
+
+    def subscribe(self, topic: str, qos: int = 0) -> None:
+        self.__topics.add(topic)
+
+    def publish(self, topic: str, payload, qos: int = 0) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.__broker.publish(topic, payload)
+
+    def deliver(self, topic: str, payload: bytes) -> None:
+        if self.__connected and topic in self.__topics and self.on_message is not None:
+            self.on_message(self, None, _Message(topic, payload))
+
+
+class FakePlc:
+    """
+    Simulated PLC answering the vision handshake.
+    QR-Codes are taken from qr_codes if given, otherwise they are drawn with the
+    given defect rate. Without status, the codes are not acknowledged on the
+    status topic (like mqtt/callback.scl).
+    """
+
+    def __init__(
+        self,
+        client,
+        scan_time: float = 0.01,
+        qr_codes: Iterable[str] | None = None,
+        defect_rate: float = 0.0,
+        seed: int | None = None,
+        status: bool = True,
+    ) -> None:
+        self.__client = client
+        self.__status = status
+        self.__scan_time = scan_time
+        self.__qr_codes = iter(qr_codes) if qr_codes is not None else None
+        self.__defect_rate = defect_rate
+        self.__random = random.Random(seed)
+        self.__loop: asyncio.AbstractEventLoop | None = None
+
+        self.state = RESET
+        self.triggered = 0
+
+    def start(self) -> None:
+        """
+        Connect to the broker, the PLC then answers from the running event loop.
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__client.on_connect = self.__on_connect
+        self.__client.on_message = self.__on_message
+        self.__client.loop_start()
+
+    def stop(self) -> None:
+        self.__client.disconnect()
+        self.__client.loop_stop()
+
+    def next_qr(self) -> str:
+        if self.__qr_codes is not None:
+            return next(self.__qr_codes, "")
+        if self.__random.random() < self.__defect_rate:
+            return BAD_QR
+        return GOOD_QR
+
+    def __on_connect(self, client, userdata, flags, reason_code, properties=None):
+        client.subscribe(TOPIC, qos=1)
+
+    def __on_message(self, client, userdata, msg):
+        code = msg.payload.decode(errors="replace").strip()
+        if code in (RESET, TRIGGER_ON, TRIGGER_OFF, PUBLISH):
+            # Applied on the next scan cycle
+            self.__loop.call_soon_threadsafe(
+                self.__loop.call_later, self.__scan_time, self.__apply, code
+            )
+
+    def __apply(self, code: str) -> None:
+        if code == TRIGGER_ON and self.state != TRIGGER_ON:
+            self.triggered += 1
+        if code == PUBLISH:
+            self.__client.publish(TOPIC, self.next_qr(), qos=1)
+        self.state = code
+        if self.__status:
+            self.__client.publish(STATUS_TOPIC, code, qos=1)
+
+
+async def _serve(host: str, port: int, defect_rate: float, status: bool) -> None:
+    import paho.mqtt.client as mqtt
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect_async(host, port)
+    plc = FakePlc(client, defect_rate=defect_rate, status=status)
+    plc.start()
+    print(f"Fake PLC connected to {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        plc.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--defect-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--no-status",
+        help="Do not acknowledge the codes on the status topic",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port, args.defect_rate, not args.no_status))
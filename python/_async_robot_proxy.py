@@ -0,0 +1,1139 @@
+import asyncio
+import math
+import socket
+import time
+from collections import deque
+from typing import Awaitable
+
+from _custom_types import JointState, Pose, rad2deg
+from _custom_logger import LoggingInterface
+from _journal import Journal
+from _latency import CommandLatency
+from _state_stream import RobotStateStream
+from _wire_protocol import BinaryProtocol, ReplyBuffer, TextProtocol
+
+
+class RobotCommands:
+    """
+    Robot protocol definition, shared by the asynchronous and blocking proxies:
+    command patterns, command formatting and reply parsing.
+    """
+
+    DEGREES_BY_DEFAULT = True
+    PARAM_SEP = ","
+    LINE_END = ";"
+
+    # Command patterns
+    GET_JOINT_POS = "gjp"
+    GET_TCP_POS = "gtp"
+    MOVE_J = "mvj,{},{},{},{},{},{}"
+    MOVE_J_RESP = "mvjok"
+    MOVE_L = "mvl,{},{},{},{},{},{}"
+    MOVE_L_RESP = "mvlok"
+    MOVE_PATH = "mvp"
+    MOVE_PATH_RESP = "mvpok"
+    MAX_PATH_LEN = 4
+    OPEN_GRIPPER = "gop"
+    CLOSE_GRIPPER = "gcl"
+    WAIT_STEADY = "std"
+    STOP = "stp"
+    STOP_RESP = "stpok"
+    BINARY = "bin"
+    BINARY_RESP = "binok"
+    # Steadiness events, pushed by the robot as "std,<move id>"
+    EVENTS = "evt"
+    EVENTS_RESP = "evtok"
+    # Step macros run by the robot program, and their number of values
+    MACRO = "mcr"
+    MACRO_RESP = "mcrok"
+    PICK = "pck"
+    PLACE = "plc"
+    MACROS = {PICK: 14, PLACE: 8}
+    # Sent first by the robot program when several cells share the server
+    CELL = "cell"
+    CELL_RESP = "cellok"
+    UNKNOWN = "ukn"
+
+    @staticmethod
+    def movej_cmd(joints: JointState) -> str:
+        """
+        Format the joint space move command for the given joint state.
+        """
+        rad_joints = joints.in_rad()
+        return RobotCommands.MOVE_J.format(
+            rad_joints.base,
+            rad_joints.shoulder,
+            rad_joints.elbow,
+            rad_joints.wrist1,
+            rad_joints.wrist2,
+            rad_joints.wrist3,
+        )
+
+    @staticmethod
+    def movel_cmd(pose: Pose) -> str:
+        """
+        Format the world space move command for the given pose.
+        """
+        rad_pose = pose.in_rad()
+        return RobotCommands.MOVE_L.format(
+            rad_pose.x,
+            rad_pose.y,
+            rad_pose.z,
+            rad_pose.rx,
+            rad_pose.ry,
+            rad_pose.rz,
+        )
+
+    @staticmethod
+    def movel_path_cmd(poses: list[Pose], blends: list[float]) -> str:
+        """
+        Format the blended world space path command for the given waypoints.
+        """
+        if len(poses) != len(blends):
+            raise ValueError("One blend radius is needed per waypoint")
+        if not 0 < len(poses) <= RobotCommands.MAX_PATH_LEN:
+            raise ValueError(
+                f"A path has between 1 and {RobotCommands.MAX_PATH_LEN} waypoints"
+            )
+
+        params = [RobotCommands.MOVE_PATH, str(len(poses))]
+        for pose, blend in zip(poses, blends):
+            rad_pose = pose.in_rad()
+            params += [
+                str(rad_pose.x),
+                str(rad_pose.y),
+                str(rad_pose.z),
+                str(rad_pose.rx),
+                str(rad_pose.ry),
+                str(rad_pose.rz),
+                str(blend),
+            ]
+        return RobotCommands.PARAM_SEP.join(params)
+
+    @staticmethod
+    def macro_cmd(name: str, params: list[Pose | float]) -> str:
+        """
+        Format the step macro command, poses being given as six values in radians.
+        """
+        if name not in RobotCommands.MACROS:
+            raise ValueError(f"Unknown macro '{name}'")
+
+        values = []
+        for param in params:
+            if isinstance(param, Pose):
+                rad_pose = param.in_rad()
+                param = [
+                    rad_pose.x,
+                    rad_pose.y,
+                    rad_pose.z,
+                    rad_pose.rx,
+                    rad_pose.ry,
+                    rad_pose.rz,
+                ]
+            else:
+                param = [param]
+            values += [str(v) for v in param]
+        if len(values) != RobotCommands.MACROS[name]:
+            raise ValueError(
+                f"Macro '{name}' takes {RobotCommands.MACROS[name]} values, "
+                f"got {len(values)}"
+            )
+        return RobotCommands.PARAM_SEP.join([RobotCommands.MACRO, name] + values)
+
+    def _parse_joint_state(
+        self, result: str | None, degrees: bool
+    ) -> JointState | None:
+        """
+        Parse a gjp reply into a JointState object. Return None if it is malformed.
+        """
+        # If com error
+        if result is None:
+            return None
+
+        elems = result.split(RobotCommands.PARAM_SEP)
+        if len(elems) != 7 or elems[0] != RobotCommands.GET_JOINT_POS:
+            self._error("Malformed result for GetJoinState : '%s'", result)
+            return None
+
+        return JointState(
+            rad2deg(float(elems[1])) if degrees else float(elems[1]),
+            rad2deg(float(elems[2])) if degrees else float(elems[2]),
+            rad2deg(float(elems[3])) if degrees else float(elems[3]),
+            rad2deg(float(elems[4])) if degrees else float(elems[4]),
+            rad2deg(float(elems[5])) if degrees else float(elems[5]),
+            rad2deg(float(elems[6])) if degrees else float(elems[6]),
+            False,
+        )
+
+    def _parse_tcp_pose(self, result: str | None, degrees: bool) -> Pose | None:
+        """
+        Parse a gtp reply into a Pose object. Return None if it is malformed.
+        """
+        # If com error
+        if result is None:
+            return None
+
+        elems = result.split(RobotCommands.PARAM_SEP)
+        if len(elems) != 7 or elems[0] != RobotCommands.GET_TCP_POS:
+            self._error("Malformed result for GetTcpPose : '%s'", result)
+            return None
+
+        return Pose(
+            float(elems[1]),
+            float(elems[2]),
+            float(elems[3]),
+            rad2deg(float(elems[4])) if degrees else float(elems[4]),
+            rad2deg(float(elems[5])) if degrees else float(elems[5]),
+            rad2deg(float(elems[6])) if degrees else float(elems[6]),
+            False,
+        )
+
+
+def _quaternion(r: list[float]) -> tuple[float, float, float, float]:
+    angle = math.sqrt(sum(v * v for v in r))
+    if angle < 1e-12:
+        return (1.0, 0.0, 0.0, 0.0)
+    s = math.sin(angle / 2) / angle
+    return (math.cos(angle / 2), r[0] * s, r[1] * s, r[2] * s)
+
+
+def _rotation_angle(a: list[float], b: list[float]) -> float:
+    """
+    Angle of the rotation between two orientations given as rotation vectors.
+    """
+    dot = abs(sum(x * y for x, y in zip(_quaternion(a), _quaternion(b))))
+    return 2 * math.acos(min(1.0, dot))
+
+
+class _PendingCommand:
+    """
+    Command waiting for its reply, with its perf_counter_ns timestamps.
+    """
+
+    __slots__ = ("msg", "resp", "future", "sent", "first_byte", "move_id")
+
+    def __init__(self, msg: str, resp: str | None, future: asyncio.Future) -> None:
+        self.msg = msg
+        self.resp = resp
+        self.future = future
+        self.sent = time.perf_counter_ns()
+        self.first_byte = 0
+        # Id of the move sent to the current client, 0 if not a move
+        self.move_id = 0
+
+
+class AsyncRobotProxy(RobotCommands, LoggingInterface):
+    """
+    Class for communicating between the robot via TCP/IP socket, built on
+    asyncio streams so that one event loop can drive the robot alongside
+    other I/O (PLC, operator input, ...).
+
+    When the client is lost (robot program restarted, detected by TCP keepalive
+    within a few seconds if the robot vanishes), its unanswered commands are kept
+    and the next client is waited for in the background. Commands submitted in
+    the meantime are queued. Once a client is back, the robot position tells
+    which of the lost moves were completed: the commands up to the last one
+    reached are resolved, the others are sent again, so the callers only see
+    their commands take longer. A pose the lost moves go through more than once
+    is taken at its first visit: the commands after it (gripper included) are
+    sent again rather than skipped while never executed.
+
+    With the steadiness events negotiated, the robot tells when it is steady
+    after each move, without a std command in the queue: steady() returns a
+    future per move, resolved when the robot settled after it.
+    """
+
+    PREFIX = r"RobotProxy"
+
+    # Dead client detection (s, s, probes)
+    KEEPALIVE_IDLE = 1
+    KEEPALIVE_INTERVAL = 1
+    KEEPALIVE_COUNT = 3
+    # Tolerances for a lost move to be considered completed (rad, m, rad)
+    REACHED_JOINT_TOL = 1e-3
+    REACHED_POS_TOL = 1e-3
+    REACHED_ROT_TOL = 1e-3
+    MOVES = ("mvj", "mvl", "mvp", "mcr")
+    STEADY_EVENT = RobotCommands.WAIT_STEADY + RobotCommands.PARAM_SEP
+
+    def __init__(
+        self,
+        srv_ip: str,
+        srv_port: int,
+        prefix: str = PREFIX,
+        shared_server: bool = False,
+    ) -> None:
+        super().__init__(prefix)
+        self.__binding_ip = (srv_ip, srv_port)
+        self.__server: asyncio.Server | None = None
+        self.__new_clients: asyncio.Queue = asyncio.Queue()
+        # Clients are accepted by a server shared with other proxies (CellServer)
+        # and handed over, instead of a socket server of its own
+        self.__shared_server = shared_server
+
+        self.__writer: asyncio.StreamWriter | None = None
+        self.__reader_task: asyncio.Task | None = None
+        self.__connected = False
+        self.__closing = False
+
+        # Keep the commands of a lost client and recover them with the next one
+        self.recover_commands = True
+        self.__recovery: asyncio.Task | None = None
+        # Commands sent to the lost client, and submitted while it was lost
+        self.__lost: list[_PendingCommand] = []
+        self.__unsent: list[_PendingCommand] = []
+        # Last move acknowledged by the robot: where the lost commands started
+        self.__last_move: str | None = None
+        self.n_reconnects = 0
+
+        # Negotiate the binary wire protocol with each new client
+        self.prefer_binary = False
+        # Negotiate the steadiness events with each new client
+        self.prefer_events = False
+        self.__events = False
+        # Moves sent to the current client, and last move it settled after
+        self.__move_id = 0
+        self.__steady_id = 0
+        # Moves refused by the client (e.g. unknown macro): not numbered by it
+        self.__refused_moves = 0
+        self.__steady_waiters: list[tuple[int, asyncio.Future]] = []
+        # Robot state stream read in place of state requests, when fresh
+        self.state_stream: RobotStateStream | None = None
+        # Journal of the commands and replies, if any
+        self.journal: Journal | None = None
+        self.__replies: TextProtocol | BinaryProtocol = TextProtocol(
+            RobotCommands.LINE_END
+        )
+        self.__pending: deque[_PendingCommand] = deque()
+        # Latency of each command, by opcode
+        self.__latency: dict[str, CommandLatency] = {}
+        self.__last_reply = 0.0
+
+    # =========================================================================
+    # General Purpose Functions
+    # =========================================================================
+
+    async def open_socket(self) -> None:
+        self.__server = await asyncio.start_server(
+            self.__on_client, *self.__binding_ip
+        )
+
+    def __on_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.__new_clients.put_nowait((reader, writer))
+
+    def hand_over(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Give the proxy a client accepted by the shared server.
+        """
+        self.__new_clients.put_nowait((reader, writer))
+
+    async def wait_client(self) -> None:
+        """
+        Wait for a client to connect to the socket server (or for a lost client
+        to be replaced and its commands recovered).
+        """
+        if self.__recovery is not None:
+            await asyncio.shield(self.__recovery)
+            return
+
+        if self.__writer is not None:
+            return
+
+        if self.__server is None and not self.__shared_server:
+            self._error("Wanted to connect when socket is closed!")
+            return
+
+        await self.__accept()
+        await self.__negotiate()
+
+    async def __negotiate(self) -> None:
+        # Events first, they are negotiated with a text command
+        if self.prefer_events:
+            await self.use_events()
+        if self.prefer_binary:
+            await self.use_binary()
+
+    async def __accept(self) -> None:
+        self._info("Waiting for client ...")
+        reader, writer = await self.__new_clients.get()
+
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            AsyncRobotProxy.__keepalive(sock)
+        self.__writer = writer
+        self.__connected = True
+        self.__closing = False
+        self.__replies = TextProtocol(RobotCommands.LINE_END)
+        self.__events = False
+        self.__move_id = self.__steady_id = self.__refused_moves = 0
+        self.__reader_task = asyncio.create_task(self.__read_replies(reader))
+        self._info("Client found with IP %s", writer.get_extra_info("peername"))
+
+    @staticmethod
+    def __keepalive(sock) -> None:
+        """
+        Enable TCP keepalive probes, so that a vanished client is detected.
+        """
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        options = (
+            ("TCP_KEEPIDLE", AsyncRobotProxy.KEEPALIVE_IDLE),
+            ("TCP_KEEPINTVL", AsyncRobotProxy.KEEPALIVE_INTERVAL),
+            ("TCP_KEEPCNT", AsyncRobotProxy.KEEPALIVE_COUNT),
+        )
+        for name, value in options:
+            # Not available on every platform
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+    def __client_lost(self) -> None:
+        """
+        Forget the lost client, keeping its unanswered commands to recover them.
+        """
+        self.__connected = False
+        self.__reader_task = None
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+        # Lost while recovering: only the state requests of the recovery are pending
+        if self.__closing or not self.recover_commands or self.__recovery is not None:
+            self.__fail_pending()
+            if self.__recovery is None:
+                self.__fail_steady()
+            return
+        self.__lost += self.__pending
+        self.__pending.clear()
+        if self.__recovery is None:
+            self.__recovery = asyncio.create_task(self.__recover())
+
+    async def __recover(self) -> None:
+        self._warn(
+            "Waiting for the robot to come back, %s commands to recover",
+            len(self.__lost),
+        )
+        try:
+            while True:
+                await self.__accept()
+                await self.__negotiate()
+                if await self.__reconcile():
+                    break
+        finally:
+            self.__recovery = None
+        self.n_reconnects += 1
+
+    async def __reconcile(self) -> bool:
+        """
+        Resolve the lost commands already executed by the robot and send the
+        others again, then the commands submitted while the client was lost.
+        Returns False if the client was lost again.
+        """
+        if self.__writer is None:
+            return False
+        lost = self.__lost
+        done = 0
+        if any(cmd.msg[:3] in AsyncRobotProxy.MOVES for cmd in lost):
+            joints = self.__query(RobotCommands.GET_JOINT_POS)
+            tcp = self.__query(RobotCommands.GET_TCP_POS)
+            joints, tcp = await joints, await tcp
+            if joints is None or tcp is None:
+                return False
+            joints = [float(v) for v in joints.split(RobotCommands.PARAM_SEP)[1:]]
+            tcp = [float(v) for v in tcp.split(RobotCommands.PARAM_SEP)[1:]]
+            done = self.__executed(lost, joints, tcp)
+
+        self._info(
+            "Recovering commands: %s executed, %s sent again, %s queued",
+            done,
+            len(lost) - done,
+            len(self.__unsent),
+        )
+        self.__lost = []
+        for cmd in lost[:done]:
+            if cmd.msg[:3] in AsyncRobotProxy.MOVES:
+                self.__last_move = cmd.msg
+        for i, cmd in enumerate(lost + self.__unsent):
+            # The replies of the executed state requests are lost, ask again
+            if i < done and cmd.resp is not None:
+                if not cmd.future.done():
+                    cmd.future.set_result(True)
+            else:
+                self.__write(cmd)
+        self.__unsent = []
+
+        # The moves are numbered again by the new client: wait for the last one
+        waiters, self.__steady_waiters = self.__steady_waiters, []
+        for _, future in waiters:
+            self.__wait_steady_event(self.__move_id, future)
+        return True
+
+    def __query(self, msg: str) -> asyncio.Future:
+        cmd = _PendingCommand(msg, None, asyncio.get_running_loop().create_future())
+        self.__write(cmd)
+        return cmd.future
+
+    def __executed(
+        self, lost: list[_PendingCommand], joints: list[float], tcp: list[float]
+    ) -> int:
+        """
+        Number of lost commands executed by the robot, found from its position.
+
+        The lost moves take the robot through their waypoints in order, from the
+        target of the last acknowledged move. The first of these poses the robot
+        is at tells how far it went: every command before the move ending there
+        (or passing through there) was executed. A robot out of this route is
+        taken as not having moved.
+        """
+        route = []
+        if self.__last_move is not None:
+            route += [(0, p) for p in AsyncRobotProxy.__waypoints(self.__last_move)]
+        for i, cmd in enumerate(lost):
+            waypoints = AsyncRobotProxy.__waypoints(cmd.msg)
+            route += [(i, p) for p in waypoints[:-1]]
+            route += [(i + 1, p) for p in waypoints[-1:]]
+        for done, (kind, target) in route:
+            if AsyncRobotProxy.__reached(kind, target, joints, tcp):
+                return done
+        return 0
+
+    @staticmethod
+    def __waypoints(msg: str) -> list[tuple[str, list[float]]]:
+        """
+        Targets a move command goes through, in order, as ("j", joints) or
+        ("p", pose) in radians. Empty if it is not a move.
+        """
+        params = msg.split(RobotCommands.PARAM_SEP)
+        match params[0]:
+            case "mvj":
+                return [("j", [float(v) for v in params[1:7]])]
+            case "mvl":
+                return [("p", [float(v) for v in params[1:7]])]
+            case "mvp":
+                # n, then x, y, z, rx, ry, rz, blend per waypoint
+                values = [float(v) for v in params[2:]]
+                n = int(params[1])
+                return [("p", values[7 * i : 7 * i + 6]) for i in range(n)]
+            case "mcr" if params[1] in RobotCommands.MACROS:
+                v = [float(p) for p in params[2:]]
+                target = v[:6]
+                approach = v[:2] + [v[2] + v[6]] + v[3:6]
+                if params[1] == RobotCommands.PICK:
+                    waypoints = [approach, target, approach, v[8:14]]
+                else:
+                    waypoints = [approach, target, approach]
+                return [("p", p) for p in waypoints]
+        return []
+
+    @staticmethod
+    def __reached(
+        kind: str, target: list[float], joints: list[float], tcp: list[float]
+    ) -> bool:
+        """
+        Whether the robot is at a target (joints, or full TCP pose).
+        """
+        if kind == "j":
+            tol = AsyncRobotProxy.REACHED_JOINT_TOL
+            return all(abs(a - b) <= tol for a, b in zip(target, joints))
+        return (
+            math.dist(target[:3], tcp[:3]) <= AsyncRobotProxy.REACHED_POS_TOL
+            and _rotation_angle(target[3:], tcp[3:]) <= AsyncRobotProxy.REACHED_ROT_TOL
+        )
+
+    def has_client(self) -> bool:
+        """
+        Return True if a client is connected, False otherwise
+        """
+        return self.__writer != None
+
+    def is_binary(self) -> bool:
+        """
+        Return True if the binary wire protocol is used with the current client.
+        """
+        return isinstance(self.__replies, BinaryProtocol)
+
+    async def use_binary(self) -> bool:
+        """
+        Negotiate the binary wire protocol with the current client, keeping the
+        text protocol if the client does not support it.
+        Returns whether the binary protocol is used.
+
+        Sends:    bin;
+        Receives: binok; (then binary frames, see BinaryProtocol)
+        """
+        if self.is_binary():
+            return True
+
+        # Every text reply must be received before switching
+        await asyncio.gather(*(cmd.future for cmd in list(self.__pending)))
+        result = await self.send(RobotCommands.BINARY)
+        if result is None or not result.startswith(RobotCommands.BINARY_RESP):
+            self._warn("Binary protocol not supported by the robot (%s)", result)
+            return False
+
+        self.__replies = BinaryProtocol()
+        self._info("Using the binary protocol")
+        return True
+
+    def has_events(self) -> bool:
+        """
+        Return True if the current client pushes the steadiness events.
+        """
+        return self.__events
+
+    async def use_events(self) -> bool:
+        """
+        Ask the current client to push a steadiness event after each move, as soon
+        as the robot is steady. Must be negotiated before the binary protocol.
+        Returns whether the events are pushed.
+
+        Sends:    evt;
+        Receives: evtok; (then std,<move id>; after each move, moves numbered from
+                  1 since the connection, or its binary frame, see BinaryProtocol;
+                  a move refused with ukn is not numbered)
+        """
+        if self.__events:
+            return True
+        if self.is_binary():
+            self._warn("Steadiness events must be negotiated in the text protocol")
+            return False
+
+        result = await self.send(RobotCommands.EVENTS)
+        if result is None or not result.startswith(RobotCommands.EVENTS_RESP):
+            self._warn("Steadiness events not supported by the robot (%s)", result)
+            return False
+
+        self.__events = True
+        self._info("Using the steadiness events")
+        return True
+
+    def last_move(self) -> int:
+        """
+        Return the id of the last move sent to the current client (0 if none).
+        """
+        return self.__move_id
+
+    def steady(self, move_id: int | None = None) -> asyncio.Future:
+        """
+        Return a future resolved with True once the robot is steady after the
+        given move (by default the last move sent), False if the client is lost.
+        Without the steadiness events, a std command is queued instead.
+        """
+        recovering = self.__recovery not in (None, asyncio.current_task())
+        if not recovering and not self.__events:
+            return self.submit(RobotCommands.WAIT_STEADY, RobotCommands.WAIT_STEADY)
+
+        future = asyncio.get_running_loop().create_future()
+        if recovering:
+            # Waits for the last move once the lost commands are recovered
+            self.__steady_waiters.append((0, future))
+            return future
+        self.__wait_steady_event(
+            self.__move_id if move_id is None else move_id, future
+        )
+        return future
+
+    def __wait_steady_event(self, move_id: int, future: asyncio.Future) -> None:
+        if not self.__events:
+            # The new client does not push the events
+            std = self.submit(RobotCommands.WAIT_STEADY, RobotCommands.WAIT_STEADY)
+            std.add_done_callback(
+                lambda f: future.done() or future.set_result(f.result())
+            )
+        elif move_id <= self.__steady_id:
+            future.set_result(True)
+        else:
+            self.__steady_waiters.append((move_id, future))
+
+    def __on_steady(self, move_id: int) -> None:
+        """
+        Resolve the waiters of the moves up to the one the robot settled after
+        (consecutive moves may be notified once).
+        """
+        self.__steady_id = max(self.__steady_id, move_id)
+        waiting = []
+        for waited, future in self.__steady_waiters:
+            if waited > self.__steady_id:
+                waiting.append((waited, future))
+            elif not future.done():
+                future.set_result(True)
+        self.__steady_waiters = waiting
+
+    def __move_refused(self, move_id: int) -> None:
+        """
+        Renumber the moves after a move the client refused without moving. Its
+        reply comes once the previous moves ran and before the next ones: the
+        client is steady after it once steady after the previous move.
+        """
+        self.__refused_moves += 1
+        if self.__steady_id >= move_id - 1:
+            self.__on_steady(move_id)
+
+    def __fail_steady(self) -> None:
+        for _, future in self.__steady_waiters:
+            if not future.done():
+                future.set_result(False)
+        self.__steady_waiters = []
+
+    async def __read_replies(self, reader: asyncio.StreamReader) -> None:
+        """
+        Receive the client stream and resolve pending commands in FIFO order.
+        """
+        while True:
+            try:
+                data = await reader.read(ReplyBuffer.CHUNK_SIZE)
+            except ConnectionError:
+                data = b""
+            if not data:
+                break
+
+            now = time.perf_counter_ns()
+            self.__replies.feed(data)
+            reply = self.__replies.pop()
+            while reply is not None:
+                self.__dispatch(reply, now)
+                reply = self.__replies.pop()
+
+            # The partial reply left belongs to the next pending command
+            if self.__replies.buffered() > 0 and len(self.__pending) > 0:
+                if self.__pending[0].first_byte == 0:
+                    self.__pending[0].first_byte = now
+
+        # In case of communication error
+        self._warn("Robot disconnected!")
+        self.__client_lost()
+
+    def __dispatch(self, reply: str, received: int) -> None:
+        # Steadiness events are pushed by the robot, not replies to a command
+        if reply.startswith(AsyncRobotProxy.STEADY_EVENT):
+            # The client numbers the moves it ran, not the refused ones
+            move_id = int(reply[len(AsyncRobotProxy.STEADY_EVENT) :])
+            self.__on_steady(move_id + self.__refused_moves)
+            return
+
+        # Loop time, like the stamps of the state stream
+        self.__last_reply = asyncio.get_running_loop().time()
+        if len(self.__pending) == 0:
+            self._warn("Dropping unexpected reply '%s'", reply)
+            return
+
+        cmd = self.__pending.popleft()
+        self.__record(cmd, received)
+        if self.journal is not None:
+            self.journal.reply(reply, (received - cmd.sent) / 1e9)
+        success = cmd.resp is not None and reply.startswith(cmd.resp)
+        if success and cmd.move_id != 0:
+            self.__last_move = cmd.msg
+        elif cmd.move_id != 0:
+            self.__move_refused(cmd.move_id)
+        future = cmd.future
+        if future.done():
+            return
+        if cmd.resp is None:
+            future.set_result(reply)
+            return
+
+        if not success:
+            self._error("Robot server problem for cmd: %s -> %s", cmd.msg, reply)
+        future.set_result(success)
+
+    def __record(self, cmd: _PendingCommand, received: int) -> None:
+        opcode = cmd.msg[:3]
+        latency = self.__latency.get(opcode)
+        if latency is None:
+            latency = self.__latency[opcode] = CommandLatency()
+        first_byte = cmd.first_byte if cmd.first_byte != 0 else received
+        latency.first_byte.record(first_byte - cmd.sent)
+        latency.complete.record(received - cmd.sent)
+
+    def __fail_pending(self) -> None:
+        while len(self.__pending) > 0:
+            cmd = self.__pending.popleft()
+            if not cmd.future.done():
+                cmd.future.set_result(None if cmd.resp is None else False)
+
+    def latency(self, opcode: str) -> CommandLatency | None:
+        """
+        Return the latency histograms of a command (e.g. "mvl"), None if it was
+        never answered.
+        """
+        return self.__latency.get(opcode)
+
+    def latency_stats(self) -> dict[str, dict]:
+        """
+        Return the count, mean, p50/p95/p99 and max latency (ms) of every command,
+        to the first byte and to the complete reply, by opcode.
+        """
+        return {opcode: l.summary() for opcode, l in self.__latency.items()}
+
+    def __dump_latency(self) -> None:
+        for opcode, stats in sorted(self.latency_stats().items()):
+            c, f = stats["complete"], stats["first_byte"]
+            self._info(
+                "%s: n=%s p50=%.2f p95=%.2f p99=%.2f max=%.2f ms "
+                "(first byte p50=%.2f ms)",
+                opcode,
+                c["count"],
+                c["p50"],
+                c["p95"],
+                c["p99"],
+                c["max"],
+                f["p50"],
+            )
+
+    def submit(self, msg: str, resp: str | None = None) -> asyncio.Future:
+        """
+        Send a message to the client without waiting for its response (pipelined mode).
+        Return a future resolved with the response string (None if there is a problem
+        with the client), or, when resp is given, with whether the response starts with it.
+        Responses are matched to commands in FIFO order.
+        """
+        self._debug("Sending cmd '%s'", msg)
+        cmd = _PendingCommand(msg, resp, asyncio.get_running_loop().create_future())
+        if self.__recovery not in (None, asyncio.current_task()):
+            # Sent once the lost commands are recovered
+            self.__unsent.append(cmd)
+        elif self.__writer == None or not self.__connected:
+            if self.__writer == None:
+                self._warn("Trying to send message when client not connected!")
+            cmd.future.set_result(None if resp is None else False)
+        else:
+            self.__write(cmd)
+        return cmd.future
+
+    def __write(self, cmd: _PendingCommand) -> None:
+        try:
+            data = self.__replies.encode(cmd.msg)
+        except ValueError as e:
+            self._error("Cannot send cmd '%s': %s", cmd.msg, e)
+            cmd.future.set_result(None if cmd.resp is None else False)
+            return
+
+        self.__writer.write(data)
+        if cmd.msg[:3] in AsyncRobotProxy.MOVES:
+            self.__move_id += 1
+            cmd.move_id = self.__move_id
+        cmd.sent = time.perf_counter_ns()
+        cmd.first_byte = 0
+        self.__pending.append(cmd)
+        if self.journal is not None:
+            self.journal.command(cmd.msg)
+
+    async def send(self, msg: str) -> str | None:
+        """
+        Send a message to the client (if client connected).
+        Return the response string, or None if there is a problem with the client.
+        """
+        return await self.submit(msg)
+
+    async def collect(self) -> bool:
+        """
+        Wait for the responses of every pipelined command.
+        Returns whether all of them were executed successfully or not.
+        """
+        commands = list(self.__pending) + self.__lost + self.__unsent
+        futures = [cmd.future for cmd in commands]
+        if len(futures) == 0:
+            return True
+        results = await asyncio.gather(*futures)
+        return all(r is not None and r is not False for r in results)
+
+    def batch(self) -> "AsyncCommandBatch":
+        """
+        Create a batch of pipelined commands for this proxy.
+        """
+        return AsyncCommandBatch(self)
+
+    async def close_connection(self) -> None:
+        """
+        Close the connection with the current client.
+        """
+        if self.__recovery is not None:
+            self.__recovery.cancel()
+            self.__recovery = None
+            for cmd in self.__lost + self.__unsent:
+                if not cmd.future.done():
+                    cmd.future.set_result(None if cmd.resp is None else False)
+            self.__lost, self.__unsent = [], []
+        self.__fail_steady()
+        if self.__writer == None:
+            return
+        self._info("Closing client connection")
+        # The robot program closes the connection after the stop reply
+        self.__closing = True
+        result = await self.send(RobotCommands.STOP)
+
+        # Check if result is right:
+        if result is not None and not result.startswith(RobotCommands.STOP_RESP):
+            self._error("Robot server problem when stopping: %s", result)
+
+        # The reader may already have seen the connection closed
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+        self.__connected = False
+        if self.__reader_task is not None:
+            self.__reader_task.cancel()
+            self.__reader_task = None
+        self.__fail_pending()
+        self.__replies.clear()
+        self.__dump_latency()
+
+    async def close_socket(self) -> None:
+        """
+        Close the socket server.
+        """
+        await self.close_connection()
+        if self.__server == None:
+            return
+        self._info("Closing socket")
+        self.__server.close()
+        await self.__server.wait_closed()
+        self.__server = None
+
+    async def __streamed_state(self):
+        """
+        Return the latest streamed robot state if it can replace a state request:
+        fresh, and no pending command which could still move the robot.
+        """
+        if self.state_stream is None or len(self.__pending) > 0:
+            return None
+        if not self.state_stream.is_fresh():
+            return None
+        sample = self.state_stream.latest()
+        if sample is not None and sample.stamp < self.__last_reply:
+            # Sampled before the last acknowledged command ended
+            sample = await self.state_stream.next_sample()
+        return sample
+
+    # =========================================================================
+    # Robotech specialized functions
+    # =========================================================================
+
+    async def get_joint_state(
+        self, degrees: bool = RobotCommands.DEGREES_BY_DEFAULT
+    ) -> JointState | None:
+        """
+        Fetch the actual joint state of the robot and return it as a JointState object.
+        Return None in case of communication error.
+
+        Sends:    gjp;
+        Receive:  gjp,q1,q2,q3,q4,q5,q6;
+        (read from the state stream instead when fresh)
+        """
+        sample = await self.__streamed_state()
+        if sample is not None:
+            return sample.joints.in_deg() if degrees else sample.joints
+
+        result = await self.send(RobotCommands.GET_JOINT_POS)
+        return self._parse_joint_state(result, degrees)
+
+    async def get_tcp_pose(
+        self, degrees: bool = RobotCommands.DEGREES_BY_DEFAULT
+    ) -> Pose | None:
+        """
+        Fetch the actual TCP pose of the robot and return it as a Pose object.
+        Return None in case of communication error.
+
+        Sends:    gtp;
+        Receive:  gtp,x,y,z,rx,ry,rz;
+        (read from the state stream instead when fresh)
+        """
+        sample = await self.__streamed_state()
+        if sample is not None:
+            return sample.tcp.in_deg() if degrees else sample.tcp
+
+        result = await self.send(RobotCommands.GET_TCP_POS)
+        return self._parse_tcp_pose(result, degrees)
+
+    async def movej(self, joints: JointState) -> bool:
+        """
+        Launch a straight move in joint space.
+        Returns whether the command was executed successfully or not.
+
+        Sends:    mvj,q1,q2,q3,q4,q5,q6;
+        Receives: mvjok;
+        """
+        cmd = RobotCommands.movej_cmd(joints)
+        return await self.submit(cmd, RobotCommands.MOVE_J_RESP)
+
+    async def movel(self, pose: Pose) -> bool:
+        """
+        Launch a straight move in world space.
+        Returns whether the command was executed successfully or not.
+
+        Sends:    mvl,x,y,z,rx,ry,rz;
+        Receives: mvlok;
+        """
+        cmd = RobotCommands.movel_cmd(pose)
+        return await self.submit(cmd, RobotCommands.MOVE_L_RESP)
+
+    async def movel_path(self, poses: list[Pose], blends: list[float]) -> bool:
+        """
+        Launch a path of straight moves in world space, blending each waypoint with
+        the next one within its blend radius (0 to stop on it). The robot stops on
+        the last waypoint whatever its radius.
+        Returns whether the command was executed successfully or not.
+
+        Sends:    mvp,n,x1,y1,z1,rx1,ry1,rz1,r1,...,xn,yn,zn,rxn,ryn,rzn,rn;
+        Receives: mvpok;
+        """
+        cmd = RobotCommands.movel_path_cmd(poses, blends)
+        return await self.submit(cmd, RobotCommands.MOVE_PATH_RESP)
+
+    async def run_macro(self, name: str, params: list[Pose | float]) -> bool:
+        """
+        Run a step macro on the robot, a whole step sent as one command:
+        - pck (pose, dz, blend, exit pose): pick at pose from the approach pose dz
+          above it, then leave through the approach pose to the exit pose
+        - plc (pose, dz, blend): place at pose from the approach pose dz above it,
+          and go back to the approach pose
+        The approach pose is passed through within the blend radius.
+        Returns whether the macro was executed successfully or not.
+
+        Sends:    mcr,<name>,<values>;
+        Receives: mcrok;
+        """
+        cmd = RobotCommands.macro_cmd(name, params)
+        return await self.submit(cmd, RobotCommands.MACRO_RESP)
+
+    async def open_gripper(self) -> bool:
+        """
+        Open the gripper.
+        Returns whether the command was executed successfully or not.
+
+        Sends:    gop;
+        Receives: gop;
+        """
+        return await self.submit(RobotCommands.OPEN_GRIPPER, RobotCommands.OPEN_GRIPPER)
+
+    async def close_gripper(self) -> bool:
+        """
+        Close the gripper.
+        Returns whether the command was executed successfully or not.
+
+        Sends:    gcl;
+        Receives: gcl;
+        """
+        return await self.submit(
+            RobotCommands.CLOSE_GRIPPER, RobotCommands.CLOSE_GRIPPER
+        )
+
+    async def wait_steady(self) -> bool:
+        """
+        Wait until the robot is steady.
+        Returns whether the command is successful (True = success, False = error)
+
+        Sends:    std;
+        Receives: std;
+        (waits for the steadiness event of the last move instead when negotiated,
+        or reads the state stream when fresh)
+        """
+        if self.__events:
+            return await self.steady()
+
+        if self.state_stream is not None and self.state_stream.is_fresh():
+            # The robot is steady once the pending moves are done and it settled
+            await self.collect()
+            steady = await self.state_stream.wait_steady()
+            if steady is not None:
+                return steady
+            self._warn("State stream lost, asking the robot")
+
+        return await self.submit(RobotCommands.WAIT_STEADY, RobotCommands.WAIT_STEADY)
+
+
+class BatchCommands:
+    """
+    Common part of the pipelined command batches.
+    Every command is sent as soon as it is queued, so that the robot always has its
+    next command buffered, and returns a future resolved with whether it succeeded.
+    """
+
+    def __init__(self, proxy) -> None:
+        self._proxy = proxy
+        self._futures: list[Awaitable] = []
+
+    def _submit(self, msg: str, resp: str):
+        future = self._proxy.submit(msg, resp)
+        self._futures.append(future)
+        return future
+
+    def movej(self, joints: JointState):
+        """
+        Queue a straight move in joint space (mvj -> mvjok).
+        """
+        return self._submit(RobotCommands.movej_cmd(joints), RobotCommands.MOVE_J_RESP)
+
+    def movel(self, pose: Pose):
+        """
+        Queue a straight move in world space (mvl -> mvlok).
+        """
+        return self._submit(RobotCommands.movel_cmd(pose), RobotCommands.MOVE_L_RESP)
+
+    def movel_path(self, poses: list[Pose], blends: list[float]):
+        """
+        Queue a blended path of straight moves in world space (mvp -> mvpok).
+        """
+        return self._submit(
+            RobotCommands.movel_path_cmd(poses, blends), RobotCommands.MOVE_PATH_RESP
+        )
+
+    def run_macro(self, name: str, params: list[Pose | float]):
+        """
+        Queue a step macro (mcr -> mcrok).
+        """
+        return self._submit(
+            RobotCommands.macro_cmd(name, params), RobotCommands.MACRO_RESP
+        )
+
+    def open_gripper(self):
+        """
+        Queue the gripper opening (gop -> gop).
+        """
+        return self._submit(RobotCommands.OPEN_GRIPPER, RobotCommands.OPEN_GRIPPER)
+
+    def close_gripper(self):
+        """
+        Queue the gripper closing (gcl -> gcl).
+        """
+        return self._submit(RobotCommands.CLOSE_GRIPPER, RobotCommands.CLOSE_GRIPPER)
+
+    def wait_steady(self):
+        """
+        Queue a wait until the robot is steady (std -> std).
+        """
+        return self._submit(RobotCommands.WAIT_STEADY, RobotCommands.WAIT_STEADY)
+
+
+class AsyncCommandBatch(BatchCommands):
+    """
+    Batch of pipelined robot commands for the asynchronous proxy.
+
+    Usage:
+        batch = proxy.batch()
+        batch.movel(approach)
+        batch.movel(target)
+        batch.wait_steady()
+        batch.close_gripper()
+        success = await batch.wait()
+    """
+
+    def steady(self):
+        """
+        Wait in the batch until the robot is steady after the last queued move,
+        without holding the next commands back (see AsyncRobotProxy.steady).
+        """
+        future = self._proxy.steady()
+        self._futures.append(future)
+        return future
+
+    async def wait(self) -> bool:
+        """
+        Wait for every queued command to be acknowledged.
+        Returns whether all the commands of the batch were executed successfully.
+        """
+        results = await asyncio.gather(*self._futures)
+        return all(results)
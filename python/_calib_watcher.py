@@ -0,0 +1,107 @@
+import asyncio
+import os
+
+from _calibration import CalibrationData
+from _custom_logger import LoggingInterface
+
+
+class CalibrationWatcher(LoggingInterface):
+    """
+    Watcher of a calibration file, validating its new versions in the background.
+
+    The file is polled every period: its stat (modification time, size, inode) is
+    cheap to read and only a changed file is loaded, with CalibrationData.load in
+    an executor thread. A valid version differing from the current calibration
+    waits until the sequencer takes it (see take), between two cartridges. An
+    invalid version is reported once and the current calibration is kept, until
+    the file changes again.
+
+    Editors saving the file in several writes may expose a partial file for a
+    moment, its version is reported invalid and superseded by the next poll.
+    """
+
+    PREFIX = r"CalibWatcher"
+
+    # Polling period (s)
+    POLL_PERIOD = 1.0
+
+    def __init__(
+        self,
+        path: str,
+        current: CalibrationData,
+        period: float = POLL_PERIOD,
+        prefix: str = PREFIX,
+    ) -> None:
+        super().__init__(prefix)
+        self.path = path
+        self.period = period
+        self.__current = current
+        self.__pending: CalibrationData | None = None
+        self.__stamp = self.__stat()
+        self.__task: asyncio.Task | None = None
+        self.n_reloads = 0
+
+    def start(self) -> None:
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__watch())
+
+    async def stop(self) -> None:
+        if self.__task is None:
+            return
+        self.__task.cancel()
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
+        self.__task = None
+
+    def take(self) -> CalibrationData | None:
+        """
+        Get the validated new calibration, if any, which becomes the current one.
+        """
+        calib = self.__pending
+        if calib is not None:
+            self.__pending = None
+            self.__current = calib
+            self.n_reloads += 1
+        return calib
+
+    def __stat(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    async def __watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.period)
+            await self.check()
+
+    async def check(self) -> bool:
+        """
+        Load the file if it changed since the last check. Return whether a new
+        calibration is waiting to be taken.
+        """
+        stamp = self.__stat()
+        # Missing file (e.g. while an editor replaces it): keep the current one
+        if stamp is None or stamp == self.__stamp:
+            return self.__pending is not None
+        self.__stamp = stamp
+
+        loop = asyncio.get_running_loop()
+        try:
+            calib = await loop.run_in_executor(None, CalibrationData.load, self.path)
+        except (OSError, ValueError) as e:
+            self._error(
+                "Invalid calibration %s, kept the current one: %s", self.path, e
+            )
+            return self.__pending is not None
+
+        if calib == self.__current:
+            # Back to the current calibration (or the file was only touched)
+            self.__pending = None
+        elif calib != self.__pending:
+            self._info("New calibration %s, applied after this cartridge", self.path)
+            self.__pending = calib
+        return self.__pending is not None
@@ -1,14 +1,68 @@
-from dataclasses import dataclass
-import yaml
+from dataclasses import dataclass, field
+import hashlib
+import math
 import os
+import struct
+
+import yaml
+
+try:
+    # libyaml bindings, several times faster than the pure Python loader
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 from _custom_types import Vec3, JointState
 from _custom_logger import LoggingInterface
 
 DEFAULT_DZ_APPROACH = 0.05
 
+# Validation limits: UR3e reach from the base (m), approach height (m), joint
+# range (deg)
+MAX_REACH = 0.5
+MAX_DZ_APPROACH = 0.3
+MAX_JOINT_DEG = 360.0
+# Cells of a bin: the checkpoint stores cell counts and indices on 16 signed bits
+# (the cache stores the rows and columns on 16 bits)
+MAX_CELLS = 0x7FFF
+
+# YAML bin section -> CalibrationData field
+BIN_SECTIONS = {"input": "input_bin", "good": "good_bin", "bad": "defect_bin"}
+BIN_KEYS = {"origin", "drow", "dcol", "nrow", "ncol", "app_dz", "rot"}
+# Keys of a bin that may be left out
+BIN_OPTIONAL_KEYS = {"app_dz", "rot"}
+CHECKING_KEYS = {"checking_approach", "qr_checking", "defect_checking"}
+
+# Header of the saved calibration files
+YAML_HEADER = """\
+# Bins: origin of the first cell and approach height (m), pitch between rows
+# (along x) and columns (along y) (m), rotation of the grid around z (deg).
+# Checking poses: approach position (m), joint positions (deg)
+"""
+# Saved precision: tenth of millimeter (m), hundredth of degree (deg)
+SAVED_DIGITS_M = 4
+SAVED_DIGITS_DEG = 2
+
+# Sidecar cache of the validated calibration, next to the YAML file
+CACHE_SUFFIX = ".cache"
+CACHE_HEAD = struct.Struct("<4sB32s")
+CACHE_MAGIC = b"RTCC"
+CACHE_VERSION = 2
+# Per bin: origin, dz, drow, dcol, rot, nrow, ncol. Then the checking approach,
+# and the two checking joint states with their unit
+CACHE_BODY = struct.Struct("<" + "7dHH" * 3 + "3d" + "6d?" * 2)
 
-@dataclass
+
+def _overlap(a0: float, a1: float, b0: float, b1: float) -> bool:
+    """
+    Whether two intervals overlap, touching ones do not unless one is a point.
+    """
+    if a0 == a1 or b0 == b1:
+        return max(a0, b0) <= min(a1, b1)
+    return max(a0, b0) < min(a1, b1)
+
+
+@dataclass(frozen=True, slots=True)
 class BinCalibration:
     origin: Vec3
     dz: float = DEFAULT_DZ_APPROACH
@@ -19,29 +73,344 @@ class BinCalibration:
     nrow: int = 1
     ncol: int = 1
 
+    # Rotation of the grid around z (rad): rows go along x and columns along y
+    # once rotated
+    rot: float = 0.0
+
+    def cell(self, row: float, col: float) -> tuple[float, float]:
+        """
+        Position (x, y) of the center of a cell.
+        """
+        u, v = row * self.drow, col * self.dcol
+        c, s = math.cos(self.rot), math.sin(self.rot)
+        return self.origin.x + c * u - s * v, self.origin.y + s * u + c * v
+
+    def footprint(self) -> tuple[float, float, float, float]:
+        """
+        Area of the bin on the table (x min, x max, y min, y max): its cell
+        centers, with half a pitch around them.
+        """
+        rows = (-0.5, self.nrow - 0.5) if self.drow != 0 else (0,)
+        cols = (-0.5, self.ncol - 0.5) if self.dcol != 0 else (0,)
+        corners = [self.cell(row, col) for row in rows for col in cols]
+        x = [c[0] for c in corners]
+        y = [c[1] for c in corners]
+        return min(x), max(x), min(y), max(y)
+
+    def problems(self, name: str) -> list[str]:
+        """
+        Out of range values of the bin, empty if it is valid.
+        """
+        problems = []
+        if self.nrow < 1 or self.ncol < 1:
+            problems.append(f"{name}: needs at least one row and one column")
+        if self.nrow * self.ncol > MAX_CELLS:
+            problems.append(f"{name}: more than {MAX_CELLS} cells")
+        if not 0 < self.dz <= MAX_DZ_APPROACH:
+            problems.append(f"{name}: app_dz must be in ]0, {MAX_DZ_APPROACH}] m")
+        if self.nrow > 1 and self.drow == 0 or self.ncol > 1 and self.dcol == 0:
+            problems.append(f"{name}: cells on top of each other (null pitch)")
 
-@dataclass
+        # Farthest approach poses: the corner cells
+        x0, x1, y0, y1 = self.footprint()
+        z = self.origin.z + self.dz
+        for x in (x0, x1):
+            for y in (y0, y1):
+                if math.dist((x, y, z), (0, 0, 0)) > MAX_REACH:
+                    problems.append(f"{name}: out of the robot reach ({MAX_REACH} m)")
+                    return problems
+        return problems
+
+
+@dataclass(frozen=True, slots=True)
 class CalibrationData:
-    input_bin: BinCalibration = BinCalibration(Vec3(0, 0, 0))
-    good_bin: BinCalibration = BinCalibration(Vec3(0, 0, 0))
-    defect_bin: BinCalibration = BinCalibration(Vec3(0, 0, 0))
+    input_bin: BinCalibration = field(
+        default_factory=lambda: BinCalibration(Vec3(0, 0, 0))
+    )
+    good_bin: BinCalibration = field(
+        default_factory=lambda: BinCalibration(Vec3(0, 0, 0))
+    )
+    defect_bin: BinCalibration = field(
+        default_factory=lambda: BinCalibration(Vec3(0, 0, 0))
+    )
+
+    checking_approach: Vec3 = field(default_factory=lambda: Vec3(0, 0, 0))
+    qr_checking: JointState = field(
+        default_factory=lambda: JointState(0, 0, 0, 0, 0, 0)
+    )
+    defect_checking: JointState = field(
+        default_factory=lambda: JointState(0, 0, 0, 0, 0, 0)
+    )
+
+    def problems(self) -> list[str]:
+        """
+        Out of range values and overlapping bins, empty if the calibration is valid.
+        """
+        problems = []
+        bins = [(name, getattr(self, f)) for name, f in BIN_SECTIONS.items()]
+        for name, bin in bins:
+            problems += bin.problems(name)
+
+        for i, (name, bin) in enumerate(bins):
+            for other_name, other in bins[i + 1 :]:
+                ax0, ax1, ay0, ay1 = bin.footprint()
+                bx0, bx1, by0, by1 = other.footprint()
+                if _overlap(ax0, ax1, bx0, bx1) and _overlap(ay0, ay1, by0, by1):
+                    problems.append(f"{name} and {other_name} bins overlap")
+
+        p = self.checking_approach
+        if math.dist((p.x, p.y, p.z), (0, 0, 0)) > MAX_REACH:
+            problems.append(
+                f"checking_approach: out of the robot reach ({MAX_REACH} m)"
+            )
+        for name in ("qr_checking", "defect_checking"):
+            joints = getattr(self, name).in_deg()
+            values = (
+                joints.base,
+                joints.shoulder,
+                joints.elbow,
+                joints.wrist1,
+                joints.wrist2,
+                joints.wrist3,
+            )
+            if any(abs(q) > MAX_JOINT_DEG for q in values):
+                problems.append(f"{name}: joints out of +/-{MAX_JOINT_DEG} deg")
+        return problems
+
+    @staticmethod
+    def from_dict(data) -> "CalibrationData":
+        """
+        Build the calibration from the parsed YAML document:
+
+        calibration:
+          input: {origin: [x, y, z], drow, dcol, nrow, ncol, app_dz}   (m)
+                 rot                                                   (deg)
+          good: ...
+          bad: ...
+          checking_approach: [x, y, z]                                (m)
+          qr_checking: [q1, q2, q3, q4, q5, q6]                       (deg)
+          defect_checking: [q1, q2, q3, q4, q5, q6]                   (deg)
+
+        The checking poses, app_dz and rot are optional. Raise a ValueError listing
+        every problem if the document is malformed or the calibration is not valid.
+        """
+        calib = data.get("calibration") if isinstance(data, dict) else None
+        if not isinstance(calib, dict):
+            raise ValueError("No 'calibration' section")
+
+        problems = []
+        for key in calib.keys() - BIN_SECTIONS.keys() - CHECKING_KEYS:
+            problems.append(f"Unknown key '{key}'")
+
+        fields = {}
+        for section, name in BIN_SECTIONS.items():
+            try:
+                fields[name] = CalibrationData.__parse_bin(calib.get(section), section)
+            except ValueError as e:
+                problems.append(str(e))
+        try:
+            if "checking_approach" in calib:
+                x, y, z = CalibrationData.__numbers(
+                    calib["checking_approach"], 3, "checking_approach"
+                )
+                fields["checking_approach"] = Vec3(x, y, z)
+            for name in ("qr_checking", "defect_checking"):
+                if name in calib:
+                    joints = CalibrationData.__numbers(calib[name], 6, name)
+                    fields[name] = JointState(*joints, True)
+        except ValueError as e:
+            problems.append(str(e))
 
-    checking_approach: Vec3 = Vec3(0, 0, 0)
-    qr_checking: JointState = JointState(0, 0, 0, 0, 0, 0)
-    defect_checking: JointState = JointState(0, 0, 0, 0, 0, 0)
+        if len(problems) == 0:
+            result = CalibrationData(**fields)
+            problems = result.problems()
+        if len(problems) > 0:
+            raise ValueError("; ".join(problems))
+        return result
+
+    @staticmethod
+    def __numbers(value, n: int, name: str) -> list[float]:
+        if not isinstance(value, list) or len(value) != n:
+            raise ValueError(f"{name}: expected a list of {n} numbers")
+        if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in value):
+            raise ValueError(f"{name}: expected a list of {n} numbers")
+        return [float(v) for v in value]
+
+    @staticmethod
+    def __parse_bin(section, name: str) -> BinCalibration:
+        if not isinstance(section, dict):
+            raise ValueError(f"Missing '{name}' bin")
+        unknown = section.keys() - BIN_KEYS
+        if len(unknown) > 0:
+            raise ValueError(f"{name}: unknown keys {sorted(unknown)}")
+        missing = BIN_KEYS - section.keys() - BIN_OPTIONAL_KEYS
+        if len(missing) > 0:
+            raise ValueError(f"{name}: missing keys {sorted(missing)}")
+
+        x, y, z = CalibrationData.__numbers(section["origin"], 3, f"{name}.origin")
+        dz = section.get("app_dz", DEFAULT_DZ_APPROACH)
+        rot = section.get("rot", 0.0)
+        drow, dcol, dz, rot = CalibrationData.__numbers(
+            [section["drow"], section["dcol"], dz, rot],
+            4,
+            f"{name} drow, dcol, app_dz, rot",
+        )
+        nrow, ncol = section["nrow"], section["ncol"]
+        if any(isinstance(v, bool) or not isinstance(v, int) for v in (nrow, ncol)):
+            raise ValueError(f"{name}: nrow and ncol must be integers")
+        return BinCalibration(
+            Vec3(x, y, z), dz, drow, dcol, nrow, ncol, math.radians(rot)
+        )
+
+    # =========================================================================
+    # Saving
+    # =========================================================================
+
+    def to_dict(self) -> dict:
+        """
+        YAML document of the calibration (see from_dict).
+        """
+
+        def m(*values: float) -> list[float]:
+            return [round(v, SAVED_DIGITS_M) for v in values]
+
+        def deg(*values: float) -> list[float]:
+            return [round(v, SAVED_DIGITS_DEG) for v in values]
+
+        calib = {}
+        for section, name in BIN_SECTIONS.items():
+            b = getattr(self, name)
+            calib[section] = {
+                "origin": m(b.origin.x, b.origin.y, b.origin.z),
+                "drow": m(b.drow)[0],
+                "dcol": m(b.dcol)[0],
+                "nrow": b.nrow,
+                "ncol": b.ncol,
+                "app_dz": m(b.dz)[0],
+                "rot": deg(math.degrees(b.rot))[0],
+            }
+        p = self.checking_approach
+        calib["checking_approach"] = m(p.x, p.y, p.z)
+        for name in ("qr_checking", "defect_checking"):
+            j = getattr(self, name).in_deg()
+            calib[name] = deg(j.base, j.shoulder, j.elbow, j.wrist1, j.wrist2, j.wrist3)
+        return {"calibration": calib}
+
+    def save(self, path: str) -> None:
+        """
+        Write the calibration file (write and rename, a reader never sees a partial
+        file). Raise an OSError if it cannot be written.
+        """
+        text = YAML_HEADER + yaml.safe_dump(
+            self.to_dict(), default_flow_style=None, sort_keys=False
+        )
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    # =========================================================================
+    # Loading
+    # =========================================================================
+
+    @staticmethod
+    def load(path: str, use_cache: bool = True) -> "CalibrationData":
+        """
+        Load and validate a calibration file. The validated calibration is cached
+        in a sidecar file (path + CACHE_SUFFIX) keyed by the SHA-256 of the YAML
+        file, the YAML is only parsed again once the file changed.
+        Raise an OSError if the file cannot be read, a ValueError (yaml.YAMLError
+        included) if it is not a valid calibration.
+        """
+        with open(path, "rb") as f:
+            text = f.read()
+        digest = hashlib.sha256(text).digest()
+
+        cache = path + CACHE_SUFFIX
+        if use_cache:
+            calib = CalibrationData.__read_cache(cache, digest)
+            if calib is not None:
+                return calib
+
+        try:
+            data = yaml.load(text, Loader=SafeLoader)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML error: {e}") from e
+        calib = CalibrationData.from_dict(data)
+
+        if use_cache:
+            CalibrationData.__write_cache(cache, digest, calib)
+        return calib
 
     @staticmethod
     def load_from_file(f: str) -> "CalibrationData":
+        """
+        Load a calibration file, falling back to the default calibration (and
+        logging why) if it is missing or not valid.
+        """
         # Check if file exist
-        if os.path.exists(f):
-            with open(f, "r") as calib_file:
-                try:
-                    data = yaml.safe_load(calib_file)
-                    print(data)
-                    return CalibrationData()
-                except yaml.YAMLError as e:
-                    LoggingInterface.serror("YAML Error when loading calib files")
-                    return CalibrationData()
-        else:
+        if not os.path.exists(f):
             LoggingInterface.swarn("Given calib file doesn't exist")
             return CalibrationData()
+        try:
+            return CalibrationData.load(f)
+        except (OSError, ValueError) as e:
+            LoggingInterface.serror("Invalid calib file %s: %s", f, e)
+            return CalibrationData()
+
+    def __pack(self) -> bytes:
+        values = []
+        for name in BIN_SECTIONS.values():
+            b = getattr(self, name)
+            o = b.origin
+            values += [o.x, o.y, o.z, b.dz, b.drow, b.dcol, b.rot, b.nrow, b.ncol]
+        p = self.checking_approach
+        values += [p.x, p.y, p.z]
+        for j in (self.qr_checking, self.defect_checking):
+            values += [j.base, j.shoulder, j.elbow, j.wrist1, j.wrist2, j.wrist3, j.deg]
+        return CACHE_BODY.pack(*values)
+
+    @staticmethod
+    def __unpack(body: bytes) -> "CalibrationData":
+        values = CACHE_BODY.unpack(body)
+        bins = []
+        for i in range(0, 27, 9):
+            x, y, z, dz, drow, dcol, rot, nrow, ncol = values[i : i + 9]
+            bins.append(
+                BinCalibration(Vec3(x, y, z), dz, drow, dcol, nrow, ncol, rot)
+            )
+        return CalibrationData(
+            *bins,
+            Vec3(*values[27:30]),
+            JointState(*values[30:37]),
+            JointState(*values[37:44]),
+        )
+
+    @staticmethod
+    def __read_cache(path: str, digest: bytes) -> "CalibrationData | None":
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != CACHE_HEAD.size + CACHE_BODY.size:
+            return None
+        magic, version, key = CACHE_HEAD.unpack_from(data)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or key != digest:
+            return None
+        return CalibrationData.__unpack(data[CACHE_HEAD.size :])
+
+    @staticmethod
+    def __write_cache(path: str, digest: bytes, calib: "CalibrationData") -> None:
+        """
+        Write the cache (write and rename), skipped if the directory is read-only.
+        """
+        tmp = path + ".tmp"
+        try:
+            body = calib.__pack()
+            with open(tmp, "wb") as f:
+                f.write(CACHE_HEAD.pack(CACHE_MAGIC, CACHE_VERSION, digest))
+                f.write(body)
+            os.replace(tmp, path)
+        except (OSError, struct.error) as e:
+            LoggingInterface.swarn("Cannot write the calibration cache %s: %s", path, e)
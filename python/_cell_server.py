@@ -0,0 +1,113 @@
+import asyncio
+
+from _async_robot_proxy import AsyncRobotProxy, RobotCommands
+from _custom_logger import LoggingInterface
+
+
+class CellServer(LoggingInterface):
+    """
+    Command server shared by several robot cells.
+
+    Every robot program connects to the same listening socket and identifies its
+    cell first:
+
+    Receives: cell,<id>;
+    Sends:    cellok; (ukn; and the connection is closed if the cell is unknown)
+
+    The connection is then handed over to the proxy of the cell, each cell being
+    driven by its own sequencer on the same event loop. A robot program not
+    sending the handshake within HANDSHAKE_TIMEOUT is only accepted when the
+    server has a single cell.
+    """
+
+    PREFIX = r"CellServer"
+
+    HANDSHAKE_TIMEOUT = 2.0
+
+    def __init__(self, srv_ip: str, srv_port: int) -> None:
+        super().__init__(CellServer.PREFIX)
+        self.__binding_ip = (srv_ip, srv_port)
+        self.__server: asyncio.Server | None = None
+        self.__handshakes: set[asyncio.Task] = set()
+        self.cells: dict[str, AsyncRobotProxy] = {}
+
+    def add_cell(self, cell_id: str) -> AsyncRobotProxy:
+        """
+        Create the robot proxy of a cell.
+        """
+        if RobotCommands.PARAM_SEP in cell_id or RobotCommands.LINE_END in cell_id:
+            raise ValueError(f"Invalid cell id '{cell_id}'")
+        proxy = AsyncRobotProxy(
+            *self.__binding_ip, prefix=f"Robot {cell_id}", shared_server=True
+        )
+        self.cells[cell_id] = proxy
+        return proxy
+
+    async def open_socket(self) -> None:
+        self.__server = await asyncio.start_server(
+            self.__on_client, *self.__binding_ip
+        )
+        self._info("Serving %s cells on port %s", len(self.cells), self.__binding_ip[1])
+
+    def __on_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.create_task(self.__handshake(reader, writer))
+        self.__handshakes.add(task)
+        task.add_done_callback(self.__handshakes.discard)
+
+    async def __handshake(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        sep = RobotCommands.LINE_END.encode()
+        try:
+            data = await asyncio.wait_for(
+                reader.readuntil(sep), CellServer.HANDSHAKE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # Robot program without the handshake, waiting for commands
+            if len(self.cells) == 1:
+                cell_id = next(iter(self.cells))
+                self._warn("No handshake from %s, giving it to cell %s", peer, cell_id)
+                self.cells[cell_id].hand_over(reader, writer)
+            else:
+                self._error("No handshake from %s, closing the connection", peer)
+                writer.close()
+            return
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+        ):
+            writer.close()
+            return
+
+        name, _, cell_id = data[: -len(sep)].decode().strip().partition(
+            RobotCommands.PARAM_SEP
+        )
+        proxy = self.cells.get(cell_id) if name == RobotCommands.CELL else None
+        if proxy is None:
+            self._error("Unknown cell '%s' from %s", data.decode(), peer)
+            writer.write(f"{RobotCommands.UNKNOWN}{RobotCommands.LINE_END}".encode())
+            writer.close()
+            return
+
+        self._info("Cell %s connected from %s", cell_id, peer)
+        writer.write(f"{RobotCommands.CELL_RESP}{RobotCommands.LINE_END}".encode())
+        proxy.hand_over(reader, writer)
+
+    async def close_socket(self) -> None:
+        """
+        Close the connections of every cell and the socket server.
+        """
+        for task in list(self.__handshakes):
+            task.cancel()
+        for proxy in self.cells.values():
+            await proxy.close_socket()
+        if self.__server is None:
+            return
+        self._info("Closing socket")
+        self.__server.close()
+        await self.__server.wait_closed()
+        self.__server = None
@@ -0,0 +1,178 @@
+import os
+import struct
+import time
+import zlib
+
+from _custom_logger import LoggingInterface
+from _state import Step, State
+
+# Steps of the cartridge in the gripper
+IN_HAND_STEPS = (
+    Step.CHECK_QR,
+    Step.CHECK_ANOMALIES,
+    Step.MV_GOOD_BIN,
+    Step.MV_BAD_BIN,
+)
+
+
+class Checkpoint(LoggingInterface):
+    """
+    Sequencer progress saved at every step transition, so that a run can resume
+    where the server process died.
+
+    Each transition appends a record to the file: CRC32 and length of the payload,
+    then the step entered, the input/output cell indices and the cell counts of the
+    three bins (all on 16 signed bits, which hold up to MAX_CELLS of _calibration),
+    then the occupancy bitmaps of the three bins. Whether a cartridge is in the
+    gripper follows from the step. The records are flushed to the OS right away
+    (nothing is lost if only the process dies) and synced to the disk at most every
+    SYNC_PERIOD. Reloading keeps the last record
+    whose CRC is valid, a record torn by a crash is ignored. The file is rewritten
+    with the last record only (write and rename) when a run starts, and once it
+    holds COMPACT_RECORDS records.
+    """
+
+    PREFIX = r"Checkpoint"
+
+    HEAD = struct.Struct("<II")
+    PAYLOAD = struct.Struct("<Bhhhhhh")
+    SYNC_PERIOD = 0.5
+    COMPACT_RECORDS = 1024
+
+    def __init__(self, path: str) -> None:
+        super().__init__(Checkpoint.PREFIX)
+        self.path = path
+        self.__file = None
+        self.__last: bytes | None = None
+        self.__n_records = 0
+        self.__last_sync = 0.0
+
+    @staticmethod
+    def __bitmap(occupancy: list[bool]) -> bytes:
+        bits = bytearray((len(occupancy) + 7) // 8)
+        for i, occupied in enumerate(occupancy):
+            if occupied:
+                bits[i // 8] |= 1 << (i % 8)
+        return bytes(bits)
+
+    @staticmethod
+    def __occupancy(bits: bytes, n: int) -> list[bool]:
+        return [bool(bits[i // 8] & (1 << (i % 8))) for i in range(n)]
+
+    @staticmethod
+    def __encode(state: State) -> bytes:
+        bins = (state.input_taken, state.good_occupied, state.defect_occupied)
+        payload = Checkpoint.PAYLOAD.pack(
+            state.step.value,
+            state.input_idx,
+            state.good_idx,
+            state.defect_idx,
+            *(len(b) for b in bins),
+        )
+        payload += b"".join(Checkpoint.__bitmap(b) for b in bins)
+        return Checkpoint.HEAD.pack(zlib.crc32(payload), len(payload)) + payload
+
+    def __compact(self) -> None:
+        """
+        Replace the file by one holding the last record only.
+        """
+        if self.__file is not None:
+            self.__file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.__last)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.__file = open(self.path, "ab")
+        self.__n_records = 1
+        self.__last_sync = time.monotonic()
+
+    def record(self, state: State) -> None:
+        """
+        Append the progress of the sequencer.
+        """
+        self.__last = Checkpoint.__encode(state)
+        # The file of a previous run is replaced at once, never truncated
+        if self.__file is None:
+            self.__compact()
+            return
+        self.__file.write(self.__last)
+        self.__file.flush()
+        self.__n_records += 1
+
+        if self.__n_records >= Checkpoint.COMPACT_RECORDS:
+            self.__compact()
+        elif time.monotonic() - self.__last_sync >= Checkpoint.SYNC_PERIOD:
+            os.fsync(self.__file.fileno())
+            self.__last_sync = time.monotonic()
+
+    def close(self) -> None:
+        if self.__file is None:
+            return
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__file.close()
+        self.__file = None
+
+    def __read_last(self) -> bytes | None:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        last, offset = None, 0
+        while offset + Checkpoint.HEAD.size <= len(data):
+            crc, length = Checkpoint.HEAD.unpack_from(data, offset)
+            start = offset + Checkpoint.HEAD.size
+            payload = data[start : start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                self._warn("Ignoring a torn record at %s in %s", offset, self.path)
+                break
+            last, offset = payload, start + length
+        return last
+
+    def restore(self, state: State) -> bool:
+        """
+        Load the last saved progress into state, going back to the last step safe
+        to run again: the inspection verdicts are not saved, so a cartridge being
+        inspected is inspected again. Returns False if there is no progress to
+        resume (no checkpoint, finished tray, or a different bin layout).
+        """
+        payload = self.__read_last()
+        if payload is None:
+            return False
+
+        bins = (state.input_taken, state.good_occupied, state.defect_occupied)
+        size = Checkpoint.PAYLOAD.size + sum((len(b) + 7) // 8 for b in bins)
+        if len(payload) != size:
+            self._warn("Checkpoint does not match the calibration, not resuming")
+            return False
+        step, input_idx, good_idx, defect_idx, *sizes = (
+            Checkpoint.PAYLOAD.unpack_from(payload)
+        )
+        if [len(b) for b in bins] != sizes:
+            self._warn("Checkpoint bins do not match the calibration, not resuming")
+            return False
+        step = Step(step)
+        if step in (Step.IDLE, Step.DONE):
+            return False
+
+        offset = Checkpoint.PAYLOAD.size
+        for occupancy, n in zip(bins, sizes):
+            size = (n + 7) // 8
+            occupancy[:] = Checkpoint.__occupancy(payload[offset : offset + size], n)
+            offset += size
+        state.input_idx = input_idx
+        state.good_idx = good_idx
+        state.defect_idx = defect_idx
+        state.step = Step.CHECK_QR if step == Step.CHECK_ANOMALIES else step
+
+        self._info(
+            "Resuming at %s, input cell %s%s",
+            state.step.name,
+            input_idx,
+            " with a cartridge in hand" if step in IN_HAND_STEPS else "",
+        )
+        return True
@@ -1,5 +1,10 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
 from enum import IntEnum
-from datetime import datetime
 from typing import List, Tuple
 
 DEBUG_PREFIX = "[D]"
@@ -40,9 +45,189 @@ class LogLevel(IntEnum):
     ERROR = 6
 
 
+_LEVEL_PREFIXES = {
+    LogLevel.DEBUG: DEBUG_PREFIX,
+    LogLevel.INFO: INFO_PREFIX,
+    LogLevel.WARN: WARN_PREFIX,
+    LogLevel.ERROR: ERROR_PREFIX,
+}
+_PLAIN_PREFIXES = {
+    LogLevel.DEBUG: "[D]",
+    LogLevel.INFO: "[I]",
+    LogLevel.WARN: "[W]",
+    LogLevel.ERROR: "[E]",
+}
+
+
+class _RotatingFile:
+    """
+    Log file rotated once it reaches max_bytes, keeping the given number of backups
+    (path.1 being the newest).
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int) -> None:
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backups = backups
+        self.__file = open(path, "a", encoding="utf-8")
+
+    def write(self, text: str) -> None:
+        if self.__file.tell() + len(text) > self.__max_bytes and self.__file.tell() > 0:
+            self.__rotate()
+        self.__file.write(text)
+        self.__file.flush()
+
+    def __rotate(self) -> None:
+        self.__file.close()
+        for i in range(self.__backups - 1, 0, -1):
+            src = f"{self.__path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.__path}.{i + 1}")
+        if self.__backups > 0:
+            os.replace(self.__path, f"{self.__path}.1")
+        self.__file = open(self.__path, "w", encoding="utf-8")
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class LogWriter:
+    """
+    Background log writer.
+
+    Callers only append a record (level, monotonic timestamp, prefix, message and
+    its arguments) to a bounded ring, the oldest records being dropped if the writer
+    falls behind. A thread formats the records by batches and writes them to the
+    console and/or a rotating file. Warnings and errors wake the writer up, other
+    records are written within FLUSH_PERIOD. The number of dropped records is
+    reported by the next write.
+    """
+
+    CAPACITY = 8192
+    FLUSH_PERIOD = 0.05
+
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self.__records: deque = deque(maxlen=capacity)
+        self.__capacity = capacity
+        self.__wake = threading.Event()
+        self.__thread: threading.Thread | None = None
+        self.__lock = threading.Lock()
+        self.__running = False
+        self.dropped = 0
+        self.__reported_dropped = 0
+
+        self.console = True
+        self.__file: _RotatingFile | None = None
+
+        # Wall clock time of the monotonic clock origin
+        self.__origin = time.time() - time.monotonic_ns() / 1e9
+        self.__second = -1
+        self.__second_str = ""
+
+    def open_file(self, path: str, max_bytes: int, backups: int) -> None:
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+            self.__file = _RotatingFile(path, max_bytes, backups)
+
+    def push(self, record: tuple) -> None:
+        if len(self.__records) == self.__capacity:
+            self.dropped += 1
+        self.__records.append(record)
+        if self.__thread is None:
+            self.__start()
+        if record[0] >= LogLevel.WARN:
+            self.__wake.set()
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__running = True
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+            atexit.register(self.stop)
+
+    def __run(self) -> None:
+        while self.__running:
+            self.__wake.wait(LogWriter.FLUSH_PERIOD)
+            self.__wake.clear()
+            self.flush()
+
+    def stop(self) -> None:
+        """
+        Write the remaining records and stop the writer thread.
+        """
+        self.__running = False
+        self.__wake.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Format and write every record queued so far.
+        """
+        with self.__lock:
+            records = self.__records
+            batch = []
+            while len(records) > 0:
+                batch.append(records.popleft())
+            dropped = self.dropped - self.__reported_dropped
+            if dropped > 0:
+                self.__reported_dropped += dropped
+                # First, the dropped records being older than the kept ones
+                message = f"{dropped} log records dropped, the writer fell behind"
+                now = time.monotonic_ns()
+                batch.insert(0, (LogLevel.WARN, now, "", message, ()))
+            if len(batch) == 0:
+                return
+
+            if self.console:
+                sys.stdout.write("".join(self.__format(r, True) for r in batch))
+                sys.stdout.flush()
+            if self.__file is not None:
+                self.__file.write("".join(self.__format(r, False) for r in batch))
+
+    def __timestamp(self, ns: int) -> str:
+        second = int(self.__origin + ns / 1e9)
+        if second != self.__second:
+            self.__second = second
+            self.__second_str = time.strftime("%H:%M:%S", time.localtime(second))
+        return self.__second_str
+
+    def __format(self, record: tuple, colored: bool) -> str:
+        lvl, ns, prf, msg, args = record
+        if len(args) > 0:
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f"{msg} {args}"
+        lvl_prf, suffix = _LEVEL_PREFIXES[lvl], SUFFIX
+        if not colored:
+            lvl_prf, suffix = _PLAIN_PREFIXES[lvl], ""
+        return (
+            lvl_prf
+            + f"[{self.__timestamp(ns)}]"
+            + (f"[{prf.center(NAME_WIDTH)}] " if len(prf) > 0 else " ")
+            + msg
+            + suffix
+            + "\n"
+        )
+
+
 class LoggingInterface:
+    """
+    Logging methods of the classes, prefixing their messages with the class prefix.
+
+    Messages may take %-style arguments, which are only formatted (in the writer
+    thread) if the message level is enabled:
+        self._debug("Sending cmd '%s'", msg)
+    """
 
     LOGGING_LVL = LogLevel.INFO
+    WRITER = LogWriter()
 
     def __init__(self, prefix: str) -> None:
         self.__prefix = prefix
@@ -62,55 +247,70 @@ class LoggingInterface:
             case _:
                 LoggingInterface.LOGGING_LVL = LogLevel.INFO
 
+    @staticmethod
+    def configure_output(
+        console: bool = True,
+        file: str | None = None,
+        max_bytes: int = 10_000_000,
+        backups: int = 3,
+    ) -> None:
+        """
+        Write the logs to the console and/or to a file rotated every max_bytes.
+        """
+        LoggingInterface.WRITER.console = console
+        if file is not None:
+            LoggingInterface.WRITER.open_file(file, max_bytes, backups)
+
+    @staticmethod
+    def flush() -> None:
+        """
+        Write every log record queued so far.
+        """
+        LoggingInterface.WRITER.flush()
+
     # =========================================================================
     #                                 PRINTING
     # =========================================================================
 
-    def __print(self, msg: str, lvl_pref: str, lvl: LogLevel) -> None:
-        LoggingInterface.__sprint(msg, lvl_pref, lvl, self.__prefix)
-
     @staticmethod
-    def __sprint(msg: str, lvl_prf: str, lvl: LogLevel, prf: str = "") -> None:
-        if lvl >= LoggingInterface.LOGGING_LVL:
-            try:
-                time = datetime.now().strftime("%H:%M:%S")
-            except:
-                time = "--------"
-            print(
-                lvl_prf
-                + f"[{time}]"
-                + (f"[{prf.center(NAME_WIDTH)}] " if len(prf) > 0 else " ")
-                + msg
-                + SUFFIX
-            )
-
-    def _debug(self, msg: str) -> None:
-        self.__print(msg, DEBUG_PREFIX, LogLevel.DEBUG)
+    def __push(lvl: LogLevel, prf: str, msg: str, args: tuple) -> None:
+        LoggingInterface.WRITER.push((lvl, time.monotonic_ns(), prf, msg, args))
+
+    def _debug(self, msg: str, *args) -> None:
+        if LogLevel.DEBUG >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.DEBUG, self.__prefix, msg, args)
 
     @staticmethod
-    def sdebug(msg: str) -> None:
-        LoggingInterface.__sprint(msg, DEBUG_PREFIX, LogLevel.DEBUG)
+    def sdebug(msg: str, *args) -> None:
+        if LogLevel.DEBUG >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.DEBUG, "", msg, args)
 
-    def _info(self, msg: str) -> None:
-        self.__print(msg, INFO_PREFIX, LogLevel.INFO)
+    def _info(self, msg: str, *args) -> None:
+        if LogLevel.INFO >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.INFO, self.__prefix, msg, args)
 
     @staticmethod
-    def sinfo(msg: str) -> None:
-        LoggingInterface.__sprint(msg, INFO_PREFIX, LogLevel.INFO)
+    def sinfo(msg: str, *args) -> None:
+        if LogLevel.INFO >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.INFO, "", msg, args)
 
-    def _warn(self, msg: str) -> None:
-        self.__print(msg, WARN_PREFIX, LogLevel.WARN)
+    def _warn(self, msg: str, *args) -> None:
+        if LogLevel.WARN >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.WARN, self.__prefix, msg, args)
 
     @staticmethod
-    def swarn(msg: str) -> None:
-        LoggingInterface.__sprint(msg, WARN_PREFIX, LogLevel.WARN)
+    def swarn(msg: str, *args) -> None:
+        if LogLevel.WARN >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.WARN, "", msg, args)
 
-    def _error(self, msg: str) -> None:
-        self.__print(msg, ERROR_PREFIX, LogLevel.ERROR)
+    def _error(self, msg: str, *args) -> None:
+        if LogLevel.ERROR >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.ERROR, self.__prefix, msg, args)
 
     @staticmethod
-    def serror(msg: str) -> None:
-        LoggingInterface.__sprint(msg, ERROR_PREFIX, LogLevel.ERROR)
+    def serror(msg: str, *args) -> None:
+        if LogLevel.ERROR >= LoggingInterface.LOGGING_LVL:
+            LoggingInterface.__push(LogLevel.ERROR, "", msg, args)
 
 
 def printHeader(text: List[Tuple[str, bool]]) -> None:
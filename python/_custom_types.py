@@ -10,7 +10,7 @@ def rad2deg(x: float) -> float:
     return 180 * x / math.pi
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class JointState:
     base: float
     shoulder: float
@@ -86,7 +86,7 @@ class Pose:
         )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Vec3:
     x: float
     y: float
@@ -0,0 +1,79 @@
+import asyncio
+
+from _custom_logger import LoggingInterface
+from _plc_client import PlcClient
+
+
+class Inspector(LoggingInterface):
+    """
+    Interface of the vision inspection used by the sequencer.
+
+    Each check is split in two phases: starting it only waits for the acquisition
+    (the part needing the cartridge in front of the camera), then returns a future
+    resolved with the verdict (True if a defect was detected). This lets the robot
+    move on while the verdict is computed.
+
+    This base class is a placeholder until the vision system is connected.
+    """
+
+    PREFIX = r"Inspector"
+
+    def __init__(self, prefix: str = PREFIX) -> None:
+        super().__init__(prefix)
+
+    async def start_qr_check(self) -> asyncio.Future:
+        """
+        Acquire the cartridge QR-Code.
+        Return a future resolved with True if the QR-Code is not the expected one.
+        """
+        # TODO: Check QR Code
+        return Inspector._verdict(False)
+
+    async def start_defect_check(self) -> asyncio.Future:
+        """
+        Acquire the cartridge for anomaly detection.
+        Return a future resolved with True if an anomaly was detected.
+        """
+        # TODO: Check defects
+        return Inspector._verdict(True)
+
+    @staticmethod
+    def _verdict(defect: bool) -> asyncio.Future:
+        """
+        Return an already resolved verdict future.
+        """
+        verdict = asyncio.get_running_loop().create_future()
+        verdict.set_result(defect)
+        return verdict
+
+
+class PlcInspector(Inspector):
+    """
+    Inspection through the PLC connected vision system.
+    A QR-Code is rejected if the PLC could not read it or if it is marked as
+    belonging to a wrong batch.
+    """
+
+    REJECTED_MARKERS = ("WRONGBATCH",)
+
+    def __init__(self, plc: PlcClient) -> None:
+        super().__init__()
+        self.__plc = plc
+
+    async def start_qr_check(self) -> asyncio.Future:
+        reading = await self.__plc.start_qr_read()
+        return asyncio.ensure_future(self.__qr_verdict(reading))
+
+    async def __qr_verdict(self, reading: asyncio.Future) -> bool:
+        qr = await reading
+        self._info("Read QR-Code '%s'", qr)
+        return PlcInspector.is_rejected_qr(qr)
+
+    @staticmethod
+    def is_rejected_qr(qr: str | None) -> bool:
+        """
+        Return True if the QR-Code is not the one of a valid cartridge.
+        """
+        if qr is None or len(qr) == 0:
+            return True
+        return any(marker in qr for marker in PlcInspector.REJECTED_MARKERS)
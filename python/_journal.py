@@ -0,0 +1,311 @@
+import asyncio
+import mmap
+import struct
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from collections import deque
+from typing import Iterator
+
+from _custom_logger import LoggingInterface
+from _inspection import Inspector
+from _state import Step
+
+
+class RecordKind(IntEnum):
+    COMMAND = 1
+    REPLY = 2
+    STEP = 3
+    VERDICT = 4
+    TIMING = 5
+
+
+class Verdict(IntEnum):
+    QR = 0
+    DEFECT = 1
+
+
+@dataclass
+class JournalRecord:
+    # Nanoseconds since the journal was created
+    t: int
+    kind: RecordKind
+    code: int
+    value: float
+    text: str
+
+
+class Journal(LoggingInterface):
+    """
+    Run journal: fixed-size binary records appended to a pre-sized memory-mapped
+    file, the file size doubling when it is full.
+
+    Each record is 64 bytes: time since the journal creation (ns), kind, text
+    length, a code, a value and up to 44 bytes of text. A longer text is continued
+    in the next records (flagged in the text length). Records by kind:
+        COMMAND  text = command sent to the robot
+        REPLY    text = reply of the robot, value = latency (s)
+        STEP     code = step entered, value = time spent in the previous step (s)
+        VERDICT  code = Verdict (QR / DEFECT), value = 1 if defect
+        TIMING   text = name, value = duration (s)
+
+    The header holds the number of records written, updated after each record, so
+    the journal of a crashed run can be read back.
+    """
+
+    PREFIX = r"Journal"
+
+    MAGIC = b"RBTJRNL1"
+    VERSION = 1
+    HEADER = struct.Struct("<8sIIqd")
+    HEADER_SIZE = 64
+    COUNT = struct.Struct("<q")
+    COUNT_OFFSET = 16
+    RECORD = struct.Struct("<qBBHd44s")
+    TEXT_SIZE = 44
+    CONTINUED = 0x80
+    DEFAULT_CAPACITY = 65536
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        super().__init__(Journal.PREFIX)
+        self.__file = open(path, "w+b")
+        self.__capacity = capacity
+        self.__file.truncate(Journal.__size(capacity))
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+        self.__count = 0
+        self.__origin = time.monotonic_ns()
+        self.__step_start = self.__origin
+        Journal.HEADER.pack_into(
+            self.__map,
+            0,
+            Journal.MAGIC,
+            Journal.RECORD.size,
+            Journal.VERSION,
+            0,
+            time.time(),
+        )
+
+    @staticmethod
+    def __size(capacity: int) -> int:
+        return Journal.HEADER_SIZE + capacity * Journal.RECORD.size
+
+    def __grow(self) -> None:
+        self.__map.close()
+        self.__capacity *= 2
+        self.__file.truncate(Journal.__size(self.__capacity))
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+
+    def __write(
+        self, kind: RecordKind, code: int = 0, value: float = 0.0, text: str = ""
+    ) -> None:
+        if self.__map.closed:
+            return
+        t = time.monotonic_ns() - self.__origin
+        data = text.encode()
+        while True:
+            chunk, data = data[: Journal.TEXT_SIZE], data[Journal.TEXT_SIZE :]
+            length = len(chunk) | (Journal.CONTINUED if len(data) > 0 else 0)
+            if self.__count == self.__capacity:
+                self.__grow()
+            offset = Journal.HEADER_SIZE + self.__count * Journal.RECORD.size
+            Journal.RECORD.pack_into(
+                self.__map, offset, t, kind, length, code, value, chunk
+            )
+            self.__count += 1
+            if len(data) == 0:
+                break
+        Journal.COUNT.pack_into(self.__map, Journal.COUNT_OFFSET, self.__count)
+
+    def command(self, msg: str) -> None:
+        self.__write(RecordKind.COMMAND, text=msg)
+
+    def reply(self, reply: str, latency: float) -> None:
+        self.__write(RecordKind.REPLY, value=latency, text=reply)
+
+    def step(self, step: Step) -> None:
+        now = time.monotonic_ns()
+        elapsed = (now - self.__step_start) / 1e9
+        self.__step_start = now
+        self.__write(RecordKind.STEP, code=step.value, value=elapsed)
+
+    def verdict(self, verdict: Verdict, defect: bool) -> None:
+        self.__write(RecordKind.VERDICT, code=verdict, value=float(defect))
+
+    def timing(self, name: str, duration: float) -> None:
+        self.__write(RecordKind.TIMING, value=duration, text=name)
+
+    def close(self) -> None:
+        """
+        Flush the journal and trim the file to the records written.
+        """
+        if self.__map.closed:
+            return
+        self.__map.flush()
+        self.__map.close()
+        self.__file.truncate(Journal.__size(self.__count))
+        self.__file.close()
+
+
+class JournalReader:
+    """
+    Reader of a run journal. The file is memory-mapped and the records are decoded
+    on iteration, so even a long journal opens instantly.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.__file = open(path, "rb")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, version, count, start = Journal.HEADER.unpack_from(self.__map, 0)
+        if magic != Journal.MAGIC or size != Journal.RECORD.size:
+            self.close()
+            raise ValueError(f"{path} is not a run journal")
+        self.version = version
+        self.start_time = start
+        # Records of a crashed run may be missing from the header count
+        capacity = (len(self.__map) - Journal.HEADER_SIZE) // Journal.RECORD.size
+        self.n_slots = min(count, capacity)
+
+    def close(self) -> None:
+        self.__map.close()
+        self.__file.close()
+
+    def __iter__(self) -> Iterator[JournalRecord]:
+        text = b""
+        for i in range(self.n_slots):
+            offset = Journal.HEADER_SIZE + i * Journal.RECORD.size
+            t, kind, length, code, value, chunk = Journal.RECORD.unpack_from(
+                self.__map, offset
+            )
+            text += chunk[: length & ~Journal.CONTINUED]
+            if length & Journal.CONTINUED:
+                continue
+            yield JournalRecord(t, RecordKind(kind), code, value, text.decode())
+            text = b""
+
+    def records(self, kind: RecordKind) -> Iterator[JournalRecord]:
+        return (r for r in self if r.kind == kind)
+
+    def step_times(self) -> dict[str, list[float]]:
+        """
+        Time spent in each step, by step name.
+        """
+        times: dict[str, list[float]] = {}
+        previous = None
+        for r in self.records(RecordKind.STEP):
+            if previous is not None:
+                times.setdefault(previous.name, []).append(r.value)
+            previous = Step(r.code)
+        return times
+
+
+class ReplayRobot(LoggingInterface):
+    """
+    Mock robot transport replaying a journal: it connects to the robot proxy like
+    the robot program, and answers each command with the reply journaled for it
+    (FIFO order), optionally after the journaled latency. Commands differing from
+    the journaled ones are recorded as divergences.
+
+    The protocol negotiations of the journaled run are listed in negotiated. They
+    are not replayed as exchanges: the replay speaks the text protocol (commands
+    are journaled in their text form), and pushes a steadiness event after each
+    move once the events are negotiated (events are not journaled).
+    """
+
+    PREFIX = r"ReplayRobot"
+    LINE_END = ";"
+    NEGOTIATIONS = ("bin", "evt")
+    # Commands moving the robot (AsyncRobotProxy.MOVES)
+    MOVES = ("mvj", "mvl", "mvp", "mcr")
+
+    def __init__(self, journal: JournalReader, time_scale: float | None = None) -> None:
+        super().__init__(ReplayRobot.PREFIX)
+        commands = [r.text for r in journal.records(RecordKind.COMMAND)]
+        replies = [(r.text, r.value) for r in journal.records(RecordKind.REPLY)]
+        self.__exchanges: deque[tuple[str, str, float]] = deque()
+        self.negotiated: set[str] = set()
+        for i, cmd in enumerate(commands):
+            if cmd in ReplayRobot.NEGOTIATIONS:
+                self.negotiated.add(cmd)
+                continue
+            reply, latency = replies[i] if i < len(replies) else ("ukn", 0.0)
+            self.__exchanges.append((cmd, reply, latency))
+        self.__time_scale = time_scale
+        self.__events = False
+        self.__n_moves = 0
+        self.__task: asyncio.Task | None = None
+        self.divergences: list[tuple[str, str]] = []
+        self.n_replayed = 0
+
+    async def connect(self, host: str, port: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        self.__task = asyncio.create_task(self.__serve(reader, writer))
+
+    async def wait(self) -> None:
+        if self.__task is not None:
+            await self.__task
+
+    async def __serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        sep = ReplayRobot.LINE_END.encode()
+        while True:
+            try:
+                data = await reader.readuntil(sep)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            cmd = data[: -len(sep)].decode().strip()
+            if len(cmd) == 0:
+                continue
+            reply = await self.__answer(cmd)
+            writer.write(f"{reply}{ReplayRobot.LINE_END}".encode())
+            # Refused moves (ukn) are not numbered, like by the robot program
+            moved = cmd[:3] in ReplayRobot.MOVES and reply.startswith(cmd[:3])
+            if self.__events and moved:
+                self.__n_moves += 1
+                writer.write(f"std,{self.__n_moves}{ReplayRobot.LINE_END}".encode())
+            if cmd == "stp":
+                break
+        writer.close()
+
+    async def __answer(self, cmd: str) -> str:
+        if cmd == "stp":
+            return "stpok"
+        if cmd == "evt":
+            self.__events = True
+            return "evtok"
+        if cmd == "bin":
+            return "ukn"
+        if len(self.__exchanges) == 0:
+            self.divergences.append(("", cmd))
+            return "ukn"
+
+        expected, reply, latency = self.__exchanges.popleft()
+        self.n_replayed += 1
+        if cmd != expected:
+            self._warn("Replay diverged: sent '%s', journal has '%s'", cmd, expected)
+            self.divergences.append((expected, cmd))
+        if self.__time_scale:
+            await asyncio.sleep(latency / self.__time_scale)
+        return reply
+
+
+class ReplayInspector(Inspector):
+    """
+    Inspector giving back the verdicts of a journal, in order.
+    """
+
+    def __init__(self, journal: JournalReader) -> None:
+        super().__init__()
+        self.__verdicts: dict[Verdict, deque[bool]] = {v: deque() for v in Verdict}
+        for r in journal.records(RecordKind.VERDICT):
+            self.__verdicts[Verdict(r.code)].append(r.value != 0)
+
+    def __next(self, verdict: Verdict) -> asyncio.Future:
+        verdicts = self.__verdicts[verdict]
+        return Inspector._verdict(verdicts.popleft() if len(verdicts) > 0 else False)
+
+    async def start_qr_check(self) -> asyncio.Future:
+        return self.__next(Verdict.QR)
+
+    async def start_defect_check(self) -> asyncio.Future:
+        return self.__next(Verdict.DEFECT)
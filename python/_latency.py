@@ -0,0 +1,104 @@
+from array import array
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in nanoseconds (HDR histogram style).
+
+    Values are counted in buckets of 16 sub-buckets per power of two, so that any
+    recorded value is known within 1/16 (~6 %) of its value, from 1 ns up to
+    MAX_VALUE. Recording is an index computation and an increment in a
+    preallocated array.
+    """
+
+    SUB_BITS = 4
+    SUB_COUNT = 1 << SUB_BITS
+    # Values above are counted in the last bucket (~18 minutes)
+    MAX_VALUE = (1 << 40) - 1
+    N_BUCKETS = SUB_COUNT + (40 - SUB_BITS) * SUB_COUNT
+
+    def __init__(self) -> None:
+        self.__counts = array("Q", bytes(8 * LatencyHistogram.N_BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < LatencyHistogram.SUB_COUNT:
+            return max(0, value)
+        value = min(value, LatencyHistogram.MAX_VALUE)
+        shift = value.bit_length() - LatencyHistogram.SUB_BITS - 1
+        sub = (value >> shift) - LatencyHistogram.SUB_COUNT
+        return LatencyHistogram.SUB_COUNT * (shift + 1) + sub
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """
+        Highest value counted in the bucket at index.
+        """
+        if index < LatencyHistogram.SUB_COUNT:
+            return index
+        shift = index // LatencyHistogram.SUB_COUNT - 1
+        sub = index % LatencyHistogram.SUB_COUNT + LatencyHistogram.SUB_COUNT
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """
+        Count a latency, in nanoseconds.
+        """
+        self.__counts[LatencyHistogram._index(value)] += 1
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p: float) -> int:
+        """
+        Return the latency (ns) below which p percent of the recorded ones are.
+        """
+        if self.count == 0:
+            return 0
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for index, n in enumerate(self.__counts):
+            seen += n
+            if seen >= rank:
+                return min(LatencyHistogram._value(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def summary(self) -> dict:
+        """
+        Count, mean, p50/p95/p99 and max, in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean() / 1e6,
+            "p50": self.percentile(50) / 1e6,
+            "p95": self.percentile(95) / 1e6,
+            "p99": self.percentile(99) / 1e6,
+            "max": self.max / 1e6,
+        }
+
+
+class CommandLatency:
+    """
+    Latencies of one robot command: from its sending to the first byte of its reply,
+    and to its complete reply.
+    """
+
+    def __init__(self) -> None:
+        self.first_byte = LatencyHistogram()
+        self.complete = LatencyHistogram()
+
+    def summary(self) -> dict:
+        return {
+            "first_byte": self.first_byte.summary(),
+            "complete": self.complete.summary(),
+        }
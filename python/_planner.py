@@ -0,0 +1,105 @@
+import math
+
+from _custom_types import Pose
+from _state import APPROACH, Bin, State
+
+
+def travel(a: Pose, b: Pose) -> float:
+    """
+    Cartesian distance between the positions of two poses.
+    """
+    return math.dist((a.x, a.y, a.z), (b.x, b.y, b.z))
+
+
+class RowOrderPlanner:
+    """
+    Cell planner visiting the cells of each bin in traversal order (row first,
+    then col), skipping the taken/occupied ones.
+    """
+
+    def reset(self) -> None:
+        """
+        Forget the robot position (e.g. when starting a new tray).
+        """
+        pass
+
+    def next_input(self, state: State) -> int | None:
+        """
+        Choose the input cell of the next cartridge, None if the input bin is empty.
+        """
+        return RowOrderPlanner._first_free(state.occupancy(Bin.INPUT))
+
+    def next_drop(self, state: State, bin: Bin) -> int | None:
+        """
+        Choose the output cell of the current cartridge, None if the bin is full.
+        """
+        return RowOrderPlanner._first_free(state.occupancy(bin))
+
+    @staticmethod
+    def _first_free(occupancy: list[bool]) -> int | None:
+        for idx, occupied in enumerate(occupancy):
+            if not occupied:
+                return idx
+        return None
+
+
+class TravelPlanner(RowOrderPlanner):
+    """
+    Cell planner minimizing the Cartesian travel of the robot between the input
+    bin, the checking approach pose and the output bins.
+
+    Every cartridge goes input cell -> checking approach -> output cell -> next
+    input cell. The next input cell is the free one nearest to the robot
+    (nearest-neighbour), and the output cell is the free one minimizing the
+    travel from the checking approach to it and from it to the nearest
+    remaining input cell (one step lookahead).
+    """
+
+    def __init__(self) -> None:
+        self.__position: Pose | None = None
+
+    def reset(self) -> None:
+        self.__position = None
+
+    def next_input(self, state: State) -> int | None:
+        position = self.__position
+        if position is None:
+            position = state.get_checking_approach_pos()
+        return TravelPlanner.__nearest(state, Bin.INPUT, position)
+
+    def next_drop(self, state: State, bin: Bin) -> int | None:
+        checking = state.get_checking_approach_pos()
+        inputs = state.poses(Bin.INPUT)
+        remaining = [
+            inputs[idx][APPROACH]
+            for idx, taken in enumerate(state.occupancy(Bin.INPUT))
+            if not taken
+        ]
+
+        best, best_cost = None, math.inf
+        for idx, cell in TravelPlanner.__free_cells(state, bin):
+            cost = travel(checking, cell)
+            if len(remaining) > 0:
+                cost += min(travel(cell, p) for p in remaining)
+            if cost < best_cost:
+                best, best_cost = idx, cost
+
+        if best is not None:
+            self.__position = state.poses(bin)[best][APPROACH]
+        return best
+
+    @staticmethod
+    def __free_cells(state: State, bin: Bin):
+        poses = state.poses(bin)
+        for idx, occupied in enumerate(state.occupancy(bin)):
+            if not occupied:
+                yield idx, poses[idx][APPROACH]
+
+    @staticmethod
+    def __nearest(state: State, bin: Bin, position: Pose) -> int | None:
+        best, best_dist = None, math.inf
+        for idx, cell in TravelPlanner.__free_cells(state, bin):
+            dist = travel(position, cell)
+            if dist < best_dist:
+                best, best_dist = idx, dist
+        return best
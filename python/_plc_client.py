@@ -0,0 +1,302 @@
+import asyncio
+from enum import Enum
+
+from _custom_logger import LoggingInterface
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError as e:
+    mqtt = None
+
+
+class PlcStep(Enum):
+    """
+    States of the PLC vision handshake, valued by the code commanding them.
+    The PLC publishes the code on the status topic once it has applied it.
+    """
+
+    RESET = "0"
+    TRIGGER_ON = "1"
+    TRIGGER_OFF = "2"
+    PUBLISH = "3"
+
+
+class PlcClient(LoggingInterface):
+    """
+    Long-lived MQTT connection to the PLC.
+
+    One paho client stays connected with its network loop running. Commands are
+    published on the PLC topic and each handshake step waits for the PLC to
+    acknowledge it on the status topic, with a per-step timeout. Replies are
+    delivered through futures, oldest request first. The MQTT client can be given
+    at creation (any object with the paho client API), otherwise a paho one is
+    created.
+
+    A PLC program which never acknowledged a step (no status publication) gets
+    timed steps instead: each code is published and given a fixed delay to be
+    applied. A status publication switches back to the acknowledged steps.
+    """
+
+    PREFIX = r"PlcClient"
+
+    DEFAULT_PORT = 1883
+    TOPIC = "PLC"
+    STATUS_TOPIC = "PLC/status"
+    QOS = 1
+    REPLY_TIMEOUT = 5.0
+    CONNECT_TIMEOUT = 5.0
+    CODES = tuple(step.value for step in PlcStep)
+
+    # Maximum time for the PLC to acknowledge each step
+    STEP_TIMEOUTS = {
+        PlcStep.RESET: 0.5,
+        PlcStep.TRIGGER_ON: 1.0,
+        PlcStep.TRIGGER_OFF: 1.0,
+        PlcStep.PUBLISH: 1.0,
+    }
+
+    # Time given to a PLC not acknowledging the steps to apply each of them
+    STEP_DELAYS = {
+        PlcStep.RESET: 0.1,
+        PlcStep.TRIGGER_ON: 0.2,
+        PlcStep.TRIGGER_OFF: 0.1,
+        PlcStep.PUBLISH: 0.0,
+    }
+
+    # Handshake of a QR-Code read, the acquisition ends with the trigger off
+    QR_ACQUISITION = (
+        PlcStep.RESET,
+        PlcStep.TRIGGER_ON,
+        PlcStep.RESET,
+        PlcStep.TRIGGER_OFF,
+    )
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int = DEFAULT_PORT,
+        topic: str = TOPIC,
+        status_topic: str = STATUS_TOPIC,
+        client=None,
+    ) -> None:
+        super().__init__(PlcClient.PREFIX)
+        self.__address = (hostname, port)
+        self.__topic = topic
+        self.__status_topic = status_topic
+        self.__client = client
+        self.reply_timeout = PlcClient.REPLY_TIMEOUT
+        self.connect_timeout = PlcClient.CONNECT_TIMEOUT
+        self.step_timeouts = dict(PlcClient.STEP_TIMEOUTS)
+        self.step_delays = dict(PlcClient.STEP_DELAYS)
+
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__connected: asyncio.Future | None = None
+        self.__handshake = asyncio.Lock()
+        self.__ack: tuple[PlcStep, asyncio.Future] | None = None
+        self.__requests: dict[int, asyncio.Future] = {}
+        self.__next_request = 0
+
+        # Last step acknowledged by the PLC
+        self.state: PlcStep | None = None
+        # Whether the PLC acknowledges the steps, until it proved otherwise
+        self.acknowledges = True
+
+    # =========================================================================
+    # Connection
+    # =========================================================================
+
+    async def connect(self) -> bool:
+        """
+        Connect to the broker and start the client network loop.
+        Returns whether the connection succeeded or not (broker not reached within
+        the connection timeout).
+        """
+        if self.__client is None:
+            if mqtt is None:
+                self._error("paho-mqtt is not installed, cannot reach the PLC!")
+                return False
+            self.__client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+        self.__loop = asyncio.get_running_loop()
+        self.__connected = self.__loop.create_future()
+        self.__client.on_connect = self.__on_connect
+        self.__client.on_message = self.__on_message
+
+        self._info("Connecting to broker %s:%s", self.__address[0], self.__address[1])
+        self.__client.connect_async(*self.__address)
+        self.__client.loop_start()
+        try:
+            await asyncio.wait_for(self.__connected, self.connect_timeout)
+        except asyncio.TimeoutError:
+            self._error(
+                "Broker %s:%s not reached in %s s",
+                self.__address[0],
+                self.__address[1],
+                self.connect_timeout,
+            )
+            self.__client.loop_stop()
+            self.__connected = None
+            return False
+        self._info("Connected to broker")
+        return True
+
+    def is_connected(self) -> bool:
+        """
+        Return True if the client is connected to the broker, False otherwise
+        """
+        return self.__connected is not None and self.__connected.done()
+
+    async def close(self) -> None:
+        """
+        Disconnect from the broker, pending requests get no reply.
+        """
+        if self.__client is None or self.__connected is None:
+            return
+        self._info("Closing broker connection")
+        self.__client.disconnect()
+        self.__client.loop_stop()
+        self.__connected = None
+        for request in self.__requests.values():
+            if not request.done():
+                request.set_result(None)
+        self.__requests.clear()
+
+    # Callbacks from the client network thread
+    def __on_connect(self, client, userdata, flags, reason_code, properties=None):
+        # Subscribing here renews the subscriptions when reconnecting
+        client.subscribe(self.__topic, qos=PlcClient.QOS)
+        client.subscribe(self.__status_topic, qos=PlcClient.QOS)
+        self.__loop.call_soon_threadsafe(self.__set_connected)
+
+    def __on_message(self, client, userdata, msg):
+        self.__loop.call_soon_threadsafe(self.__on_reply, msg.topic, msg.payload)
+
+    # Callbacks in the event loop
+    def __set_connected(self) -> None:
+        if self.__connected is not None and not self.__connected.done():
+            self.__connected.set_result(True)
+
+    def __on_reply(self, topic: str, payload: bytes) -> None:
+        reply = payload.decode(errors="replace").strip()
+
+        if topic == self.__status_topic:
+            self.__on_status(reply)
+            return
+
+        # Our own commands, echoed by the broker
+        if reply in PlcClient.CODES:
+            return
+
+        if len(self.__requests) == 0:
+            self._warn("Dropping unexpected PLC message '%s'", reply)
+            return
+
+        # Give the reply to the oldest pending request
+        request = self.__requests.pop(next(iter(self.__requests)))
+        if not request.done():
+            request.set_result(reply)
+
+    def __on_status(self, status: str) -> None:
+        try:
+            self.state = PlcStep(status)
+        except ValueError:
+            self._warn("Unknown PLC status '%s'", status)
+            return
+        self.acknowledges = True
+
+        if self.__ack is not None and self.__ack[0] == self.state:
+            if not self.__ack[1].done():
+                self.__ack[1].set_result(True)
+            self.__ack = None
+
+    # =========================================================================
+    # PLC commands
+    # =========================================================================
+
+    def send(self, step: PlcStep) -> None:
+        """
+        Publish a command code to the PLC, without waiting for it to be applied.
+        """
+        self._debug("Sending code '%s' (%s)", step.value, step.name)
+        self.__client.publish(self.__topic, step.value, qos=PlcClient.QOS)
+
+    async def step(self, step: PlcStep) -> bool:
+        """
+        Command a handshake step and wait for the PLC to acknowledge it (or for its
+        delay if the PLC does not acknowledge the steps).
+        Returns False if the PLC did not acknowledge it in time.
+        """
+        if not self.acknowledges:
+            self.send(step)
+            await asyncio.sleep(self.step_delays[step])
+            return True
+
+        ack = self.__loop.create_future()
+        self.__ack = (step, ack)
+        self.send(step)
+        try:
+            await asyncio.wait_for(ack, self.step_timeouts[step])
+            return True
+        except asyncio.TimeoutError:
+            if self.state is None:
+                # Never acknowledged anything, the step was given its delay
+                self._warn("The PLC does not acknowledge the steps, using timed steps")
+                self.acknowledges = False
+                return True
+            self._warn("PLC did not acknowledge %s in time", step.name)
+            return False
+        finally:
+            if self.__ack is not None and self.__ack[1] is ack:
+                self.__ack = None
+
+    async def start_qr_read(self) -> asyncio.Future:
+        """
+        Trigger the QR-Code reader, returning once the acquisition is done.
+        Return a future resolved with the read QR-Code (None if the PLC did not answer).
+
+        Handshake: 0 (reset), 1 (trigger on), 0 (reset), 2 (trigger off), 3 (publish)
+        """
+        # The handshake is held until the QR-Code is received
+        await self.__handshake.acquire()
+        try:
+            for step in PlcClient.QR_ACQUISITION:
+                if not await self.step(step):
+                    await self.step(PlcStep.RESET)
+                    self.__handshake.release()
+                    return self.__no_reply()
+        except BaseException:
+            self.__handshake.release()
+            raise
+
+        return asyncio.ensure_future(self.__fetch_qr())
+
+    async def read_qr(self) -> str | None:
+        """
+        Read the QR-Code of the cartridge in front of the reader.
+        Returns None if the PLC did not answer.
+        """
+        return await (await self.start_qr_read())
+
+    async def __fetch_qr(self) -> str | None:
+        request_id = self.__next_request
+        self.__next_request += 1
+        reply = self.__loop.create_future()
+        self.__requests[request_id] = reply
+
+        try:
+            if not await self.step(PlcStep.PUBLISH):
+                return None
+            return await asyncio.wait_for(reply, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self._warn("No reply from the PLC for request %s", request_id)
+            return None
+        finally:
+            self.__requests.pop(request_id, None)
+            if self.__connected is not None:
+                await self.step(PlcStep.RESET)
+            self.__handshake.release()
+
+    def __no_reply(self) -> asyncio.Future:
+        reply = self.__loop.create_future()
+        reply.set_result(None)
+        return reply
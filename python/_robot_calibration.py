@@ -0,0 +1,344 @@
+import math
+import os
+import shutil
+
+from _calibration import BIN_SECTIONS, BinCalibration, CalibrationData
+from _custom_logger import LoggingInterface
+from _custom_types import JointState, Vec3
+from _robot_proxy import RobotProxy
+
+# Samples averaged per taught point
+N_SAMPLES = 10
+# A point whose samples spread more than this is taught again (m, deg)
+MAX_JITTER = 0.001
+MAX_JITTER_DEG = 0.1
+# Taught cells farther than this from the fitted grid (RMS) are reported (m)
+MAX_FIT_RMS = 0.002
+
+MAX_ITERATIONS = 20
+
+
+def corner_cells(nrow: int, ncol: int) -> list[tuple[int, int]]:
+    """
+    Distinct corner cells (row, col) of a bin, the first cell first.
+    """
+    cells = []
+    for cell in ((0, 0), (nrow - 1, 0), (0, ncol - 1), (nrow - 1, ncol - 1)):
+        if cell not in cells:
+            cells.append(cell)
+    return cells
+
+
+def _solve(a: list[list[float]], b: list[float]) -> list[float]:
+    """
+    Solve the linear system a x = b (Gaussian elimination with partial pivoting).
+    Raise a ValueError if it is singular.
+    """
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for k in range(n):
+        pivot = max(range(k, n), key=lambda i: abs(m[i][k]))
+        if abs(m[pivot][k]) < 1e-12:
+            raise ValueError("singular system")
+        m[k], m[pivot] = m[pivot], m[k]
+        for i in range(k + 1, n):
+            f = m[i][k] / m[k][k]
+            for j in range(k, n + 1):
+                m[i][j] -= f * m[k][j]
+    x = [0.0] * n
+    for k in reversed(range(n)):
+        s = sum(m[k][j] * x[j] for j in range(k + 1, n))
+        x[k] = (m[k][n] - s) / m[k][k]
+    return x
+
+
+def fit_bin_grid(
+    points: list[tuple[int, int, Vec3]], nrow: int, ncol: int, dz: float
+) -> tuple[BinCalibration, float]:
+    """
+    Fit the grid of a bin (origin, drow, dcol and rot, see BinCalibration.cell) to
+    taught cell centers (row, col, position), by least squares (Gauss-Newton). The
+    first cell must be taught, the height of the bin is the mean taught height.
+    Only the parameters the bin shape defines are fitted: no pitch along a single
+    row or column, no rotation for a single cell.
+
+    Return the bin and the RMS distance of the taught cells to the fitted ones (m).
+    Raise a ValueError if the taught cells do not define the grid.
+    """
+    taught = {(row, col): p for row, col, p in points}
+    if (0, 0) not in taught:
+        raise ValueError("the first cell is not taught")
+
+    # Initial guess from the first cell and the last cells of its row and column
+    o = taught[(0, 0)]
+    drow = dcol = rot = 0.0
+    if nrow > 1 and (nrow - 1, 0) in taught:
+        p = taught[(nrow - 1, 0)]
+        rot = math.atan2(p.y - o.y, p.x - o.x)
+        drow = math.dist((p.x, p.y), (o.x, o.y)) / (nrow - 1)
+    if ncol > 1 and (0, ncol - 1) in taught:
+        p = taught[(0, ncol - 1)]
+        if nrow == 1:
+            rot = math.atan2(p.y - o.y, p.x - o.x) - math.pi / 2
+        dx, dy = p.x - o.x, p.y - o.y
+        dcol = (-math.sin(rot) * dx + math.cos(rot) * dy) / (ncol - 1)
+
+    # Parameters: ox, oy, drow, dcol, rot
+    params = [o.x, o.y, drow, dcol, rot]
+    active = [0, 1]
+    if nrow > 1:
+        active.append(2)
+    if ncol > 1:
+        active.append(3)
+    if nrow > 1 or ncol > 1:
+        active.append(4)
+
+    n = len(active)
+    for _ in range(MAX_ITERATIONS):
+        ox, oy, drow, dcol, rot = params
+        c, s = math.cos(rot), math.sin(rot)
+        jtj = [[0.0] * n for _ in range(n)]
+        jtr = [0.0] * n
+        for row, col, p in points:
+            u, v = row * drow, col * dcol
+            ex = ox + c * u - s * v - p.x
+            ey = oy + s * u + c * v - p.y
+            jx = (1, 0, c * row, -s * col, -s * u - c * v)
+            jy = (0, 1, s * row, c * col, c * u - s * v)
+            for j, e in ((jx, ex), (jy, ey)):
+                for a in range(n):
+                    jtr[a] += j[active[a]] * e
+                    for b in range(n):
+                        jtj[a][b] += j[active[a]] * j[active[b]]
+        try:
+            step = _solve(jtj, jtr)
+        except ValueError:
+            raise ValueError("taught cells on top of each other") from None
+        for a, i in enumerate(active):
+            params[i] -= step[a]
+        if max(abs(d) for d in step) < 1e-10:
+            break
+
+    # Smallest rotation: a half turn is the same grid with opposite pitches
+    ox, oy, drow, dcol, rot = params
+    rot = math.remainder(rot, 2 * math.pi)
+    if abs(rot) > math.pi / 2:
+        rot -= math.copysign(math.pi, rot)
+        drow, dcol = -drow, -dcol
+
+    z = sum(p.z for _, _, p in points) / len(points)
+    bin = BinCalibration(Vec3(ox, oy, z), dz, drow, dcol, nrow, ncol, rot)
+    errors = [
+        math.dist((*bin.cell(row, col), z), (p.x, p.y, p.z)) ** 2
+        for row, col, p in points
+    ]
+    return bin, math.sqrt(sum(errors) / len(errors))
+
+
+class RobotCalibration(LoggingInterface):
+    """
+    Calibration capture from the live robot.
+
+    The operator is guided through the corner cells of each bin and the inspection
+    poses, moving the robot there (e.g. in freedrive). Each point is sampled
+    several times once the robot is steady and averaged, a point whose samples
+    spread too much is taught again. The grid of each bin is fitted to its taught
+    corners (see fit_bin_grid), and the calibration is validated before being
+    written (the previous file is kept as path.bak).
+
+    A bin or a pose may be kept from the current calibration file.
+    """
+
+    PREFIX = r"Calibration"
+
+    def __init__(
+        self,
+        proxy: RobotProxy,
+        path: str,
+        samples: int = N_SAMPLES,
+        operator_input=input,
+    ) -> None:
+        super().__init__(RobotCalibration.PREFIX)
+        self._proxy = proxy
+        self.path = path
+        self.samples = samples
+        # Function asking the operator, returning the typed line
+        self._operator_input = operator_input
+
+    def run(self) -> bool:
+        """
+        Capture and write the calibration. Return whether it was written.
+        """
+        current = CalibrationData()
+        if os.path.exists(self.path):
+            try:
+                current = CalibrationData.load(self.path)
+            except (OSError, ValueError) as e:
+                self._warn("Current calibration not valid, not kept: %s", e)
+
+        self._proxy.wait_client()
+        try:
+            calib = self.__capture(current)
+        except (EOFError, KeyboardInterrupt):
+            self._error("Calibration aborted, nothing written")
+            return False
+        except ConnectionError as e:
+            self._error("%s, nothing written", e)
+            return False
+
+        problems = calib.problems()
+        if len(problems) > 0:
+            for problem in problems:
+                self._error(problem)
+            self._error("Calibration not valid, nothing written")
+            return False
+
+        try:
+            if os.path.exists(self.path):
+                shutil.copyfile(self.path, self.path + ".bak")
+            calib.save(self.path)
+        except OSError as e:
+            self._error("Cannot write %s: %s", self.path, e)
+            return False
+        self._info("Calibration written to %s", self.path)
+        return True
+
+    def __capture(self, current: CalibrationData) -> CalibrationData:
+        fields = {}
+        for section, name in BIN_SECTIONS.items():
+            fields[name] = self.__teach_bin(section, getattr(current, name))
+
+        if self.__keep("checking approach pose"):
+            fields["checking_approach"] = current.checking_approach
+        else:
+            fields["checking_approach"] = self.__teach_position(
+                "the checking approach pose"
+            )
+        for name, what in (
+            ("qr_checking", "QR-Code checking pose"),
+            ("defect_checking", "defect checking pose"),
+        ):
+            if self.__keep(what):
+                fields[name] = getattr(current, name)
+            else:
+                fields[name] = self.__teach_joints(f"the {what}")
+        return CalibrationData(**fields)
+
+    # =========================================================================
+    # Operator
+    # =========================================================================
+
+    def __ask(self, question: str) -> str:
+        # Write the pending logs before the prompt
+        LoggingInterface.flush()
+        return self._operator_input(f"[ ][{self.PREFIX}] {question} > ").strip()
+
+    def __keep(self, what: str) -> bool:
+        answer = self.__ask(f"Teach the {what}? (Enter to teach, k to keep)")
+        return answer.lower() == "k"
+
+    def __ask_number(self, question: str, default, kind=float):
+        while True:
+            answer = self.__ask(f"{question} [{default}]")
+            if answer == "":
+                return default
+            try:
+                return kind(answer)
+            except ValueError:
+                self._warn("Not a number: '%s'", answer)
+
+    # =========================================================================
+    # Teaching
+    # =========================================================================
+
+    def __teach_bin(self, section: str, current: BinCalibration) -> BinCalibration:
+        if self.__keep(f"{section} bin"):
+            return current
+        nrow = ncol = 0
+        while nrow < 1 or ncol < 1:
+            nrow = self.__ask_number(f"{section} bin rows", current.nrow, int)
+            ncol = self.__ask_number(f"{section} bin columns", current.ncol, int)
+        dz = self.__ask_number(f"{section} bin approach height (m)", current.dz)
+
+        while True:
+            points = []
+            for row, col in corner_cells(nrow, ncol):
+                p = self.__teach_position(
+                    f"the {section} bin cell at row {row + 1}, column {col + 1}"
+                )
+                points.append((row, col, p))
+            try:
+                bin, rms = fit_bin_grid(points, nrow, ncol, dz)
+            except ValueError as e:
+                self._error("%s bin: %s, teach it again", section, e)
+                continue
+            break
+
+        self._info(
+            "%s bin: origin (%.4f, %.4f, %.4f) m, drow %.4f m, dcol %.4f m, "
+            "rot %.2f deg, residual %.2f mm",
+            section,
+            bin.origin.x,
+            bin.origin.y,
+            bin.origin.z,
+            bin.drow,
+            bin.dcol,
+            math.degrees(bin.rot),
+            rms * 1000,
+        )
+        if rms > MAX_FIT_RMS:
+            self._warn(
+                "%s bin: the taught cells are off the grid by %.1f mm, "
+                "check the rows and columns",
+                section,
+                rms * 1000,
+            )
+        return bin
+
+    def __sample(self, fetch) -> list:
+        """
+        Samples of a robot value once the robot is steady.
+        """
+        self._proxy.wait_steady()
+        samples = []
+        for _ in range(self.samples):
+            value = fetch()
+            if value is None:
+                raise ConnectionError("No answer from the robot")
+            samples.append(value)
+        return samples
+
+    def __teach_position(self, what: str) -> Vec3:
+        while True:
+            self.__ask(f"Move the robot to {what}, then press Enter")
+            poses = self.__sample(lambda: self._proxy.get_tcp_pose(degrees=False))
+            n = len(poses)
+            mean = Vec3(
+                sum(p.x for p in poses) / n,
+                sum(p.y for p in poses) / n,
+                sum(p.z for p in poses) / n,
+            )
+            center = (mean.x, mean.y, mean.z)
+            jitter = max(math.dist((p.x, p.y, p.z), center) for p in poses)
+            if jitter <= MAX_JITTER:
+                return mean
+            self._warn(
+                "The robot moved while sampled (%.1f mm), teach the point again",
+                jitter * 1000,
+            )
+
+    def __teach_joints(self, what: str) -> JointState:
+        while True:
+            self.__ask(f"Move the robot to {what}, then press Enter")
+            states = self.__sample(lambda: self._proxy.get_joint_state(degrees=True))
+            values = [
+                (j.base, j.shoulder, j.elbow, j.wrist1, j.wrist2, j.wrist3)
+                for j in states
+            ]
+            mean = [sum(q) / len(values) for q in zip(*values)]
+            jitter = max(abs(q - m) for v in values for q, m in zip(v, mean))
+            if jitter <= MAX_JITTER_DEG:
+                return JointState(*mean, True)
+            self._warn(
+                "The robot moved while sampled (%.2f deg), teach the pose again", jitter
+            )
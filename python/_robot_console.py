@@ -1,3 +1,4 @@
+from _custom_logger import LoggingInterface
 from _robot_proxy import RobotProxy
 import signal
 
@@ -16,6 +17,8 @@ def robot_console(proxy: RobotProxy):
 
     signal.signal(signal.SIGTERM, stop_console)
     while not STOP:
+        # Write the pending logs before the prompt
+        LoggingInterface.flush()
         cmd = input("[ ][Console] > ").strip()
         if cmd.startswith("close"):
             proxy.close_connection()
@@ -27,5 +30,5 @@ def robot_console(proxy: RobotProxy):
             STOP = True
             break
         else:
-            proxy._info(f"Response: {result}")
+            proxy._info("Response: %s", result)
     proxy.close_socket()
@@ -1,128 +1,150 @@
-import socket
-from _custom_types import JointState, Pose, rad2deg
+import asyncio
+from typing import Coroutine
+
+from _async_robot_proxy import AsyncRobotProxy, BatchCommands, RobotCommands
+from _custom_types import JointState, Pose
 from _custom_logger import LoggingInterface
 
 
-class RobotProxy(LoggingInterface):
+class RobotProxy(RobotCommands, LoggingInterface):
     """
-    Class for communicating between the robot via TCP/IP socket
+    Class for communicating between the robot via TCP/IP socket.
+    Blocking API, implemented as a thin wrapper over AsyncRobotProxy running on
+    a private event loop.
     """
 
     PREFIX = r"RobotProxy"
 
-    DEGREES_BY_DEFAULT = True
-    PARAM_SEP = ","
-    LINE_END = ";"
-
-    # Command patterns
-    GET_JOINT_POS = "gjp"
-    GET_TCP_POS = "gtp"
-    MOVE_J = "mvj,{},{},{},{},{},{}"
-    MOVE_J_RESP = "mvjok"
-    MOVE_L = "mvl,{},{},{},{},{},{}"
-    MOVE_L_RESP = "mvlok"
-    OPEN_GRIPPER = "gop"
-    CLOSE_GRIPPER = "gcl"
-    WAIT_STEADY = "std"
-    STOP = "stp"
-    STOP_RESP = "stpok"
-
     def __init__(self, srv_ip: str, srv_port: int) -> None:
         super().__init__(RobotProxy.PREFIX)
-        self.__binding_ip = (srv_ip, srv_port)
-        self.__socket: socket.socket | None = None
-        self.__client: socket.socket | None = None
+        self.__loop = asyncio.new_event_loop()
+        self.__proxy = AsyncRobotProxy(srv_ip, srv_port)
+        # The private loop only runs during calls, it cannot wait for the robot
+        # to come back in the background
+        self.__proxy.recover_commands = False
         self.open_socket()
 
+    def __run(self, coro: Coroutine):
+        return self.__loop.run_until_complete(coro)
+
+    @property
+    def async_proxy(self) -> AsyncRobotProxy:
+        """
+        The asynchronous proxy wrapped by this object.
+        """
+        return self.__proxy
+
     # =========================================================================
     # General Purpose Functions
     # =========================================================================
 
     def open_socket(self) -> None:
-        self.__socket = socket.socket()
-        self.__socket.bind(self.__binding_ip)
+        self.__run(self.__proxy.open_socket())
 
     def wait_client(self) -> None:
         """
         Wait for a client to connect to the socket server.
         """
-        if self.__client is not None:
-            return
-
-        if self.__socket is None:
-            self._error("Wanted to connect when socket is closed!")
-            return
-
-        self._info("Waiting for client ...")
-        self.__socket.listen()
-        self.__client, add = self.__socket.accept()
-        self._info(f"Client found with IP {add}")
+        self.__run(self.__proxy.wait_client())
 
     def has_client(self) -> bool:
         """
         Return True if a client is connected, False otherwise
         """
-        return self.__client != None
+        return self.__proxy.has_client()
+
+    def is_binary(self) -> bool:
+        """
+        Return True if the binary wire protocol is used with the current client.
+        """
+        return self.__proxy.is_binary()
+
+    def use_binary(self) -> bool:
+        """
+        Negotiate the binary wire protocol with the current client, keeping the
+        text protocol if the client does not support it.
+        Returns whether the binary protocol is used.
+        """
+        return self.__run(self.__proxy.use_binary())
+
+    def has_events(self) -> bool:
+        """
+        Return True if the current client pushes the steadiness events.
+        """
+        return self.__proxy.has_events()
+
+    def use_events(self) -> bool:
+        """
+        Ask the current client to push a steadiness event after each move.
+        Returns whether the events are pushed.
+        """
+        return self.__run(self.__proxy.use_events())
+
+    def last_move(self) -> int:
+        """
+        Return the id of the last move sent to the current client (0 if none).
+        """
+        return self.__proxy.last_move()
+
+    def steady(self, move_id: int | None = None) -> bool:
+        """
+        Blocking method to wait until the robot is steady after the given move (by
+        default the last move sent), see AsyncRobotProxy.steady.
+        Returns whether the robot settled (False if the client was lost).
+        """
+        return self.__run(self.__proxy.steady(move_id))
 
     def send(self, msg: str) -> str | None:
         """
         Send a message to the client (if client connected).
         Return the response string, or None if there is a problem with the client.
         """
-        self._debug(f"Sending cmd '{msg}'")
-        if self.__client == None:
-            self._warn("Trying to send message when client not connected!")
-            return None
-
-        if self.__socket is None:
-            self._error("Trying to send a message when socket is closed!")
-            return None
+        return self.__run(self.__proxy.send(msg))
 
-        # Send message
+    def submit(self, msg: str, resp: str | None = None) -> asyncio.Future:
+        """
+        Send a message to the client without waiting for its response (pipelined mode).
+        See AsyncRobotProxy.submit, the returned future is resolved by collect()
+        (or by any later blocking call).
+        """
+        return self.__proxy.submit(msg, resp)
 
-        self.__client.sendall(f"{msg}{RobotProxy.LINE_END}".encode())
+    def collect(self) -> bool:
+        """
+        Wait for the responses of every pipelined command, matching them in FIFO order.
+        Returns whether all of them were executed successfully or not.
+        """
+        return self.__run(self.__proxy.collect())
 
-        # Wait for response
-        while True:
-            data = self.__client.recv(1024)
-            if not data:
-                break
-            if len(data.decode()) > 1:
-                return (
-                    data.decode()
-                    .split(RobotProxy.LINE_END)[0]
-                    .replace(RobotProxy.LINE_END, "")
-                )
+    def latency_stats(self) -> dict[str, dict]:
+        """
+        Return the count, mean, p50/p95/p99 and max latency (ms) of every command,
+        to the first byte and to the complete reply, by opcode.
+        """
+        return self.__proxy.latency_stats()
 
-        # In case of communication error
-        self._warn("Robot disconnected!")
-        return None
+    def batch(self) -> "CommandBatch":
+        """
+        Create a batch of pipelined commands for this proxy.
+        """
+        return CommandBatch(self)
 
     def close_connection(self) -> None:
         """
         Close the connection with the current client.
         """
-        if self.__client == None:
+        if self.__loop.is_closed():
             return
-        self._info("Closing client connection")
-        result = self.send(RobotProxy.STOP)
-
-        # Check if result is right:
-        if result is not None and not result.startswith(RobotProxy.STOP_RESP):
-            self._error(f"Robot server problem when stopping: {result}")
-
-        self.__client = None
+        self.__run(self.__proxy.close_connection())
 
     def close_socket(self) -> None:
         """
         Close the socket server.
         """
-        if self.__socket == None:
+        if self.__loop.is_closed():
             return
-        self._info("Closing socket")
-        self.close_connection()
-        self.__socket.close()
-        self.__socket = None
+        self.__run(self.__proxy.close_socket())
+        self.__loop.close()
 
     def __del__(self):
         self.close_socket()
@@ -131,7 +153,9 @@ class RobotProxy(LoggingInterface):
     # Robotech specialized functions
     # =========================================================================
 
-    def get_joint_state(self, degrees: bool = DEGREES_BY_DEFAULT) -> JointState | None:
+    def get_joint_state(
+        self, degrees: bool = RobotCommands.DEGREES_BY_DEFAULT
+    ) -> JointState | None:
         """
         Fetch the actual joint state of the robot and return it as a JointState object.
         Return None in case of communication error.
@@ -139,55 +163,19 @@ class RobotProxy(LoggingInterface):
         Sends:    gjp;
         Receive:  gjp,q1,q2,q3,q4,q5,q6;
         """
-        result = self.send(RobotProxy.GET_JOINT_POS)
-
-        # If com error
-        if result is None:
-            return None
-
-        elems = result.split(RobotProxy.PARAM_SEP)
-        if len(elems) <= 7 or elems[0] != RobotProxy.GET_JOINT_POS:
-            self._error(f"Malformed result for GetJoinState : '{result}'")
-            return None
+        return self.__run(self.__proxy.get_joint_state(degrees))
 
-        return JointState(
-            rad2deg(float(elems[1])) if degrees else float(elems[1]),
-            rad2deg(float(elems[2])) if degrees else float(elems[2]),
-            rad2deg(float(elems[3])) if degrees else float(elems[3]),
-            rad2deg(float(elems[4])) if degrees else float(elems[4]),
-            rad2deg(float(elems[5])) if degrees else float(elems[5]),
-            rad2deg(float(elems[6])) if degrees else float(elems[6]),
-            False,
-        )
-
-    def get_tcp_pose(self, degrees: bool = DEGREES_BY_DEFAULT) -> Pose | None:
+    def get_tcp_pose(
+        self, degrees: bool = RobotCommands.DEGREES_BY_DEFAULT
+    ) -> Pose | None:
         """
-        Fetch the actual joint state of the robot and return it as a JointState object.
+        Fetch the actual TCP pose of the robot and return it as a Pose object.
         Return None in case of communication error.
 
         Sends:    gtp;
         Receive:  gtp,x,y,z,rx,ry,rz;
         """
-        result = self.send(RobotProxy.GET_TCP_POS)
-
-        # If com error
-        if result is None:
-            return None
-
-        elems = result.split(RobotProxy.PARAM_SEP)
-        if len(elems) <= 7 or elems[0] != RobotProxy.GET_TCP_POS:
-            self._error(f"Malformed result for GetJoinState : '{result}'")
-            return None
-
-        return Pose(
-            float(elems[1]),
-            float(elems[2]),
-            float(elems[3]),
-            rad2deg(float(elems[4])) if degrees else float(elems[4]),
-            rad2deg(float(elems[5])) if degrees else float(elems[5]),
-            rad2deg(float(elems[6])) if degrees else float(elems[6]),
-            False,
-        )
+        return self.__run(self.__proxy.get_tcp_pose(degrees))
 
     def movej(self, joints: JointState) -> bool:
         """
@@ -197,28 +185,7 @@ class RobotProxy(LoggingInterface):
         Sends:    mvj,q1,q2,q3,q4,q5,q6;
         Receives: mvjok;
         """
-        # Send the move command
-        rad_joints = joints.in_rad()
-        cmd = RobotProxy.MOVE_J.format(
-            rad_joints.base,
-            rad_joints.shoulder,
-            rad_joints.elbow,
-            rad_joints.wrist1,
-            rad_joints.wrist2,
-            rad_joints.wrist3,
-        )
-        result = self.send(cmd)
-
-        # Check if client was connected
-        if result == None:
-            return False
-
-        # Check if result is right:
-        if not result.startswith(RobotProxy.MOVE_J_RESP):
-            self._error(f"Robot server problem when MoveJ: {cmd} -> {result}")
-            return False
-
-        return True
+        return self.__run(self.__proxy.movej(joints))
 
     def movel(self, pose: Pose) -> bool:
         """
@@ -228,28 +195,28 @@ class RobotProxy(LoggingInterface):
         Sends:    mvl,x,y,z,rx,ry,rz;
         Receives: mvlok;
         """
-        # Send the move command
-        rad_pose = pose.in_rad()
-        cmd = RobotProxy.MOVE_L.format(
-            rad_pose.x,
-            rad_pose.y,
-            rad_pose.z,
-            rad_pose.rx,
-            rad_pose.ry,
-            rad_pose.rz,
-        )
-        result = self.send(cmd)
-
-        # Check if client was connected
-        if result == None:
-            return False
-
-        # Check if result is right:
-        if not result.startswith(RobotProxy.MOVE_L_RESP):
-            self._error(f"Robot server problem when MoveL: {cmd} -> {result}")
-            return False
-
-        return True
+        return self.__run(self.__proxy.movel(pose))
+
+    def movel_path(self, poses: list[Pose], blends: list[float]) -> bool:
+        """
+        Launch a path of straight moves in world space, blending each waypoint with
+        the next one within its blend radius (0 to stop on it).
+        Returns whether the command was executed successfully or not.
+
+        Sends:    mvp,n,x1,y1,z1,rx1,ry1,rz1,r1,...,xn,yn,zn,rxn,ryn,rzn,rn;
+        Receives: mvpok;
+        """
+        return self.__run(self.__proxy.movel_path(poses, blends))
+
+    def run_macro(self, name: str, params: list[Pose | float]) -> bool:
+        """
+        Run a step macro on the robot, see AsyncRobotProxy.run_macro.
+        Returns whether the macro was executed successfully or not.
+
+        Sends:    mcr,<name>,<values>;
+        Receives: mcrok;
+        """
+        return self.__run(self.__proxy.run_macro(name, params))
 
     def open_gripper(self) -> bool:
         """
@@ -259,18 +226,7 @@ class RobotProxy(LoggingInterface):
         Sends:    gop;
         Receives: gop;
         """
-        result = self.send(RobotProxy.OPEN_GRIPPER)
-
-        # Check if client was connected
-        if result == None:
-            return False
-
-        # Check if result is right:
-        if not result.startswith(RobotProxy.OPEN_GRIPPER):
-            self._error(f"Robot server problem when opening gripper: {result}")
-            return False
-
-        return True
+        return self.__run(self.__proxy.open_gripper())
 
     def close_gripper(self) -> bool:
         """
@@ -280,18 +236,7 @@ class RobotProxy(LoggingInterface):
         Sends:    gcl;
         Receives: gcl;
         """
-        result = self.send(RobotProxy.CLOSE_GRIPPER)
-
-        # Check if client was connected
-        if result == None:
-            return False
-
-        # Check if result is right:
-        if not result.startswith(RobotProxy.CLOSE_GRIPPER):
-            self._error(f"Robot server problem when closing gripper: {result}")
-            return False
-
-        return True
+        return self.__run(self.__proxy.close_gripper())
 
     def wait_steady(self) -> bool:
         """
@@ -301,15 +246,26 @@ class RobotProxy(LoggingInterface):
         Sends:    std;
         Receives: std;
         """
-        result = self.send(RobotProxy.WAIT_STEADY)
+        return self.__run(self.__proxy.wait_steady())
 
-        # Check if client was connected
-        if result == None:
-            return False
 
-        # Check if result is right:
-        if not result.startswith(RobotProxy.WAIT_STEADY):
-            self._error(f"Robot server problem when waiting for steadiness: {result}")
-            return False
+class CommandBatch(BatchCommands):
+    """
+    Batch of pipelined robot commands for the blocking proxy.
+
+    Usage:
+        batch = proxy.batch()
+        batch.movel(approach)
+        batch.movel(target)
+        batch.wait_steady()
+        batch.close_gripper()
+        success = batch.wait()
+    """
 
-        return True
+    def wait(self) -> bool:
+        """
+        Blocking method to wait for every queued command to be acknowledged.
+        Returns whether all the commands of the batch were executed successfully.
+        """
+        self._proxy.collect()
+        return all(f.result() for f in self._futures)
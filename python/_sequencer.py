@@ -1,100 +1,376 @@
-from time import sleep
+import asyncio
 import signal
+import sys
 
-from _robot_proxy import RobotProxy
-from _calibration import CalibrationData
+from _async_robot_proxy import AsyncRobotProxy
+from _calib_watcher import CalibrationWatcher
+from _calibration import BIN_SECTIONS, CalibrationData
+from _checkpoint import Checkpoint
 from _custom_logger import LoggingInterface
-from _state import Step, State
+from _inspection import Inspector
+from _journal import Journal, Verdict
+from _planner import RowOrderPlanner
+from _state import Bin, Step, State
+from _station import StationAccess
 from _custom_types import Pose, JointState
 
 
+# Sequencers waiting for the operator (the cells of a multi-cell server)
+_operator_waiters: list[asyncio.Future] = []
+
+
+def _on_operator_input() -> None:
+    line = sys.stdin.readline()
+    asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+    for waiter in _operator_waiters:
+        if not waiter.done():
+            waiter.set_result(line)
+    _operator_waiters.clear()
+
+
+async def _operator_input() -> str:
+    """
+    Read a line typed by the operator without blocking the event loop. The line
+    answers every sequencer waiting for it.
+    """
+    loop = asyncio.get_running_loop()
+    line = loop.create_future()
+    # Write the pending logs (e.g. the operator instructions) before reading
+    LoggingInterface.flush()
+
+    if len(_operator_waiters) == 0:
+        try:
+            loop.add_reader(sys.stdin.fileno(), _on_operator_input)
+        except (NotImplementedError, ValueError, OSError):
+            # Event loops without reader support (e.g. Windows)
+            return await loop.run_in_executor(None, input)
+
+    _operator_waiters.append(line)
+    try:
+        return await line
+    finally:
+        if line in _operator_waiters:
+            _operator_waiters.remove(line)
+            if len(_operator_waiters) == 0:
+                loop.remove_reader(sys.stdin.fileno())
+
+
 class CartridgeSequencer(LoggingInterface):
+    """
+    Cartridge handling sequence.
+
+    Approach poses are passed through with a blend radius, the arm only stops
+    where the gripper acts.
+
+    With overlap_inspection, the inspections run in the background of the robot
+    motions: the QR-Code verdict is computed while the robot goes to the defect
+    checking pose, and both verdicts while it goes back to the checking approach
+    pose (the pre-drop waypoint shared by both bins). Only the final move to the
+    bin waits on the results.
 
-    def __init__(self, proxy: RobotProxy, calib_path: str):
-        super().__init__("Sequencer")
+    With a station access, the inspection station is shared with other cells: the
+    robot waits at the checking approach pose until the station is admitted to
+    it, and frees it once back at this pose.
+
+    With step_macros, the grab and the drops are each run by the robot program
+    as one macro command (see AsyncRobotProxy.run_macro) instead of a batch of
+    primitive commands.
+
+    With watch_calibration, the calibration file is watched while the sequence
+    runs, and a new valid version is used from the next cartridge on (only the
+    pose tables of the changed bins are recomputed).
+    """
+
+    PREFIX = r"Sequencer"
+
+    # Blend radius when passing through an approach pose (m)
+    BLEND_RADIUS = 0.01
+
+    # Sequencers running in the process, all stopped by SIGTERM
+    __running: set["CartridgeSequencer"] = set()
+
+    def __init__(
+        self,
+        proxy: AsyncRobotProxy,
+        calib_path: str,
+        inspector: Inspector | None = None,
+        overlap_inspection: bool = False,
+        planner: RowOrderPlanner | None = None,
+        journal: Journal | None = None,
+        operator_input=None,
+        checkpoint: Checkpoint | None = None,
+        prefix: str = PREFIX,
+        station: StationAccess | None = None,
+        step_macros: bool = False,
+        watch_calibration: bool = False,
+    ):
+        super().__init__(prefix)
         self._proxy = proxy
+        self._inspector = inspector if inspector is not None else Inspector()
+        self._planner = planner if planner is not None else RowOrderPlanner()
+        self._journal = journal
+        self._checkpoint = checkpoint
+        self._station = station
+        self.__in_station = False
+        # Coroutine function returning once the operator is ready
+        self._operator_input = (
+            operator_input if operator_input is not None else _operator_input
+        )
+        self.overlap_inspection = overlap_inspection
+        self.step_macros = step_macros
         self.state = State(CalibrationData.load_from_file(calib_path))
+        self._calib_watcher = (
+            CalibrationWatcher(calib_path, self.state.calib, prefix=f"{prefix} calib")
+            if watch_calibration
+            else None
+        )
         self.STOP = False
-        signal.signal(signal.SIGTERM, self.stop_sequence)
+        self.__step_task: asyncio.Task | None = None
+        self.__qr_verdict: asyncio.Future | None = None
 
-    def stop_sequence(self, sig_n, frame) -> None:
-        self._error(f"Got signal {signal.strsignal(sig_n)}")
+    def stop_sequence(self, sig_n, frame=None) -> None:
+        self._error("Got signal %s", signal.strsignal(sig_n))
         self.STOP = True
+        if self.__step_task is not None:
+            self.__step_task.cancel()
+
+    @staticmethod
+    def __stop_all(sig_n, frame=None) -> None:
+        for sequencer in list(CartridgeSequencer.__running):
+            sequencer.stop_sequence(sig_n, frame)
 
-    def run(self):
+    def __install_signal_handler(self) -> None:
+        CartridgeSequencer.__running.add(self)
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, CartridgeSequencer.__stop_all, signal.SIGTERM
+            )
+        except NotImplementedError:
+            signal.signal(signal.SIGTERM, CartridgeSequencer.__stop_all)
+
+    async def run(self, resume: bool = False):
+        """
+        Run the sequence, with resume from the progress saved in the checkpoint.
+        """
         self._info("Beginning sequence!")
+        self.__install_signal_handler()
 
         self.state.step = Step.IDLE
+        if resume and self._checkpoint is not None:
+            if self._checkpoint.restore(self.state):
+                # The planner does not know where the robot is after a restart
+                self._planner.reset()
+            else:
+                self._info("Nothing to resume, starting a new tray")
         self.STOP = False
+        if self._calib_watcher is not None:
+            self._calib_watcher.start()
+        try:
+            await self.__run_steps()
+        finally:
+            CartridgeSequencer.__running.discard(self)
+            self.__leave_station()
+            if self._calib_watcher is not None:
+                await self._calib_watcher.stop()
+
+        if self._journal is not None:
+            self._journal.step(self.state.step)
+        if self._checkpoint is not None and self.state.step == Step.DONE:
+            self._checkpoint.record(self.state)
+
+    async def __run_steps(self) -> None:
         while self.state.step != Step.DONE and not self.STOP:
             # If no client, wait for a new one
             if not self._proxy.has_client():
-                self._proxy.wait_client()
+                await self._proxy.wait_client()
 
             match self.state.step:
                 case Step.IDLE:
-                    self.idle()
+                    handler = self.idle
                 case Step.MV_INPUT:
-                    self.go_input()
+                    handler = self.go_input
                 case Step.CHECK_QR:
-                    self.check_qr()
+                    handler = self.check_qr
                 case Step.CHECK_ANOMALIES:
-                    self.check_anomaly()
+                    handler = self.check_anomaly
                 case Step.MV_GOOD_BIN:
-                    self.go_good_bin()
+                    handler = self.go_good_bin
                 case Step.MV_BAD_BIN:
-                    self.go_bad_bin()
+                    handler = self.go_bad_bin
                 case Step.END_CARTRIDGE:
-                    self.cartridge_done()
+                    handler = self.cartridge_done
+
+            if self._journal is not None:
+                self._journal.step(self.state.step)
+            if self._checkpoint is not None:
+                self._checkpoint.record(self.state)
+
+            # Run the step as a task so that a stop request can interrupt it
+            self.__step_task = asyncio.create_task(handler())
+            try:
+                await self.__step_task
+            except asyncio.CancelledError:
+                if not self.STOP:
+                    raise
+            finally:
+                self.__step_task = None
 
-    def idle(self):
+    async def idle(self):
         """
         Robot is idle, should launch
         """
         self._info("Waiting for input to begin...")
-        input()
+        await self._operator_input()
+        self._planner.reset()
+        self.__next_cartridge()
+
+    def __next_cartridge(self) -> None:
+        """
+        Plan the input cell of the next cartridge, if any.
+        """
+        # If over to number of input cells, stop
+        if self.state.is_done():
+            self._info("Sequence is over, closing everything.")
+            self.state.step = Step.DONE
+            return
+
+        self.state.input_idx = self._planner.next_input(self.state)
         self.state.step = Step.MV_INPUT
 
-    def go_input(self):
+    def __journal_verdict(self, verdict: Verdict, future: asyncio.Future) -> None:
+        if self._journal is None:
+            return
+        journal = self._journal
+        future.add_done_callback(
+            lambda f: f.cancelled() or journal.verdict(verdict, bool(f.result()))
+        )
+
+    async def __enter_station(self) -> None:
+        """
+        Wait for the shared inspection station, the robot being at the checking
+        approach pose.
+        """
+        if self._station is None or self.__in_station:
+            return
+        await self._station.acquire()
+        self.__in_station = True
+
+    def __leave_station(self) -> None:
+        if self.__in_station:
+            self._station.release()
+            self.__in_station = False
+
+    def __blend(self, dz: float) -> float:
+        """
+        Blend radius for an approach pose dz above the target, small enough for
+        the blend not to reach the target.
+        """
+        return min(CartridgeSequencer.BLEND_RADIUS, dz / 2)
+
+    async def __plan_drop(self, bin: Bin) -> int:
+        """
+        Plan the output cell of the current cartridge, waiting for the operator to
+        empty the bin if it is full.
+        """
+        idx = self._planner.next_drop(self.state, bin)
+        if idx is None:
+            self._warn("%s bin is full, empty it to continue...", bin.name.capitalize())
+            await self._operator_input()
+            occupancy = self.state.occupancy(bin)
+            occupancy[:] = [False] * len(occupancy)
+            idx = self._planner.next_drop(self.state, bin)
+        return idx
+
+    async def go_input(self):
         """
         Let's go to input
         """
         self._info("Going to input bin")
-        self._proxy.open_gripper()
-        self._proxy.movel(self.state.get_input_grabbing_approach_pos())
-        self._proxy.movel(self.state.get_input_grabbing_pos())
-        self._proxy.wait_steady()
-        self._proxy.close_gripper()
-        sleep(0.05)
-        self._proxy.movel(self.state.get_input_grabbing_approach_pos())
+        dz = self.state.calib.input_bin.dz
+        blend = self.__blend(dz)
+        if self.step_macros:
+            await self._proxy.run_macro(
+                self._proxy.PICK,
+                [
+                    self.state.get_input_grabbing_pos(),
+                    dz,
+                    blend,
+                    self.state.get_checking_approach_pos(),
+                ],
+            )
+        else:
+            batch = self._proxy.batch()
+            batch.open_gripper()
+            batch.movel_path(
+                [
+                    self.state.get_input_grabbing_approach_pos(),
+                    self.state.get_input_grabbing_pos(),
+                ],
+                [blend, 0],
+            )
+            batch.wait_steady()
+            batch.close_gripper()
+            batch.movel_path(
+                [
+                    self.state.get_input_grabbing_approach_pos(),
+                    self.state.get_checking_approach_pos(),
+                ],
+                [blend, 0],
+            )
+            await batch.wait()
+        self.state.input_taken[self.state.input_idx] = True
         self.state.step = Step.CHECK_QR
 
-    def check_qr(self):
+    async def check_qr(self):
         """
         Checking the QR codegood
         """
         self._info("Checking cartridge QR-Code")
-        self._proxy.movel(self.state.get_checking_approach_pos())
-        self._proxy.movej(self.state.get_qr_checking_pos())
-        self._proxy.wait_steady()
-        # TODO: Check QR Code
-        defect = False
+        batch = self._proxy.batch()
+        batch.movel(self.state.get_checking_approach_pos())
+        if self._station is not None:
+            await batch.wait()
+            await self.__enter_station()
+            batch = self._proxy.batch()
+        batch.movej(self.state.get_qr_checking_pos())
+        batch.steady()
+        await batch.wait()
+        self.__qr_verdict = await self._inspector.start_qr_check()
+        self.__journal_verdict(Verdict.QR, self.__qr_verdict)
+
+        # Let the verdict come while moving to the next check
+        if self.overlap_inspection:
+            self.state.step = Step.CHECK_ANOMALIES
+            return
+
+        defect = await self.__qr_verdict
         if defect:
             self._info("QR-Code anomaly detected, moving it to the defect bin!")
             self.state.step = Step.MV_BAD_BIN
+            # Leave the shared station the way the other robots expect
+            if self.__in_station:
+                await self._proxy.movel(self.state.get_checking_approach_pos())
+                self.__leave_station()
         else:
             self._info("No anomalies for the QR-Code, continuing checking")
             self.state.step = Step.CHECK_ANOMALIES
 
-    def check_anomaly(self):
+    async def check_anomaly(self):
         """
         Checking for anomalies
         """
+        if self.overlap_inspection:
+            await self.__check_anomaly_overlapped()
+            return
+
         self._info("Checking for anomalies")
-        self._proxy.movej(self.state.get_defect_checking_pos())
-        self._proxy.wait_steady()
-        # TODO: Check defects
-        defect = True
+        batch = self._proxy.batch()
+        batch.movej(self.state.get_defect_checking_pos())
+        batch.steady()
+        await batch.wait()
+        defect_verdict = await self._inspector.start_defect_check()
+        self.__journal_verdict(Verdict.DEFECT, defect_verdict)
+        defect = await defect_verdict
         if defect:
             self._info("Cartridge anomaly detected, moving it to the defect bin.")
             self.state.step = Step.MV_BAD_BIN
@@ -102,44 +378,118 @@ class CartridgeSequencer(LoggingInterface):
             self._info("No cartridge anomaly detected, moving it to the good  bin.")
             self.state.step = Step.MV_GOOD_BIN
 
-        self._proxy.movel(self.state.get_checking_approach_pos())
+        await self._proxy.movel(self.state.get_checking_approach_pos())
+        self.__leave_station()
 
-    def go_good_bin(self):
+    async def __check_anomaly_overlapped(self):
+        """
+        Checking for anomalies while the QR-Code verdict is pending, then going to
+        the pre-drop waypoint while the verdicts are computed.
+        """
+        qr_verdict = self.__qr_verdict
+        self.__qr_verdict = None
+        if qr_verdict is None:
+            # Not coming from the overlapped QR-Code check (e.g. resumed run)
+            self._warn("No pending QR-Code verdict, checking the QR-Code again")
+            self.state.step = Step.CHECK_QR
+            return
+
+        # No need to look for anomalies if the QR-Code was already rejected
+        defect_verdict = None
+        if not (qr_verdict.done() and qr_verdict.result()):
+            self._info("Checking for anomalies")
+            batch = self._proxy.batch()
+            batch.movej(self.state.get_defect_checking_pos())
+            batch.steady()
+            await batch.wait()
+            defect_verdict = await self._inspector.start_defect_check()
+            self.__journal_verdict(Verdict.DEFECT, defect_verdict)
+
+        pre_drop = self._proxy.submit(
+            self._proxy.movel_cmd(self.state.get_checking_approach_pos()),
+            self._proxy.MOVE_L_RESP,
+        )
+
+        if await qr_verdict:
+            self._info("QR-Code anomaly detected, moving it to the defect bin!")
+            self.state.step = Step.MV_BAD_BIN
+        elif await defect_verdict:
+            self._info("Cartridge anomaly detected, moving it to the defect bin.")
+            self.state.step = Step.MV_BAD_BIN
+        else:
+            self._info("No cartridge anomaly detected, moving it to the good  bin.")
+            self.state.step = Step.MV_GOOD_BIN
+
+        await pre_drop
+        self.__leave_station()
+
+    async def __drop(self, pose: Pose, approach: Pose, dz: float) -> None:
+        """
+        Drop the cartridge at pose, through the approach pose dz above it.
+        """
+        blend = self.__blend(dz)
+        if self.step_macros:
+            await self._proxy.run_macro(self._proxy.PLACE, [pose, dz, blend])
+        else:
+            batch = self._proxy.batch()
+            batch.movel_path([approach, pose], [blend, 0])
+            batch.wait_steady()
+            batch.open_gripper()
+            batch.movel(approach)
+            await batch.wait()
+
+    async def go_good_bin(self):
         """
         Go to the good bin
         """
+        self.state.good_idx = await self.__plan_drop(Bin.GOOD)
         self._info("Dropping inside good bin")
-        self._proxy.movel(self.state.get_good_dropping_approach_pos())
-        self._proxy.movel(self.state.get_good_dropping_pos())
-        self._proxy.wait_steady()
-        self._proxy.open_gripper()
-        sleep(0.05)
-        self._proxy.movel(self.state.get_good_dropping_approach_pos())
+        await self.__drop(
+            self.state.get_good_dropping_pos(),
+            self.state.get_good_dropping_approach_pos(),
+            self.state.calib.good_bin.dz,
+        )
+        self.state.good_occupied[self.state.good_idx] = True
         self.state.step = Step.END_CARTRIDGE
 
-    def go_bad_bin(self):
+    async def go_bad_bin(self):
         """
         Go to the bad bin
         """
+        self.state.defect_idx = await self.__plan_drop(Bin.DEFECT)
         self._info("Dropping inside defect bin")
-        self._proxy.movel(self.state.get_defect_dropping_approach_pos())
-        self._proxy.movel(self.state.get_defect_dropping_pos())
-        self._proxy.wait_steady()
-        self._proxy.open_gripper()
-        sleep(0.05)
-        self._proxy.movel(self.state.get_defect_dropping_approach_pos())
+        await self.__drop(
+            self.state.get_defect_dropping_pos(),
+            self.state.get_defect_dropping_approach_pos(),
+            self.state.calib.defect_bin.dz,
+        )
+        self.state.defect_occupied[self.state.defect_idx] = True
         self.state.step = Step.END_CARTRIDGE
 
-    def cartridge_done(self):
+    async def cartridge_done(self):
         """
         The cartridge is done, now what ?
         """
-        self.state.input_idx += 1
-
-        # If over to number of input cells, stop
-        if self.state.is_done():
-            self._info("Sequence is over, closing everything.")
-            self.state.step = Step.DONE
-        else:
+        self.__reload_calibration()
+        if not self.state.is_done():
             self._info("Cartridge done, moving on to the next one.")
-            self.state.step = Step.MV_INPUT
+        self.__next_cartridge()
+
+    def __reload_calibration(self) -> None:
+        """
+        Use the new calibration validated by the watcher, if any. Called between
+        two cartridges, when no cell index is in use.
+        """
+        if self._calib_watcher is None:
+            return
+        calib = self._calib_watcher.take()
+        if calib is None:
+            return
+        old = self.state.calib
+        changed = [
+            name
+            for name, attr in BIN_SECTIONS.items()
+            if getattr(calib, attr) != getattr(old, attr)
+        ]
+        self.state.set_calibration(calib)
+        self._info("Calibration reloaded, changed bins: %s", changed or "none")
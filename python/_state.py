@@ -1,8 +1,7 @@
 from dataclasses import dataclass
 from enum import Enum
-from copy import deepcopy
 
-from _calibration import CalibrationData
+from _calibration import BinCalibration, CalibrationData
 from _custom_types import Pose, JointState
 
 
@@ -17,17 +16,112 @@ class Step(Enum):
     DONE = 7
 
 
+class Bin(Enum):
+    INPUT = 0
+    GOOD = 1
+    DEFECT = 2
+
+
+# Index of the poses in a cell entry of a bin pose table
+GRAB = 0
+APPROACH = 1
+
+BinPoses = tuple[tuple[Pose, Pose], ...]
+
+
+def compute_bin_poses(bin: BinCalibration) -> BinPoses:
+    """
+    Compute the grabbing/dropping pose and the approach pose of every cell of a bin.
+    Cells are in traversal order, going with row first, then col: cell i is at
+    row i // ncol and column i % ncol, rows going along x and columns along y (in
+    the frame of the bin, rotated by bin.rot around z).
+    """
+    poses = []
+    for row in range(bin.nrow):
+        for col in range(bin.ncol):
+            x, y = bin.cell(row, col)
+            z = bin.origin.z
+            poses.append((Pose(x, y, z, 0, 0, 0), Pose(x, y, z + bin.dz, 0, 0, 0)))
+    return tuple(poses)
+
+
 @dataclass
 class State:
     calib: CalibrationData
+    # Cells targeted for the state's cartridge
     input_idx: int = 0
+    good_idx: int = 0
+    defect_idx: int = 0
     step: Step = Step.IDLE
 
+    def __post_init__(self) -> None:
+        self.__input_poses: BinPoses = ()
+        self.__good_poses: BinPoses = ()
+        self.__defect_poses: BinPoses = ()
+        self.__checking_approach = Pose(0, 0, 0, 0, 0, 0)
+
+        # Cell occupancy: input cells already taken, output cells already filled
+        self.input_taken: list[bool] = []
+        self.good_occupied: list[bool] = []
+        self.defect_occupied: list[bool] = []
+        self.set_calibration(self.calib, force=True)
+
+    def set_calibration(self, calib: CalibrationData, force: bool = False) -> None:
+        """
+        Use a new calibration, only recomputing the pose tables of the bins whose
+        calibration changed.
+        """
+        old = self.calib
+        self.calib = calib
+        if force or calib.input_bin != old.input_bin:
+            self.__input_poses = compute_bin_poses(calib.input_bin)
+            self.input_taken = State.__resized(self.input_taken, self.__input_poses)
+        if force or calib.good_bin != old.good_bin:
+            self.__good_poses = compute_bin_poses(calib.good_bin)
+            self.good_occupied = State.__resized(self.good_occupied, self.__good_poses)
+        if force or calib.defect_bin != old.defect_bin:
+            self.__defect_poses = compute_bin_poses(calib.defect_bin)
+            self.defect_occupied = State.__resized(
+                self.defect_occupied, self.__defect_poses
+            )
+
+        p = calib.checking_approach
+        self.__checking_approach = Pose(p.x, p.y, p.z, 0, 0, 0)
+
+    @staticmethod
+    def __resized(occupancy: list[bool], poses: BinPoses) -> list[bool]:
+        return (occupancy + [False] * len(poses))[: len(poses)]
+
     def n_cells(self) -> int:
         return self.calib.input_bin.ncol * self.calib.input_bin.nrow
 
     def is_done(self) -> bool:
-        return self.n_cells() <= self.input_idx
+        return all(self.input_taken)
+
+    def poses(self, bin: Bin) -> BinPoses:
+        """
+        Get the pose table of a bin, one (grab/drop, approach) entry per cell.
+        """
+        match bin:
+            case Bin.INPUT:
+                return self.__input_poses
+            case Bin.GOOD:
+                return self.__good_poses
+            case Bin.DEFECT:
+                return self.__defect_poses
+
+    def occupancy(self, bin: Bin) -> list[bool]:
+        """
+        Get the occupancy of the cells of a bin (for the input bin, whether the
+        cartridge of the cell was already taken).
+        """
+        match bin:
+            case Bin.INPUT:
+                return self.input_taken
+            case Bin.GOOD:
+                return self.good_occupied
+            case Bin.DEFECT:
+                return self.defect_occupied
 
     # =========================================================================
     # Input move position computations
@@ -35,19 +129,14 @@ class State:
     def get_input_grabbing_pos(self) -> Pose:
         """
         Get the input grabbing position for the state's cartridge.
-        Goes with row first, then col.
         """
-        p = deepcopy(self.calib.input_bin.origin)
-        return Pose(p.x, p.y, p.z, 0, 0, 0)
+        return self.__input_poses[self.input_idx][GRAB]
 
     def get_input_grabbing_approach_pos(self) -> Pose:
         """
         Get the input grabbing approaching position for the state's cartridge.
-        Goes with row first, then col.
         """
-        p = self.get_input_grabbing_pos()
-        p.z += self.calib.input_bin.dz
-        return p
+        return self.__input_poses[self.input_idx][APPROACH]
 
     # =========================================================================
     # Good Output position computations
@@ -55,39 +144,30 @@ class State:
     def get_good_dropping_pos(self) -> Pose:
         """
         Get the good output bin dropping position for the state's cartridge.
-        Goes with row first, then col.
         """
-        p = deepcopy(self.calib.good_bin.origin)
-        return Pose(p.x, p.y, p.z, 0, 0, 0)
+        return self.__good_poses[self.good_idx][GRAB]
 
     def get_good_dropping_approach_pos(self) -> Pose:
         """
         Get the good output bin dropping approaching position for the state's cartridge.
-        Goes with row first, then col.
         """
-        p = self.get_good_dropping_pos()
-        p.z += self.calib.good_bin.dz
-        return p
+        return self.__good_poses[self.good_idx][APPROACH]
 
     # =========================================================================
     # Bad Output position computations
     # =========================================================================
     def get_defect_dropping_pos(self) -> Pose:
         """
-        Get the good output bin dropping position for the state's cartridge.
-        Goes with row first, then col.
+        Get the defect output bin dropping position for the state's cartridge.
         """
-        p = deepcopy(self.calib.defect_bin.origin)
-        return Pose(p.x, p.y, p.z, 0, 0, 0)
+        return self.__defect_poses[self.defect_idx][GRAB]
 
     def get_defect_dropping_approach_pos(self) -> Pose:
         """
-        Get the good output bin dropping approaching position for the state's cartridge.
-        Goes with row first, then col.
+        Get the defect output bin dropping approaching position for the state's
+        cartridge.
         """
-        p = self.get_defect_dropping_pos()
-        p.z += self.calib.defect_bin.dz
-        return p
+        return self.__defect_poses[self.defect_idx][APPROACH]
 
     # =========================================================================
     # Calibration positions
@@ -96,8 +176,7 @@ class State:
         """
         Get the checking approaching position.
         """
-        p = deepcopy(self.calib.checking_approach)
-        return Pose(p.x, p.y, p.z, 0, 0, 0)
+        return self.__checking_approach
 
     def get_qr_checking_pos(self) -> JointState:
         """
@@ -0,0 +1,233 @@
+import asyncio
+import struct
+from array import array
+from dataclasses import dataclass
+
+from _custom_types import JointState, Pose
+from _custom_logger import LoggingInterface
+
+
+@dataclass
+class RobotState:
+    """
+    One sample of the robot state stream.
+    """
+
+    seq: int
+    # Event loop time at which the sample was received
+    stamp: float
+    joints: JointState
+    tcp: Pose
+    steady: bool
+
+
+class RobotStateStream(LoggingInterface):
+    """
+    Server of the robot state streaming channel.
+
+    A thread of the robot program connects to this socket and pushes its state at a
+    fixed rate, as frames of big-endian int32:
+        [seq, q1, ..., q6, x, y, z, rx, ry, rz, steady]
+    with the joints and the pose in fixed point (millionths of radian / meter).
+
+    Samples are written in a preallocated ring buffer by the receiving task. The
+    writer only publishes a slot (by incrementing the sample count) once it is fully
+    written, so readers copy the latest slot without any lock, and check it was not
+    overwritten meanwhile.
+    """
+
+    PREFIX = r"StateStream"
+
+    FRAME = struct.Struct(">14i")
+    SCALE = 1e6
+    DEFAULT_CAPACITY = 256
+    # A sample older than this is not used in place of a robot request
+    MAX_AGE = 0.1
+
+    # Layout of a ring slot
+    SEQ = 0
+    STAMP = 1
+    JOINTS = 2
+    TCP = 8
+    STEADY = 14
+    SLOT_SIZE = 15
+
+    def __init__(
+        self, srv_ip: str, srv_port: int, capacity: int = DEFAULT_CAPACITY
+    ) -> None:
+        super().__init__(RobotStateStream.PREFIX)
+        self.__binding_ip = (srv_ip, srv_port)
+        self.__server: asyncio.Server | None = None
+        self.__reader_task: asyncio.Task | None = None
+        self.__writer: asyncio.StreamWriter | None = None
+
+        self.__capacity = capacity
+        self.__ring = array("d", bytes(8 * capacity * RobotStateStream.SLOT_SIZE))
+        self.__count = 0
+        self.__waiters: list[asyncio.Future] = []
+
+    # =========================================================================
+    # Socket
+    # =========================================================================
+
+    async def open_socket(self) -> None:
+        self.__server = await asyncio.start_server(self.__on_client, *self.__binding_ip)
+
+    def __on_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # Only one robot streams at a time, the newest connection wins
+        self.__disconnect()
+        self._info("State stream from %s", writer.get_extra_info("peername"))
+        self.__writer = writer
+        self.__reader_task = asyncio.create_task(self.__read_samples(reader))
+
+    def is_connected(self) -> bool:
+        """
+        Return True if a robot is streaming its state.
+        """
+        return self.__writer is not None
+
+    async def __read_samples(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                frame = await reader.readexactly(RobotStateStream.FRAME.size)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            self.__push(RobotStateStream.FRAME.unpack(frame))
+
+        self._warn("State stream lost!")
+        self.__writer = None
+        self.__wake_waiters()
+
+    def __disconnect(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+        if self.__reader_task is not None:
+            self.__reader_task.cancel()
+            self.__reader_task = None
+
+    async def close(self) -> None:
+        """
+        Close the stream connection and the socket server.
+        """
+        self.__disconnect()
+        self.__wake_waiters()
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    # =========================================================================
+    # Ring buffer
+    # =========================================================================
+
+    def __push(self, frame: tuple[int, ...]) -> None:
+        ring = self.__ring
+        base = (self.__count % self.__capacity) * RobotStateStream.SLOT_SIZE
+        ring[base + RobotStateStream.SEQ] = frame[0]
+        ring[base + RobotStateStream.STAMP] = asyncio.get_running_loop().time()
+        # Joints then TCP pose, contiguous in both the frame and the slot
+        joints = base + RobotStateStream.JOINTS
+        for i in range(12):
+            ring[joints + i] = frame[1 + i] / RobotStateStream.SCALE
+        ring[base + RobotStateStream.STEADY] = frame[13]
+
+        # Publish the slot once complete
+        self.__count += 1
+        self.__wake_waiters()
+
+    def __wake_waiters(self) -> None:
+        waiters, self.__waiters = self.__waiters, []
+        for w in waiters:
+            if not w.done():
+                w.set_result(None)
+
+    def __read_slot(self, count: int) -> RobotState | None:
+        """
+        Copy the count-th sample (1 for the first one), None if it was overwritten.
+        """
+        base = ((count - 1) % self.__capacity) * RobotStateStream.SLOT_SIZE
+        slot = self.__ring[base : base + RobotStateStream.SLOT_SIZE]
+        if self.__count - count >= self.__capacity:
+            return None
+        j, t = RobotStateStream.JOINTS, RobotStateStream.TCP
+        return RobotState(
+            int(slot[RobotStateStream.SEQ]),
+            slot[RobotStateStream.STAMP],
+            JointState(*slot[j : j + 6]),
+            Pose(*slot[t : t + 6]),
+            slot[RobotStateStream.STEADY] != 0,
+        )
+
+    def n_samples(self) -> int:
+        """
+        Return the number of samples received since the creation of the stream.
+        """
+        return self.__count
+
+    def latest(self, max_age: float | None = None) -> RobotState | None:
+        """
+        Return the latest sample, None if there is none or if it is older than
+        max_age seconds.
+        """
+        count = self.__count
+        if count == 0:
+            return None
+        sample = self.__read_slot(count)
+        if sample is None:
+            return None
+        now = asyncio.get_running_loop().time()
+        if max_age is not None and now - sample.stamp > max_age:
+            return None
+        return sample
+
+    def history(self, n: int) -> list[RobotState]:
+        """
+        Return up to the n latest samples still in the ring, oldest first.
+        """
+        count = self.__count
+        n = min(n, count, self.__capacity)
+        samples = [self.__read_slot(c) for c in range(count - n + 1, count + 1)]
+        return [s for s in samples if s is not None]
+
+    def is_fresh(self, max_age: float = MAX_AGE) -> bool:
+        """
+        Return True if the robot is streaming and its latest sample is recent enough
+        to be used in place of a robot request.
+        """
+        return self.is_connected() and self.latest(max_age) is not None
+
+    async def next_sample(self) -> RobotState | None:
+        """
+        Wait for the next sample, None if the stream is lost meanwhile.
+        """
+        count = self.__count
+        future = asyncio.get_running_loop().create_future()
+        self.__waiters.append(future)
+        await future
+        if self.__count == count:
+            return None
+        return self.latest()
+
+    async def wait_steady(self, timeout: float | None = None) -> bool | None:
+        """
+        Wait until a sample received after the call reports the robot steady.
+        Returns True once steady, False on timeout, None if the stream is lost.
+        """
+
+        async def steady() -> bool | None:
+            sample = await self.next_sample()
+            if sample is None:
+                return None
+            while not sample.steady:
+                sample = await self.next_sample()
+                if sample is None:
+                    return None
+            return True
+
+        try:
+            return await asyncio.wait_for(steady(), timeout)
+        except asyncio.TimeoutError:
+            return False
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+from _custom_logger import LoggingInterface
+from _latency import LatencyHistogram
+
+
+class StationAccess:
+    """
+    Access of one cell to the shared inspection station, with its statistics.
+    """
+
+    def __init__(self, station: "InspectionStation", cell_id: str) -> None:
+        self.__station = station
+        self.cell_id = cell_id
+        # Expected time holding the station (s), learnt from the previous slots
+        self.expected_hold = 0.0
+        self.wait = LatencyHistogram()
+        self.n_slots = 0
+        self.hold_time = 0.0
+
+    async def acquire(self) -> None:
+        """
+        Wait until the station is admitted to this cell.
+        """
+        await self.__station._acquire(self)
+
+    def release(self) -> None:
+        """
+        Free the station, the robot left it.
+        """
+        self.__station._release(self)
+
+    def summary(self) -> dict:
+        return {
+            "slots": self.n_slots,
+            "hold_mean": self.hold_time / self.n_slots if self.n_slots > 0 else 0.0,
+            "wait": self.wait.summary(),
+        }
+
+
+class _Request:
+    __slots__ = ("access", "granted", "bypassed")
+
+    def __init__(self, access: StationAccess, granted: asyncio.Future) -> None:
+        self.access = access
+        self.granted = granted
+        self.bypassed = 0
+
+
+class InspectionStation(LoggingInterface):
+    """
+    Reservation of an inspection station (QR-Code reader and anomaly camera)
+    shared by the robots of several cells.
+
+    A robot holds the station from its checking approach pose to its return to
+    it. While the station is busy, the other robots wait at their checking
+    approach pose. When it is freed, the waiting robot expected to hold it for
+    the shortest time is admitted (shortest job first minimizes the total waiting
+    time), the expected time of each cell being learnt from its previous slots.
+    A robot is never overtaken more than MAX_BYPASS times. With
+    shortest_first=False, robots are admitted in arrival order.
+
+    The clock (time.monotonic by default) can be replaced, e.g. by the virtual
+    clock of the simulated robots.
+    """
+
+    PREFIX = r"Station"
+
+    # Weight of the last slot in the expected holding time of a cell
+    HOLD_SMOOTHING = 0.3
+    MAX_BYPASS = 3
+
+    def __init__(
+        self, shortest_first: bool = True, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        super().__init__(InspectionStation.PREFIX)
+        self.shortest_first = shortest_first
+        self.__clock = clock
+        self.cells: dict[str, StationAccess] = {}
+        self.__holder: StationAccess | None = None
+        self.__held_since = 0.0
+        self.__waiting: list[_Request] = []
+        self.__start: float | None = None
+        self.__busy = 0.0
+
+    def add_cell(self, cell_id: str) -> StationAccess:
+        access = StationAccess(self, cell_id)
+        self.cells[cell_id] = access
+        return access
+
+    def holder(self) -> str | None:
+        """
+        Cell holding the station, None if it is free.
+        """
+        return self.__holder.cell_id if self.__holder is not None else None
+
+    def __grant(self, access: StationAccess) -> None:
+        self.__holder = access
+        self.__held_since = self.__clock()
+        access.n_slots += 1
+
+    async def _acquire(self, access: StationAccess) -> None:
+        now = self.__clock()
+        if self.__start is None:
+            self.__start = now
+        if self.__holder is None and len(self.__waiting) == 0:
+            access.wait.record(0)
+            self.__grant(access)
+            return
+
+        request = _Request(access, asyncio.get_running_loop().create_future())
+        self.__waiting.append(request)
+        self._debug("Cell %s waiting for the station", access.cell_id)
+        try:
+            await request.granted
+        except asyncio.CancelledError:
+            if request in self.__waiting:
+                self.__waiting.remove(request)
+            elif self.__holder is access:
+                self._release(access)
+            raise
+        access.wait.record(round((self.__clock() - now) * 1e9))
+
+    def _release(self, access: StationAccess) -> None:
+        if self.__holder is not access:
+            return
+        hold = self.__clock() - self.__held_since
+        self.__busy += hold
+        access.hold_time += hold
+        if access.n_slots == 1:
+            access.expected_hold = hold
+        else:
+            access.expected_hold += InspectionStation.HOLD_SMOOTHING * (
+                hold - access.expected_hold
+            )
+
+        self.__holder = None
+        if len(self.__waiting) > 0:
+            request = self.__next()
+            self.__waiting.remove(request)
+            self.__grant(request.access)
+            request.granted.set_result(None)
+
+    def __next(self) -> _Request:
+        """
+        Choose the next robot admitted (waiting list in arrival order).
+        """
+        first = self.__waiting[0]
+        if not self.shortest_first or first.bypassed >= InspectionStation.MAX_BYPASS:
+            return first
+
+        chosen = min(self.__waiting, key=lambda r: r.access.expected_hold)
+        for request in self.__waiting:
+            if request is chosen:
+                break
+            request.bypassed += 1
+        return chosen
+
+    def utilisation(self) -> float:
+        """
+        Fraction of the time the station was held since its first request.
+        """
+        if self.__start is None:
+            return 0.0
+        busy = self.__busy
+        if self.__holder is not None:
+            busy += self.__clock() - self.__held_since
+        elapsed = self.__clock() - self.__start
+        return busy / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        """
+        Utilisation of the station, and slots, mean holding time (s) and waiting
+        times (ms) of each cell.
+        """
+        return {
+            "utilisation": self.utilisation(),
+            "cells": {cell: a.summary() for cell, a in self.cells.items()},
+        }
@@ -0,0 +1,285 @@
+import struct
+from collections import deque
+
+from _custom_logger import LoggingInterface
+
+
+class ReplyBuffer:
+    """
+    Persistent receive buffer for the robot client connection.
+    Incoming bytes are accumulated and split on the line end incrementally, so
+    replies split across several TCP segments are put back together and extra
+    replies received in the same segment are kept for the next caller.
+
+    The robot program probes its socket by sending a NUL byte once per main loop
+    (is_open in robot/RBTch-socket.script), these bytes are dropped.
+    """
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self, line_end: str) -> None:
+        self.__sep = line_end.encode()
+        self.__buffer = bytearray()
+        self.__scan_from = 0
+        self.__replies: deque[str] = deque()
+
+    def clear(self) -> None:
+        """
+        Drop every buffered byte and reply (e.g. when the client changes).
+        """
+        self.__buffer.clear()
+        self.__scan_from = 0
+        self.__replies.clear()
+
+    def pending(self) -> int:
+        """
+        Return the number of complete replies waiting to be popped.
+        """
+        return len(self.__replies)
+
+    def buffered(self) -> int:
+        """
+        Return the number of bytes of the partial reply being received.
+        """
+        return len(self.__buffer)
+
+    def pop(self) -> str | None:
+        """
+        Return the oldest complete reply, or None if no full frame was received yet.
+        """
+        if len(self.__replies) == 0:
+            return None
+        return self.__replies.popleft()
+
+    def feed(self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append raw bytes to the buffer and extract every complete reply.
+        """
+        start = len(self.__buffer)
+        self.__buffer += data
+        # Drop the socket probes, the bytes already buffered have none
+        if self.__buffer.find(0, start) != -1:
+            self.__buffer[start:] = self.__buffer[start:].replace(b"\x00", b"")
+
+        consumed = 0
+        with memoryview(self.__buffer) as view:
+            end = self.__buffer.find(self.__sep, self.__scan_from)
+            while end != -1:
+                reply = str(view[consumed:end], "utf-8").strip()
+                if len(reply) > 0:
+                    self.__replies.append(reply)
+                consumed = end + len(self.__sep)
+                end = self.__buffer.find(self.__sep, consumed)
+
+        # Only keep the partial frame, and resume the search where it stopped
+        if consumed > 0:
+            del self.__buffer[:consumed]
+        self.__scan_from = max(0, len(self.__buffer) - len(self.__sep) + 1)
+
+
+class TextProtocol(ReplyBuffer):
+    """
+    Text wire protocol: comma separated fields, messages ended by the line end.
+    """
+
+    def __init__(self, line_end: str) -> None:
+        super().__init__(line_end)
+        self.__line_end = line_end
+
+    def encode(self, msg: str) -> bytes:
+        return f"{msg}{self.__line_end}".encode()
+
+
+class BinaryProtocol:
+    """
+    Binary wire protocol, negotiated with the robot client.
+
+    Every message is a fixed-size frame of big-endian int32: an opcode, a sequence
+    id and six values in fixed point (millionths of meter / radian), which the
+    URScript side reads with socket_read_binary_integer. The robot echoes the
+    opcode and the sequence id of each command in its reply (opcode -1 for an
+    unknown command).
+
+    A blended path is a header frame (n, r1, ..., r4) followed by n waypoint frames.
+    A step macro is a header frame (macro id, n) followed by its n values, six per
+    waypoint frame.
+
+    A steadiness event is pushed by the robot as a std frame with the sequence id
+    EVENT_SEQ and the move id as first value, it answers no command.
+
+    The NUL bytes probing the socket (see ReplyBuffer) also come between the
+    frames: a frame boundary not starting with a reply opcode is resynchronised on
+    the next byte.
+
+    Commands and replies are translated from/to their text form at the wire, so
+    the proxy matches and parses replies the same way in both protocols.
+    """
+
+    FRAME = struct.Struct(">8i")
+    SCALE = 1e6
+    INT32_MAX = 2**31 - 1
+
+    # Text command -> opcode
+    OPCODES = {
+        "gjp": 1,
+        "gtp": 2,
+        "mvj": 3,
+        "mvl": 4,
+        "gop": 5,
+        "gcl": 6,
+        "std": 7,
+        "stp": 8,
+        "mvp": 9,
+        "mcr": 11,
+    }
+    WAYPOINT = 10
+    # Step macro name -> id
+    MACROS = {"pck": 1, "plc": 2}
+
+    # Opcode -> text acknowledgement
+    ACKS = {
+        3: "mvjok",
+        4: "mvlok",
+        5: "gop",
+        6: "gcl",
+        7: "std",
+        8: "stpok",
+        9: "mvpok",
+        11: "mcrok",
+    }
+    VALUE_REPLIES = (1, 2)
+    UNKNOWN = -1
+    REPLY_OPCODES = {*ACKS, *VALUE_REPLIES, UNKNOWN}
+    OPCODE = struct.Struct(">i")
+    MAX_PATH_LEN = 4
+    EVENT_SEQ = -1
+    STEADY = 7
+
+    def __init__(self) -> None:
+        self.__buffer = bytearray()
+        self.__replies: deque[str] = deque()
+        self.__sent: deque[int] = deque()
+        self.__seq = 0
+
+    def clear(self) -> None:
+        self.__buffer.clear()
+        self.__replies.clear()
+        self.__sent.clear()
+
+    def pending(self) -> int:
+        return len(self.__replies)
+
+    def buffered(self) -> int:
+        return len(self.__buffer)
+
+    def pop(self) -> str | None:
+        if len(self.__replies) == 0:
+            return None
+        return self.__replies.popleft()
+
+    # =========================================================================
+    # Encoding
+    # =========================================================================
+
+    def encode(self, msg: str) -> bytes:
+        """
+        Encode a text command into its binary frames.
+        Raise a ValueError if the command has no binary form.
+        """
+        fields = msg.split(",")
+        opcode = BinaryProtocol.OPCODES.get(fields[0])
+        if opcode is None:
+            raise ValueError(f"No binary form for command '{msg}'")
+
+        self.__seq = (self.__seq + 1) & BinaryProtocol.INT32_MAX
+        self.__sent.append(self.__seq)
+
+        if opcode == BinaryProtocol.OPCODES["mcr"]:
+            return self.__macro(opcode, fields[1], fields[2:])
+        if opcode != BinaryProtocol.OPCODES["mvp"]:
+            return self.__frame(opcode, BinaryProtocol.__scaled(fields[1:]))
+
+        # Blended path: header with the blend radii, then the waypoints
+        n = int(fields[1])
+        if not 0 < n <= BinaryProtocol.MAX_PATH_LEN:
+            raise ValueError(f"Cannot encode a path of {n} waypoints")
+        waypoints = [fields[2 + 7 * i : 9 + 7 * i] for i in range(n)]
+        header = [n] + BinaryProtocol.__scaled([w[6] for w in waypoints])
+        frames = [self.__frame(opcode, header)]
+        for w in waypoints:
+            frames.append(
+                self.__frame(BinaryProtocol.WAYPOINT, BinaryProtocol.__scaled(w[:6]))
+            )
+        return b"".join(frames)
+
+    def __macro(self, opcode: int, name: str, values: list[str]) -> bytes:
+        macro = BinaryProtocol.MACROS.get(name)
+        if macro is None:
+            raise ValueError(f"No binary form for macro '{name}'")
+        ints = BinaryProtocol.__scaled(values)
+        frames = [self.__frame(opcode, [macro, len(ints)])]
+        for i in range(0, len(ints), 6):
+            frames.append(self.__frame(BinaryProtocol.WAYPOINT, ints[i : i + 6]))
+        return b"".join(frames)
+
+    @staticmethod
+    def __scaled(values: list[str]) -> list[int]:
+        ints = [round(float(v) * BinaryProtocol.SCALE) for v in values]
+        if any(abs(i) > BinaryProtocol.INT32_MAX for i in ints):
+            raise ValueError(f"Value out of the binary protocol range: {values}")
+        return ints
+
+    def __frame(self, opcode: int, ints: list[int]) -> bytes:
+        if len(ints) > 6:
+            raise ValueError("A frame holds at most six values")
+        ints = ints + [0] * (6 - len(ints))
+        return BinaryProtocol.FRAME.pack(opcode, self.__seq, *ints)
+
+    # =========================================================================
+    # Decoding
+    # =========================================================================
+
+    def feed(self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append raw bytes to the buffer and extract every complete reply.
+        """
+        self.__buffer += data
+
+        size = BinaryProtocol.FRAME.size
+        consumed = 0
+        while len(self.__buffer) - consumed >= BinaryProtocol.OPCODE.size:
+            (opcode,) = BinaryProtocol.OPCODE.unpack_from(self.__buffer, consumed)
+            if opcode not in BinaryProtocol.REPLY_OPCODES:
+                # Socket probe before the frame
+                consumed += 1
+                continue
+            if len(self.__buffer) - consumed < size:
+                break
+            opcode, seq, *ints = BinaryProtocol.FRAME.unpack_from(
+                self.__buffer, consumed
+            )
+            consumed += size
+            if seq == BinaryProtocol.EVENT_SEQ and opcode == BinaryProtocol.STEADY:
+                self.__replies.append(f"std,{ints[0]}")
+                continue
+            self.__check_seq(seq)
+            self.__replies.append(BinaryProtocol.__reply(opcode, ints))
+
+        if consumed > 0:
+            del self.__buffer[:consumed]
+
+    def __check_seq(self, seq: int) -> None:
+        expected = self.__sent.popleft() if len(self.__sent) > 0 else None
+        if seq != expected:
+            LoggingInterface.swarn(
+                "Binary reply for sequence %s when expecting %s", seq, expected
+            )
+
+    @staticmethod
+    def __reply(opcode: int, ints: list[int]) -> str:
+        if opcode in BinaryProtocol.ACKS:
+            return BinaryProtocol.ACKS[opcode]
+        if opcode in BinaryProtocol.VALUE_REPLIES:
+            name = "gjp" if opcode == BinaryProtocol.OPCODES["gjp"] else "gtp"
+            return ",".join([name] + [str(i / BinaryProtocol.SCALE) for i in ints])
+        return "ukn"
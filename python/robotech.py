@@ -1,15 +1,202 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+import asyncio
+import os
+
 from _custom_logger import LoggingInterface, printHeader
 from _sequencer import CartridgeSequencer
+from _async_robot_proxy import AsyncRobotProxy
+from _cell_server import CellServer
+from _checkpoint import Checkpoint
+from _inspection import Inspector, PlcInspector
+from _journal import Journal, JournalReader, ReplayInspector, ReplayRobot
+from _plc_client import PlcClient
+from _planner import RowOrderPlanner, TravelPlanner
 from _robot_proxy import RobotProxy
+from _robot_calibration import N_SAMPLES, RobotCalibration
 from _robot_console import robot_console
+from _state_stream import RobotStateStream
+from _station import InspectionStation
+
+SERVER_IP = "127.0.0.1"
+SERVER_PORT = 1500
+STREAM_PORT = 1501
+# Port of the replay server, no real robot connects to it
+REPLAY_PORT = 1502
+
+
+async def run_sequencer(args: Namespace) -> None:
+    plc = None
+    inspector = Inspector()
+    if args.plc is not None:
+        plc = PlcClient(args.plc)
+        if await plc.connect():
+            inspector = PlcInspector(plc)
+
+    journal = None
+    if args.journal is not None:
+        journal = Journal(args.journal)
+
+    checkpoint = Checkpoint(args.checkpoint)
+
+    robot = AsyncRobotProxy(SERVER_IP, SERVER_PORT)
+    robot.prefer_binary = args.binary
+    robot.prefer_events = args.events
+    robot.journal = journal
+    await robot.open_socket()
+    if args.stream:
+        robot.state_stream = RobotStateStream(SERVER_IP, STREAM_PORT)
+        await robot.state_stream.open_socket()
+    try:
+        await CartridgeSequencer(
+            robot,
+            args.config,
+            inspector=inspector,
+            overlap_inspection=args.overlap,
+            step_macros=args.macros,
+            planner=TravelPlanner() if args.plan_travel else RowOrderPlanner(),
+            journal=journal,
+            checkpoint=checkpoint,
+            watch_calibration=args.watch_calib,
+        ).run(resume=args.resume)
+    finally:
+        checkpoint.close()
+        await robot.close_socket()
+        if robot.state_stream is not None:
+            await robot.state_stream.close()
+        if plc is not None:
+            await plc.close()
+        if journal is not None:
+            journal.close()
+
+
+def cell_path(path: str, cell_id: str) -> str:
+    """
+    File of a cell of a multi-cell run: run.jrn -> run.<cell_id>.jrn
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{cell_id}{ext}"
+
+
+async def run_cells(args: Namespace) -> None:
+    """
+    Run one sequencer per cell, the robots of every cell connecting to the same
+    server. The PLC is shared, its inspections are served one cell at a time.
+    """
+    plc = None
+    inspector = Inspector()
+    if args.plc is not None:
+        plc = PlcClient(args.plc)
+        if await plc.connect():
+            inspector = PlcInspector(plc)
+    if args.stream:
+        LoggingInterface.swarn("The state stream is not supported with several cells")
+
+    station = InspectionStation() if args.shared_station else None
+    server = CellServer(SERVER_IP, SERVER_PORT)
+    sequencers: list[CartridgeSequencer] = []
+    checkpoints: list[Checkpoint] = []
+    journals: list[Journal] = []
+    for cell in args.cell:
+        cell_id, _, config = cell.partition("=")
+        robot = server.add_cell(cell_id)
+        robot.prefer_binary = args.binary
+        robot.prefer_events = args.events
+        checkpoints.append(Checkpoint(cell_path(args.checkpoint, cell_id)))
+        if args.journal is not None:
+            robot.journal = Journal(cell_path(args.journal, cell_id))
+            journals.append(robot.journal)
+        sequencers.append(
+            CartridgeSequencer(
+                robot,
+                config,
+                inspector=inspector,
+                overlap_inspection=args.overlap,
+                step_macros=args.macros,
+                planner=TravelPlanner() if args.plan_travel else RowOrderPlanner(),
+                journal=robot.journal,
+                checkpoint=checkpoints[-1],
+                prefix=f"Sequencer {cell_id}",
+                station=station.add_cell(cell_id) if station is not None else None,
+                watch_calibration=args.watch_calib,
+            )
+        )
+
+    await server.open_socket()
+    try:
+        await asyncio.gather(*(s.run(resume=args.resume) for s in sequencers))
+    finally:
+        for checkpoint in checkpoints:
+            checkpoint.close()
+        await server.close_socket()
+        if plc is not None:
+            await plc.close()
+        for journal in journals:
+            journal.close()
+        if station is not None:
+            busy = 100 * station.utilisation()
+            LoggingInterface.sinfo("Inspection station busy %.1f %% of the time", busy)
+            for cell_id, access in station.cells.items():
+                LoggingInterface.sinfo(
+                    "Cell %s: %s slots, waited p50=%.0f max=%.0f ms",
+                    cell_id,
+                    access.n_slots,
+                    access.wait.percentile(50) / 1e6,
+                    access.wait.max / 1e6,
+                )
+
+
+async def replay_journal(args: Namespace) -> None:
+    """
+    Run the sequencer against the replies and verdicts of a journal.
+    """
+
+    async def operator_ready() -> str:
+        return ""
+
+    journal = JournalReader(args.journal)
+    replay = ReplayRobot(journal)
+    robot = AsyncRobotProxy(SERVER_IP, REPLAY_PORT)
+    # Same command stream as the journaled run (the replay speaks text only)
+    robot.prefer_events = "evt" in replay.negotiated
+    await robot.open_socket()
+    await replay.connect(SERVER_IP, REPLAY_PORT)
+    try:
+        await CartridgeSequencer(
+            robot,
+            args.config,
+            inspector=ReplayInspector(journal),
+            overlap_inspection=args.overlap,
+            step_macros=args.macros,
+            planner=TravelPlanner() if args.plan_travel else RowOrderPlanner(),
+            operator_input=operator_ready,
+        ).run()
+    finally:
+        await robot.close_socket()
+        await replay.wait()
+
+    LoggingInterface.sinfo(
+        "Replayed %s commands, %s divergences",
+        replay.n_replayed,
+        len(replay.divergences),
+    )
+    for step, times in journal.step_times().items():
+        LoggingInterface.sinfo(
+            "%s: %s times, mean %.3f s, max %.3f s",
+            step,
+            len(times),
+            sum(times) / len(times),
+            max(times),
+        )
+    journal.close()
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument(
         "action",
-        choices=["run", "cmd"],
-        help="Use run to use the sequencer, cmd for direction robot console",
+        choices=["run", "cmd", "replay", "calibrate"],
+        help="Use run to use the sequencer, cmd for direction robot console, "
+        "replay to replay a run journal, calibrate to teach the configuration file",
     )
     parser.add_argument(
         "-c", "--config", help="Configuration file path", type=str, default=""
@@ -20,6 +207,89 @@ if __name__ == "__main__":
         help="Define the log level",
         choices=["debug", "info", "warn", "error"],
     )
+    parser.add_argument(
+        "--log-file",
+        help="Also write the logs to this file (rotated every 10 MB)",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--journal",
+        help="Run journal file, written by run and read by replay",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="File where the run saves its progress at every step",
+        type=str,
+        default="robotech.ckpt",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Continue the tray from the progress saved in the checkpoint file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--samples",
+        help="Robot samples averaged per point taught by calibrate",
+        type=int,
+        default=N_SAMPLES,
+    )
+    parser.add_argument(
+        "--watch-calib",
+        help="Reload the configuration file when it changes, between two cartridges",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cell",
+        help="Drive several robots: cell ID with its configuration file "
+        "(ID=CONFIG), once per cell",
+        type=str,
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--shared-station",
+        help="The cells share one inspection station, used by one robot at a time",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--overlap",
+        help="Run the inspections in the background of the robot motions",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--macros",
+        help="Run each grab and drop on the robot as a single macro command",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--plc",
+        help="Hostname of the MQTT broker used to reach the PLC (no PLC if not given)",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--plan-travel",
+        help="Choose the bin cells minimizing the robot travel instead of row order",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--binary",
+        help="Use the binary wire protocol with the robot if it supports it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--events",
+        help="Have the robot push its steadiness after each move if it supports it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stream",
+        help=f"Receive the robot state stream on port {STREAM_PORT}",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     printHeader(
@@ -35,16 +305,30 @@ if __name__ == "__main__":
 
     # Configure logger
     LoggingInterface.configure_lvl(args.lvl)
-
-    # Create proxies
-    robot = RobotProxy("127.0.0.1", 1500)
+    LoggingInterface.configure_output(file=args.log_file)
 
     # Run everything
     match args.action:
         case "cmd":
+            robot = RobotProxy(SERVER_IP, SERVER_PORT)
+            robot.async_proxy.prefer_binary = args.binary
+            robot.async_proxy.prefer_events = args.events
             robot_console(robot)
+            robot.close_connection()
+        case "calibrate":
+            if args.config == "":
+                parser.error("calibrate needs a -c/--config file to write")
+            robot = RobotProxy(SERVER_IP, SERVER_PORT)
+            robot.async_proxy.prefer_binary = args.binary
+            RobotCalibration(robot, args.config, samples=args.samples).run()
+            robot.close_connection()
+        case "run" if args.cell is not None:
+            asyncio.run(run_cells(args))
         case "run":
-            CartridgeSequencer(robot, args.config).run()
+            asyncio.run(run_sequencer(args))
+        case "replay":
+            if args.journal is None:
+                parser.error("replay needs a --journal file")
+            asyncio.run(replay_journal(args))
         case _:
             print("Unknown command!")
-    robot.close_connection()
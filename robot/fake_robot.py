@@ -3,43 +3,61 @@ from time import sleep
 
 HOST = "127.0.0.1"  # The server's hostname or IP address
 PORT = 1500  # The port used by the server
+LINE_END = ";"
+# Byte sent once per main loop by is_open() to probe the socket
+SOCKET_PROBE = b"\x00"
 
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     print("Opening socket!")
     s.connect((HOST, PORT))
 
-    while True:
+    buffer = ""
+    running = True
+    while running:
+        s.sendall(SOCKET_PROBE)
         data = s.recv(1024)
         # Bad data, close socket
         if not data:
             break
-        data = data.decode()
-        # If data is empty do nothing
-        if len(data) == 0:
-            continue
+        buffer += data.decode()
 
-        # Else process cmd
-        print(f'Got cmd: "{data}"')
-        if len(data) < 3:
-            s.sendall("unknown;".encode())
-            continue
-        match data[:3]:
-            case "gjp":
-                s.sendall("gjp,0,0,0,0,0,0;".encode())
-            case "gtp":
-                s.sendall("gtp,0,0,0,0,0,0;".encode())
-            case "mvj":
-                s.sendall("mvjok;".encode())
-            case "mvl":
-                s.sendall("mvlok;".encode())
-            case "gop":
-                s.sendall("gop;".encode())
-            case "gcl":
-                s.sendall("gcl;".encode())
-            case "std":
-                sleep(2)
-                s.sendall("std;".encode())
-            case "stp":
-                s.sendall("stpok;".encode())
-                break
+        # Commands may be pipelined, process every complete one
+        *cmds, buffer = buffer.split(LINE_END)
+        for data in cmds:
+            # If data is empty do nothing
+            if len(data) == 0:
+                continue
+
+            # Else process cmd
+            print(f'Got cmd: "{data}"')
+            if len(data) < 3:
+                s.sendall("unknown;".encode())
+                continue
+            match data[:3]:
+                case "gjp":
+                    s.sendall("gjp,0,0,0,0,0,0;".encode())
+                case "gtp":
+                    s.sendall("gtp,0,0,0,0,0,0;".encode())
+                case "mvj":
+                    s.sendall("mvjok;".encode())
+                case "mvl":
+                    s.sendall("mvlok;".encode())
+                case "mvp":
+                    s.sendall("mvpok;".encode())
+                case "mcr":
+                    s.sendall("mcrok;".encode())
+                case "gop":
+                    s.sendall("gop;".encode())
+                case "gcl":
+                    s.sendall("gcl;".encode())
+                case "std":
+                    sleep(2)
+                    s.sendall("std;".encode())
+                case "stp":
+                    s.sendall("stpok;".encode())
+                    running = False
+                    break
+                case _:
+                    # e.g. binary protocol negotiation, text only here
+                    s.sendall("ukn;".encode())
     print("Closing socket !")
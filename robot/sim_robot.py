@@ -0,0 +1,739 @@
+"""
+Timing-accurate stand-in for the UR robot program, to measure cycle times
+without hardware.
+
+Unlike fake_robot.py, moves take the time the robot would take: each move follows
+a trapezoidal velocity profile with the speed and acceleration limits of the
+URScript movej/movel defaults, and gripper actions wait for the actuation delay.
+The simulated robot tracks its joints (UR3e kinematics), so gjp/gtp return the
+actual state, and it runs on a virtual clock which can go faster than real time:
+
+    python3 robot/sim_robot.py --time-scale 10 [--stream-port 1501]
+
+It speaks the text protocol and the negotiated binary protocol, pushes the
+steadiness events and streams its state like RBTch-socket.script. SimRobot can
+also be started in-process (start/stop coroutines): on a VirtualTimeLoop, with
+the server on the same loop, time is discrete and only advances by the modeled
+durations, so the timings do not depend on the host speed (see run_virtual).
+"""
+
+import asyncio
+import math
+import os
+import selectors
+import sys
+from argparse import ArgumentParser
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from _state_stream import RobotStateStream
+from _wire_protocol import BinaryProtocol
+
+HOST = "127.0.0.1"
+PORT = 1500
+LINE_END = ";"
+# Byte sent once per main loop by is_open() to probe the command socket
+SOCKET_PROBE = b"\x00"
+
+Vector = list[float]
+Matrix = list[list[float]]
+
+
+@dataclass
+class SimConfig:
+    # URScript movej / movel defaults
+    joint_speed: float = 1.05
+    joint_accel: float = 1.4
+    linear_speed: float = 0.25
+    linear_accel: float = 1.2
+    # Orientation changes of linear moves
+    angular_speed: float = 1.05
+    angular_accel: float = 1.4
+    gripper_delay: float = 0.3
+    # Time for the robot to be steady after a move
+    settle_time: float = 0.02
+    stream_period: float = 0.008
+    # Robot controller cycle, period of the steadiness checks
+    control_period: float = 0.002
+    home: tuple[float, ...] = (0.0, -1.5708, 1.5708, -1.5708, -1.5708, 0.0)
+
+
+class VirtualClock:
+    """
+    Clock running time_scale times faster than the time of the running event loop
+    (real time, or the discrete time of a VirtualTimeLoop).
+    """
+
+    def __init__(self, time_scale: float = 1.0) -> None:
+        self.time_scale = time_scale
+
+    def now(self) -> float:
+        return asyncio.get_running_loop().time() * self.time_scale
+
+    async def sleep(self, duration: float) -> None:
+        if duration > 0:
+            await asyncio.sleep(duration / self.time_scale)
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    def __init__(self, loop: "VirtualTimeLoop") -> None:
+        super().__init__()
+        self.__loop = loop
+
+    def select(self, timeout: float | None = None):
+        # Local sockets: the data sent so far can be read at once
+        events = super().select(0)
+        if len(events) > 0 or timeout == 0:
+            return events
+        if timeout is None:
+            # No timer: only another thread can wake the loop up
+            return super().select(None)
+        self.__loop.advance(timeout)
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop on discrete-event virtual time: once no callback is ready and no
+    socket can be read, time jumps to the next timer instead of waiting for it.
+    Time thus only advances by the durations waited for (moves, PLC scans,
+    timeouts), the processing time of the host counting for nothing.
+
+    Every party must run on the loop and talk through local sockets (a thread
+    doing work would not hold the time back).
+    """
+
+    def __init__(self) -> None:
+        self.__now = 0.0
+        super().__init__(_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self.__now
+
+    def advance(self, duration: float) -> None:
+        self.__now += duration
+
+
+def run_virtual(main):
+    """
+    Run a coroutine on a VirtualTimeLoop, like asyncio.run.
+    """
+    with asyncio.Runner(loop_factory=VirtualTimeLoop) as runner:
+        return runner.run(main)
+
+
+def trapezoid_time(distance: float, speed: float, accel: float) -> float:
+    """
+    Duration of a rest to rest move along a trapezoidal velocity profile
+    (triangular if the distance is too short to reach the speed).
+    """
+    distance = abs(distance)
+    if distance <= speed * speed / accel:
+        return 2 * math.sqrt(distance / accel)
+    return distance / speed + speed / accel
+
+
+def trapezoid_progress(t: float, duration: float, speed: float, accel: float) -> float:
+    """
+    Fraction of the distance covered at time t of a trapezoidal move.
+    """
+    if duration <= 0 or t >= duration:
+        return 1.0
+    if t <= 0:
+        return 0.0
+    ramp = min(speed / accel, duration / 2)
+    v = accel * ramp
+    distance = v * (duration - ramp)
+    if t < ramp:
+        covered = accel * t * t / 2
+    elif t < duration - ramp:
+        covered = accel * ramp * ramp / 2 + v * (t - ramp)
+    else:
+        left = duration - t
+        covered = distance - accel * left * left / 2
+    return covered / distance
+
+
+# =============================================================================
+# UR3e kinematics
+# =============================================================================
+
+# Standard DH parameters of the UR3e
+DH_D = (0.15185, 0, 0, 0.13105, 0.08535, 0.0921)
+DH_A = (0, -0.24355, -0.2132, 0, 0, 0)
+DH_ALPHA = (math.pi / 2, 0, 0, math.pi / 2, -math.pi / 2, 0)
+
+
+def _matmul(a: Matrix, b: Matrix) -> Matrix:
+    return [
+        [sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)
+    ]
+
+
+def _dh(theta: float, d: float, a: float, alpha: float) -> Matrix:
+    ct, st = math.cos(theta), math.sin(theta)
+    ca, sa = math.cos(alpha), math.sin(alpha)
+    return [
+        [ct, -st * ca, st * sa, a * ct],
+        [st, ct * ca, -ct * sa, a * st],
+        [0, sa, ca, d],
+        [0, 0, 0, 1],
+    ]
+
+
+def rotvec_to_matrix(r: Vector) -> Matrix:
+    angle = math.sqrt(sum(v * v for v in r))
+    if angle < 1e-12:
+        return [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+    x, y, z = (v / angle for v in r)
+    c, s, t = math.cos(angle), math.sin(angle), 1 - math.cos(angle)
+    return [
+        [t * x * x + c, t * x * y - s * z, t * x * z + s * y],
+        [t * x * y + s * z, t * y * y + c, t * y * z - s * x],
+        [t * x * z - s * y, t * y * z + s * x, t * z * z + c],
+    ]
+
+
+def matrix_to_rotvec(m: Matrix) -> Vector:
+    cos = max(-1.0, min(1.0, (m[0][0] + m[1][1] + m[2][2] - 1) / 2))
+    angle = math.acos(cos)
+    axis = [m[2][1] - m[1][2], m[0][2] - m[2][0], m[1][0] - m[0][1]]
+    if angle < 1e-9:
+        return [v / 2 for v in axis]
+    if math.pi - angle < 1e-6:
+        # Axis from the diagonal, the antisymmetric part vanishes
+        axis = [math.sqrt(max(0.0, (m[i][i] + 1) / 2)) for i in range(3)]
+        if m[0][1] < 0:
+            axis[1] = -axis[1]
+        if m[0][2] < 0:
+            axis[2] = -axis[2]
+        return [v * angle for v in axis]
+    return [v * angle / (2 * math.sin(angle)) for v in axis]
+
+
+def forward_kinematics(q: Vector) -> Vector:
+    """
+    TCP pose [x, y, z, rx, ry, rz] (rotation vector) for the joint positions q.
+    """
+    t = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]
+    for i in range(6):
+        t = _matmul(t, _dh(q[i], DH_D[i], DH_A[i], DH_ALPHA[i]))
+    rot = [row[:3] for row in t[:3]]
+    return [t[0][3], t[1][3], t[2][3]] + matrix_to_rotvec(rot)
+
+
+def _pose_error(target: Vector, pose: Vector) -> Vector:
+    rt, rp = rotvec_to_matrix(target[3:]), rotvec_to_matrix(pose[3:])
+    # target * pose^T
+    diff = [
+        [sum(rt[i][k] * rp[j][k] for k in range(3)) for j in range(3)] for i in range(3)
+    ]
+    return [target[i] - pose[i] for i in range(3)] + matrix_to_rotvec(diff)
+
+
+def _solve(a: Matrix, b: Vector) -> Vector:
+    """
+    Solve a x = b by Gaussian elimination with partial pivoting.
+    """
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(m[r][c]))
+        m[c], m[p] = m[p], m[c]
+        for r in range(c + 1, n):
+            f = m[r][c] / m[c][c]
+            for k in range(c, n + 1):
+                m[r][k] -= f * m[c][k]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][k] * x[k] for k in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def inverse_kinematics(
+    pose: Vector, seed: Vector, iterations: int = 100, tolerance: float = 1e-6
+) -> Vector | None:
+    """
+    Joint positions reaching the TCP pose, nearest to the seed (damped least squares).
+    Return None if the pose could not be reached.
+    """
+    q = list(seed)
+    damping = 1e-3
+    for _ in range(iterations):
+        error = _pose_error(pose, forward_kinematics(q))
+        if max(abs(e) for e in error) < tolerance:
+            return q
+
+        # Numerical Jacobian
+        h = 1e-6
+        base = forward_kinematics(q)
+        jac = [[0.0] * 6 for _ in range(6)]
+        for j in range(6):
+            dq = q[:]
+            dq[j] += h
+            d = _pose_error(forward_kinematics(dq), base)
+            for i in range(6):
+                jac[i][j] = d[i] / h
+
+        jtj = [
+            [sum(jac[k][i] * jac[k][j] for k in range(6)) for j in range(6)]
+            for i in range(6)
+        ]
+        for i in range(6):
+            jtj[i][i] += damping
+        jte = [sum(jac[k][i] * error[k] for k in range(6)) for i in range(6)]
+        step = _solve(jtj, jte)
+        q = [q[i] + step[i] for i in range(6)]
+    return None
+
+
+# =============================================================================
+# Simulated robot
+# =============================================================================
+
+
+@dataclass
+class _Motion:
+    start: float
+    duration: float
+    speed: float
+    accel: float
+    from_q: Vector
+    to_q: Vector
+
+
+class SimRobot:
+    """
+    Simulated robot program, connecting to the command server (and optionally to
+    the state stream server) and executing the commands one after the other, as
+    tasks of the running event loop.
+    """
+
+    def __init__(
+        self, config: SimConfig | None = None, clock: VirtualClock | None = None
+    ) -> None:
+        self.config = SimConfig() if config is None else config
+        self.clock = VirtualClock() if clock is None else clock
+        self.joints: Vector = list(self.config.home)
+        self.tcp: Vector = forward_kinematics(self.joints)
+        self.gripper_open = True
+        self.binary = False
+        self.events = False
+        # Moves executed since the connection, numbered like the robot program
+        self.done_move = 0
+
+        self.__motion: _Motion | None = None
+        self.__settled_at = 0.0
+        self.__moved_event = asyncio.Event()
+        self.__running = False
+        self.__writers: list[asyncio.StreamWriter] = []
+        self.__tasks: list[asyncio.Task] = []
+
+        # Statistics
+        self.n_commands = 0
+        self.motion_time = 0.0
+
+    # =========================================================================
+    # Motion
+    # =========================================================================
+
+    def state_at(self, t: float) -> tuple[Vector, bool]:
+        """
+        Joint positions at virtual time t and whether the robot is steady.
+        """
+        motion = self.__motion
+        if motion is None or t >= motion.start + motion.duration:
+            return list(self.joints), t >= self.__settled_at
+        s = trapezoid_progress(
+            t - motion.start, motion.duration, motion.speed, motion.accel
+        )
+        return [a + s * (b - a) for a, b in zip(motion.from_q, motion.to_q)], False
+
+    async def __execute(
+        self, q: Vector, tcp: Vector, duration: float, speed: float, accel: float
+    ) -> None:
+        start = self.clock.now()
+        self.__motion = _Motion(start, duration, speed, accel, self.joints, q)
+        self.__settled_at = start + duration + self.config.settle_time
+        await self.clock.sleep(duration)
+        self.joints = list(q)
+        self.tcp = list(tcp)
+        self.__motion = None
+        self.motion_time += duration
+
+    def __moved(self) -> None:
+        self.done_move += 1
+        self.__moved_event.set()
+
+    def __linear_time(self, distance: float, rotation: float) -> float:
+        c = self.config
+        return max(
+            trapezoid_time(distance, c.linear_speed, c.linear_accel),
+            trapezoid_time(rotation, c.angular_speed, c.angular_accel),
+        )
+
+    @staticmethod
+    def __rotation(start: Vector, end: Vector) -> float:
+        return math.sqrt(sum(e * e for e in _pose_error(end, start)[3:]))
+
+    def __joints_for(self, pose: Vector) -> Vector:
+        q = inverse_kinematics(pose, self.joints)
+        # Unreachable poses (e.g. uncalibrated layouts) still take their time
+        return self.joints if q is None else q
+
+    async def movej(self, q: Vector) -> None:
+        c = self.config
+        duration = max(
+            trapezoid_time(b - a, c.joint_speed, c.joint_accel)
+            for a, b in zip(self.joints, q)
+        )
+        await self.__execute(
+            q, forward_kinematics(q), duration, c.joint_speed, c.joint_accel
+        )
+
+    async def movel(self, pose: Vector) -> None:
+        c = self.config
+        duration = self.__linear_time(
+            math.dist(self.tcp[:3], pose[:3]), SimRobot.__rotation(self.tcp, pose)
+        )
+        q = self.__joints_for(pose)
+        await self.__execute(q, pose, duration, c.linear_speed, c.linear_accel)
+
+    async def movel_path(self, poses: list[Vector], blends: list[float]) -> None:
+        """
+        Waypoints blended with the next one are run through without stopping, so
+        the segments between two stops are timed as a single profile.
+        """
+        c = self.config
+        start = self.tcp
+        distance, rotation = 0.0, 0.0
+        for i, pose in enumerate(poses):
+            distance += math.dist(start[:3], pose[:3])
+            rotation += SimRobot.__rotation(start, pose)
+            start = pose
+            if i == len(poses) - 1 or blends[i] <= 0:
+                duration = self.__linear_time(distance, rotation)
+                q = self.__joints_for(pose)
+                await self.__execute(
+                    q, pose, duration, c.linear_speed, c.linear_accel
+                )
+                distance, rotation = 0.0, 0.0
+
+    async def actuate_gripper(self, open: bool) -> None:
+        self.gripper_open = open
+        await self.clock.sleep(self.config.gripper_delay)
+
+    async def wait_steady(self) -> None:
+        await self.clock.sleep(self.__settled_at - self.clock.now())
+
+    async def run_macro(self, name: str, v: Vector) -> bool:
+        """
+        Run a step macro of RBTch-socket.script, return False if it is unknown.
+        """
+        target = v[:6]
+        approach = v[:2] + [v[2] + v[6]] + v[3:6]
+        if name == "pck":
+            if self.gripper_open:
+                await self.movel_path([approach, target], [v[7], 0])
+            else:
+                await self.movel(approach)
+                await self.actuate_gripper(True)
+                await self.movel(target)
+            await self.wait_steady()
+            await self.actuate_gripper(False)
+            await self.movel_path([approach, v[8:14]], [v[7], 0])
+        elif name == "plc":
+            await self.movel_path([approach, target], [v[7], 0])
+            await self.wait_steady()
+            await self.actuate_gripper(True)
+            await self.movel(approach)
+        else:
+            return False
+        return True
+
+    # =========================================================================
+    # Protocols
+    # =========================================================================
+
+    async def start(
+        self,
+        host: str = HOST,
+        port: int = PORT,
+        stream_port: int | None = None,
+        cell: str | None = None,
+    ) -> None:
+        """
+        Connect to the servers and run the robot program in background tasks.
+        With a cell id, the robot identifies its cell to a multi-cell server first.
+        """
+        self.__running = True
+        reader, writer = await asyncio.open_connection(host, port)
+        if cell is not None:
+            await SimRobot.__identify(reader, writer, cell)
+        self.__writers = [writer]
+        self.__tasks = [asyncio.create_task(self.__serve(reader, writer))]
+        if stream_port is not None:
+            _, stream = await asyncio.open_connection(host, stream_port)
+            self.__writers.append(stream)
+            self.__tasks.append(asyncio.create_task(self.__stream(stream)))
+        # The command task starts the event task itself once negotiated
+
+    async def wait(self) -> None:
+        """
+        Wait until the server stops the robot program.
+        """
+        await self.__tasks[0]
+        await self.stop()
+
+    async def stop(self) -> None:
+        self.__running = False
+        for writer in self.__writers:
+            writer.close()
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+
+    async def run(
+        self,
+        host: str = HOST,
+        port: int = PORT,
+        stream_port: int | None = None,
+        cell: str | None = None,
+    ) -> None:
+        """
+        Run the robot program until the server stops it.
+        """
+        await self.start(host, port, stream_port, cell)
+        await self.wait()
+
+    @staticmethod
+    async def __identify(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter, cell: str
+    ) -> None:
+        writer.write(f"cell,{cell}{LINE_END}".encode())
+        try:
+            reply = await reader.readuntil(LINE_END.encode())
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Server closed the connection") from None
+        if reply.decode() != f"cellok{LINE_END}":
+            raise ConnectionError(f"Cell {cell} refused by the server")
+
+    async def __serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        buffer = b""
+        sep = LINE_END.encode()
+        size = BinaryProtocol.FRAME.size
+        try:
+            while self.__running:
+                # Socket probe of the main loop, in both protocols
+                writer.write(SOCKET_PROBE)
+                # Commands may be pipelined, process every complete one
+                if self.binary and len(buffer) >= size:
+                    buffer = await self.__binary_cmd(reader, writer, buffer)
+                    continue
+                end = buffer.find(sep)
+                if not self.binary and end != -1:
+                    cmd = buffer[:end].decode().strip()
+                    buffer = buffer[end + len(sep) :]
+                    if len(cmd) > 0:
+                        await self.__text_cmd(writer, cmd)
+                    continue
+
+                data = await reader.read(1024)
+                if not data:
+                    break
+                buffer += data
+        except OSError:
+            # Connection closed, possibly while executing a command
+            pass
+        self.__running = False
+
+    async def __recv_exactly(
+        self, reader: asyncio.StreamReader, buffer: bytes, size: int
+    ) -> bytes:
+        while len(buffer) < size:
+            data = await reader.read(1024)
+            if not data:
+                raise ConnectionError("Server closed the connection")
+            buffer += data
+        return buffer
+
+    async def __text_cmd(self, writer: asyncio.StreamWriter, cmd: str) -> None:
+        self.n_commands += 1
+        name, *params = cmd.split(",")
+        match name:
+            case "gjp":
+                reply = ",".join(["gjp"] + [str(q) for q in self.joints])
+            case "gtp":
+                reply = ",".join(["gtp"] + [str(v) for v in self.tcp])
+            case "mvj":
+                await self.movej([float(p) for p in params])
+                self.__moved()
+                reply = "mvjok"
+            case "mvl":
+                await self.movel([float(p) for p in params])
+                self.__moved()
+                reply = "mvlok"
+            case "mvp":
+                n = int(params[0])
+                points = [
+                    [float(p) for p in params[1 + 7 * i : 8 + 7 * i]] for i in range(n)
+                ]
+                await self.movel_path([p[:6] for p in points], [p[6] for p in points])
+                self.__moved()
+                reply = "mvpok"
+            case "mcr" if await self.run_macro(
+                params[0], [float(p) for p in params[1:]]
+            ):
+                self.__moved()
+                reply = "mcrok"
+            case "gop" | "gcl":
+                await self.actuate_gripper(name == "gop")
+                reply = name
+            case "std":
+                await self.wait_steady()
+                reply = "std"
+            case "stp":
+                reply = "stpok"
+                self.__running = False
+            case "bin":
+                reply = "binok"
+                self.binary = True
+            case "evt":
+                reply = "evtok"
+                if not self.events:
+                    self.events = True
+                    self.__tasks.append(
+                        asyncio.create_task(self.__push_events(writer))
+                    )
+            case _:
+                reply = "ukn"
+        writer.write(f"{reply}{LINE_END}".encode())
+
+    async def __binary_cmd(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, buffer: bytes
+    ) -> bytes:
+        """
+        Execute the frame at the start of the buffer, return the rest of the buffer.
+        """
+        self.n_commands += 1
+        frame, size = BinaryProtocol.FRAME, BinaryProtocol.FRAME.size
+        op, seq, *ints = frame.unpack(buffer[:size])
+        buffer = buffer[size:]
+        values = [i / BinaryProtocol.SCALE for i in ints]
+        codes = BinaryProtocol.OPCODES
+
+        reply = [0.0] * 6
+        if op == codes["gjp"]:
+            reply = self.joints
+        elif op == codes["gtp"]:
+            reply = self.tcp
+        elif op == codes["mvj"]:
+            await self.movej(values)
+            self.__moved()
+        elif op == codes["mvl"]:
+            await self.movel(values)
+            self.__moved()
+        elif op == codes["mvp"]:
+            # Header [n, r1, ..., r4] followed by the n waypoint frames
+            n = ints[0]
+            buffer = await self.__recv_exactly(reader, buffer, n * size)
+            points = [frame.unpack_from(buffer, i * size)[2:] for i in range(n)]
+            poses = [[v / BinaryProtocol.SCALE for v in p] for p in points]
+            buffer = buffer[n * size :]
+            await self.movel_path(poses, values[1 : 1 + n])
+            self.__moved()
+        elif op == codes["mcr"]:
+            # Header [macro id, n] followed by the n values, 6 per frame
+            macro, n = ints[0], ints[1]
+            n_frames = (n + 5) // 6
+            buffer = await self.__recv_exactly(reader, buffer, n_frames * size)
+            args = []
+            for i in range(n_frames):
+                args += frame.unpack_from(buffer, i * size)[2:]
+            buffer = buffer[n_frames * size :]
+            names = {m: name for name, m in BinaryProtocol.MACROS.items()}
+            name = names.get(macro, "")
+            if await self.run_macro(
+                name, [a / BinaryProtocol.SCALE for a in args[:n]]
+            ):
+                self.__moved()
+            else:
+                op = -1
+        elif op == codes["gop"] or op == codes["gcl"]:
+            await self.actuate_gripper(op == codes["gop"])
+        elif op == codes["std"]:
+            await self.wait_steady()
+        elif op == codes["stp"]:
+            self.__running = False
+        else:
+            op = -1
+
+        ints = [round(v * BinaryProtocol.SCALE) for v in reply]
+        writer.write(frame.pack(op, seq, *ints))
+        return buffer
+
+    async def __push_events(self, writer: asyncio.StreamWriter) -> None:
+        """
+        Push a steadiness event once steady after a move, at the next controller
+        cycle (consecutive moves done before settling are notified once).
+        """
+        notified = 0
+        while self.__running:
+            if notified == self.done_move:
+                self.__moved_event.clear()
+                await self.__moved_event.wait()
+                continue
+            # Checked every controller cycle: seen at the first one once settled
+            settled_at = self.__settled_at
+            cycle = self.config.control_period
+            checked_at = settled_at + cycle - settled_at % cycle
+            await self.clock.sleep(checked_at - self.clock.now())
+            # Still moving: a move started meanwhile
+            if self.clock.now() < self.__settled_at or writer.is_closing():
+                continue
+            notified = self.done_move
+            if self.binary:
+                event = [BinaryProtocol.STEADY, BinaryProtocol.EVENT_SEQ, notified]
+                writer.write(BinaryProtocol.FRAME.pack(*event, 0, 0, 0, 0, 0))
+            else:
+                writer.write(f"std,{notified}{LINE_END}".encode())
+
+    async def __stream(self, writer: asyncio.StreamWriter) -> None:
+        seq = 0
+        while self.__running and not writer.is_closing():
+            q, steady = self.state_at(self.clock.now())
+            values = q + forward_kinematics(q)
+            ints = [round(v * RobotStateStream.SCALE) for v in values]
+            writer.write(RobotStateStream.FRAME.pack(seq, *ints, int(steady)))
+            seq += 1
+            await self.clock.sleep(self.config.stream_period)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--stream-port", type=int, default=None)
+    parser.add_argument("--cell", type=str, default=None, help="Cell id sent first")
+    parser.add_argument(
+        "--time-scale", type=float, default=1.0, help="Speed-up of the virtual clock"
+    )
+    parser.add_argument("--gripper-delay", type=float, default=SimConfig.gripper_delay)
+    parser.add_argument("--linear-speed", type=float, default=SimConfig.linear_speed)
+    parser.add_argument("--joint-speed", type=float, default=SimConfig.joint_speed)
+    args = parser.parse_args()
+
+    robot = SimRobot(
+        SimConfig(
+            joint_speed=args.joint_speed,
+            linear_speed=args.linear_speed,
+            gripper_delay=args.gripper_delay,
+        ),
+        VirtualClock(args.time_scale),
+    )
+    print("Opening socket!")
+    asyncio.run(robot.run(args.host, args.port, args.stream_port, args.cell))
+    print(f"Closing socket ! {robot.n_commands} commands, {robot.motion_time:.2f} s")
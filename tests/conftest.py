@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The server modules are flat modules of python/, imported like robotech.py does
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "python"))
+# Stand-ins of the robot and the PLC
+sys.path.insert(0, os.path.join(ROOT, "robot"))
+sys.path.insert(0, os.path.join(ROOT, "mqtt"))
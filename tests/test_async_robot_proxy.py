@@ -0,0 +1,176 @@
+import asyncio
+import socket
+
+import pytest
+
+from _async_robot_proxy import AsyncRobotProxy, RobotCommands
+from _custom_types import Pose
+
+APPROACH = Pose(0.2, 0.1, 0.1, 0.0, 3.14, 0.0)
+PLACE = Pose(0.2, 0.1, 0.05, 0.0, 3.14, 0.0)
+INPUT_APPROACH = Pose(0.3, -0.2, 0.1, 0.0, 3.14, 0.0)
+GRAB = Pose(0.3, -0.2, 0.05, 0.0, 3.14, 0.0)
+CHECKING = Pose(0.25, 0.0, 0.25, 0.0, 3.14, 0.0)
+REPLIES = {"mvj": "mvjok", "mvl": "mvlok", "mvp": "mvpok", "mcr": "mcrok"}
+
+
+def values(pose: Pose) -> list[float]:
+    return [pose.x, pose.y, pose.z, pose.rx, pose.ry, pose.rz]
+
+
+def tcp_pair() -> tuple[socket.socket, socket.socket]:
+    # TCP (not a socketpair): the proxy sets the keepalive options
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        ours = socket.create_connection(server.getsockname())
+        theirs, _ = server.accept()
+    return ours, theirs
+
+
+async def client(proxy: AsyncRobotProxy):
+    ours, theirs = tcp_pair()
+    proxy.hand_over(*await asyncio.open_connection(sock=theirs))
+    return await asyncio.open_connection(sock=ours)
+
+
+async def command(reader) -> str:
+    return (await reader.readuntil(b";"))[:-1].decode()
+
+
+class ScriptedRobot:
+    """
+    Robot end of a command socket, recording the commands it receives. It answers
+    the first n_answered ones, and drops the connection once it received
+    n_received commands (never if None). Its TCP pose is tcp.
+    """
+
+    def __init__(self, tcp: Pose, n_answered=None, n_received=None) -> None:
+        self.tcp = tcp
+        self.n_answered = n_answered
+        self.n_received = n_received
+        self.received: list[str] = []
+
+    async def connect(self, proxy: AsyncRobotProxy) -> None:
+        reader, writer = await client(proxy)
+        self.task = asyncio.create_task(self.__serve(reader, writer))
+
+    def __reply(self, cmd: str) -> str:
+        name = cmd[:3]
+        if name == "gtp":
+            return ",".join(["gtp"] + [str(v) for v in values(self.tcp)])
+        if name == "gjp":
+            return "gjp,0,0,0,0,0,0"
+        return REPLIES.get(name, name)
+
+    async def __serve(self, reader, writer) -> None:
+        while self.n_received is None or len(self.received) < self.n_received:
+            try:
+                cmd = await command(reader)
+            except asyncio.IncompleteReadError:
+                break
+            self.received.append(cmd)
+            if self.n_answered is None or len(self.received) <= self.n_answered:
+                writer.write(f"{self.__reply(cmd)};".encode())
+        writer.close()
+
+
+async def recover(queue, n_answered: int, n_received: int, tcp: Pose) -> list[str]:
+    """
+    Queue a batch on a robot dying after n_received commands at tcp, return the
+    commands sent to the robot taking over, once the batch succeeded.
+    """
+    proxy = AsyncRobotProxy("127.0.0.1", 0, shared_server=True)
+    first = ScriptedRobot(APPROACH, 1 + n_answered, 1 + n_received)
+    await first.connect(proxy)
+    await proxy.wait_client()
+    # Where the batch starts from
+    assert await proxy.movel(APPROACH)
+
+    batch = proxy.batch()
+    queue(batch)
+    await first.task
+    second = ScriptedRobot(tcp)
+    await second.connect(proxy)
+    assert await asyncio.wait_for(batch.wait(), 5)
+    assert proxy.n_reconnects == 1
+    second.task.cancel()
+    return [cmd[:3] for cmd in second.received]
+
+
+def drop(batch) -> None:
+    batch.movel_path([APPROACH, PLACE], [0.01, 0])
+    batch.wait_steady()
+    batch.open_gripper()
+    batch.movel(APPROACH)
+
+
+def grab(batch) -> None:
+    batch.open_gripper()
+    batch.movel_path([INPUT_APPROACH, GRAB], [0.01, 0])
+    batch.wait_steady()
+    batch.close_gripper()
+    batch.movel_path([INPUT_APPROACH, CHECKING], [0.01, 0])
+
+
+@pytest.mark.parametrize(
+    "tcp, resent",
+    [
+        # Lost on the way down, or back up after the drop: the same approach pose
+        (APPROACH, ["mvp", "std", "gop", "mvl"]),
+        # Lost once in the cell
+        (PLACE, ["std", "gop", "mvl"]),
+        # In the cell, but not in the orientation of the drop
+        (Pose(0.2, 0.1, 0.05, 0.0, 3.14, 0.5), ["mvp", "std", "gop", "mvl"]),
+    ],
+)
+def test_interrupted_drop(tcp, resent):
+    sent = asyncio.run(recover(drop, 0, 4, tcp))
+    assert sent == ["gjp", "gtp"] + resent
+
+
+@pytest.mark.parametrize(
+    "tcp, resent",
+    [
+        # Lost on the way up with the cartridge: grabbed again
+        (INPUT_APPROACH, ["mvp", "std", "gcl", "mvp"]),
+        (GRAB, ["std", "gcl", "mvp"]),
+        # Lost once at the checking approach pose: nothing to send again
+        (CHECKING, []),
+    ],
+)
+def test_interrupted_grab(tcp, resent):
+    # The gripper opening was acknowledged
+    sent = asyncio.run(recover(grab, 1, 5, tcp))
+    assert sent == ["gjp", "gtp"] + resent
+
+
+def test_refused_move_is_not_numbered():
+    async def run():
+        proxy = AsyncRobotProxy("127.0.0.1", 0, shared_server=True)
+        reader, writer = await client(proxy)
+        await proxy.wait_client()
+        events = asyncio.ensure_future(proxy.use_events())
+        assert await command(reader) == "evt"
+        writer.write(b"evtok;")
+        assert await events
+
+        pick = RobotCommands.macro_cmd("pck", [GRAB, 0.05, 0.01, CHECKING])
+        macro = proxy.submit(pick, "mcrok")
+        after_macro = proxy.steady()
+        move = proxy.submit(RobotCommands.movel_cmd(APPROACH), "mvlok")
+        after_move = proxy.steady()
+        assert await command(reader) == pick
+        assert (await command(reader))[:3] == "mvl"
+
+        # Refused without moving: the robot was already steady
+        writer.write(b"ukn;")
+        assert await macro is False
+        assert await asyncio.wait_for(after_macro, 1)
+        # The move is the first one the robot numbers
+        writer.write(b"mvlok;")
+        assert await move
+        assert not after_move.done()
+        writer.write(b"std,1;")
+        assert await asyncio.wait_for(after_move, 1)
+        writer.close()
+
+    asyncio.run(run())
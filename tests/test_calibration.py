@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import pytest
+
+from _calibration import MAX_CELLS, CalibrationData
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+DEFAULT = os.path.join(ROOT, "calib", "default.yaml")
+
+
+@pytest.fixture
+def calib_path(tmp_path):
+    path = str(tmp_path / "calib.yaml")
+    shutil.copyfile(DEFAULT, path)
+    return path
+
+
+def with_cells(calib_path: str, nrow: int, ncol: int) -> None:
+    with open(calib_path) as f:
+        text = f.read()
+    # Tiny pitch: the bin stays in reach, only the cell count can be out of range
+    text = text.replace("drow: 0.0", "drow: 1.0e-7", 1)
+    text = text.replace("dcol: 0.0", "dcol: 1.0e-7", 1)
+    text = text.replace("nrow: 1", f"nrow: {nrow}", 1)
+    text = text.replace("ncol: 1", f"ncol: {ncol}", 1)
+    with open(calib_path, "w") as f:
+        f.write(text)
+
+
+@pytest.mark.parametrize("nrow, ncol", [(MAX_CELLS, 1), (1, MAX_CELLS), (181, 181)])
+def test_most_cells_accepted(calib_path, nrow, ncol):
+    with_cells(calib_path, nrow, ncol)
+    calib = CalibrationData.load(calib_path)
+    assert calib.input_bin.nrow * calib.input_bin.ncol <= MAX_CELLS
+    assert CalibrationData.load(calib_path) == calib
+
+
+@pytest.mark.parametrize(
+    "nrow, ncol", [(MAX_CELLS + 1, 1), (2, MAX_CELLS // 2 + 1), (300, 300)]
+)
+def test_too_many_cells_rejected(calib_path, nrow, ncol):
+    with_cells(calib_path, nrow, ncol)
+    with pytest.raises(ValueError, match=f"more than {MAX_CELLS} cells"):
+        CalibrationData.load(calib_path)
+    assert not os.path.exists(calib_path + ".cache")
+
+
+def test_cache_hit(calib_path, monkeypatch):
+    calib = CalibrationData.load(calib_path)
+    assert os.path.exists(calib_path + ".cache")
+
+    # The unchanged file is not parsed again
+    def no_parse(*args, **kwargs):
+        raise AssertionError("parsed")
+
+    monkeypatch.setattr("_calibration.yaml.load", no_parse)
+    assert CalibrationData.load(calib_path) == calib
+
+
+def test_cache_invalidated_by_edit(calib_path):
+    calib = CalibrationData.load(calib_path)
+    with open(calib_path) as f:
+        text = f.read()
+    with open(calib_path, "w") as f:
+        f.write(text.replace("[0.20, -0.25, 0.05]", "[0.21, -0.25, 0.05]"))
+
+    edited = CalibrationData.load(calib_path)
+    assert edited.input_bin.origin.x == 0.21
+    assert edited.good_bin == calib.good_bin
+    # The cache now holds the edited version
+    assert CalibrationData.load(calib_path) == edited
+
+
+def test_corrupt_cache_is_ignored(calib_path):
+    calib = CalibrationData.load(calib_path)
+    cache = calib_path + ".cache"
+    with open(cache, "r+b") as f:
+        f.truncate(os.path.getsize(cache) // 2)
+    assert CalibrationData.load(calib_path) == calib
+    assert CalibrationData.load(calib_path, use_cache=False) == calib
+
+
+def test_invalid_edit_is_not_cached(calib_path):
+    CalibrationData.load(calib_path)
+    with open(calib_path, "a") as f:
+        f.write("  unknown: 1\n")
+    with pytest.raises(ValueError, match="unknown"):
+        CalibrationData.load(calib_path)
@@ -0,0 +1,93 @@
+import asyncio
+import socket
+
+from _cell_server import CellServer
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def robot(port: int, cell: str | None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    if cell is not None:
+        writer.write(f"cell,{cell};".encode())
+        assert await reader.readuntil(b";") == b"cellok;"
+    return reader, writer
+
+
+async def answer(reader, writer, reply: str) -> str:
+    cmd = (await reader.readuntil(b";"))[:-1].decode()
+    writer.write(f"{reply};".encode())
+    return cmd
+
+
+def test_cells_get_their_robot():
+    async def run():
+        port = free_port()
+        server = CellServer("127.0.0.1", port)
+        a, b = server.add_cell("a"), server.add_cell("b")
+        await server.open_socket()
+        # Connected in the reverse order of the cells
+        robot_b = await robot(port, "b")
+        robot_a = await robot(port, "a")
+        await asyncio.wait_for(asyncio.gather(a.wait_client(), b.wait_client()), 5)
+
+        future_a, future_b = a.submit("gtp"), b.submit("gjp")
+        assert await answer(*robot_a, "gtp,1,2,3,4,5,6") == "gtp"
+        assert await answer(*robot_b, "gjp,0,0,0,0,0,0") == "gjp"
+        assert await future_a == "gtp,1,2,3,4,5,6"
+        assert await future_b == "gjp,0,0,0,0,0,0"
+        for _, writer in (robot_a, robot_b):
+            writer.close()
+        await server.close_socket()
+
+    asyncio.run(run())
+
+
+def test_unknown_cell_is_refused():
+    async def run():
+        port = free_port()
+        server = CellServer("127.0.0.1", port)
+        server.add_cell("a")
+        await server.open_socket()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"cell,z;")
+        assert await reader.readuntil(b";") == b"ukn;"
+        assert await reader.read() == b""
+        writer.close()
+        await server.close_socket()
+
+    asyncio.run(run())
+
+
+def test_single_cell_without_handshake(monkeypatch):
+    monkeypatch.setattr(CellServer, "HANDSHAKE_TIMEOUT", 0.05)
+
+    async def run():
+        port = free_port()
+        server = CellServer("127.0.0.1", port)
+        proxy = server.add_cell("a")
+        await server.open_socket()
+        reader, writer = await robot(port, None)
+        await asyncio.wait_for(proxy.wait_client(), 5)
+        future = proxy.submit("gop", "gop")
+        assert await answer(reader, writer, "gop") == "gop"
+        assert await future
+        writer.close()
+        await server.close_socket()
+
+    asyncio.run(run())
+
+
+def test_submit_before_the_robot():
+    async def run():
+        server = CellServer("127.0.0.1", free_port())
+        proxy = server.add_cell("a")
+        # Not connected yet: failed, not raised
+        assert await proxy.submit("gop", "gop") is False
+        assert await proxy.submit("gtp") is None
+
+    asyncio.run(run())
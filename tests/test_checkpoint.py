@@ -0,0 +1,105 @@
+import os
+
+from _calibration import MAX_CELLS, BinCalibration, CalibrationData
+from _checkpoint import Checkpoint
+from _custom_types import Vec3
+from _state import State, Step
+
+
+def new_state(nrow: int = 3, ncol: int = 4) -> State:
+    # 3x4 input bin: the occupancy bitmaps span several bytes
+    bin = BinCalibration(Vec3(0, 0, 0), 0.05, 0.01, 0.01, nrow, ncol)
+    calib = CalibrationData(input_bin=bin)
+    return State(calib)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    state = new_state()
+    state.input_taken[:] = [i % 3 == 0 for i in range(12)]
+    state.good_occupied[0] = True
+    state.input_idx, state.good_idx, state.defect_idx = 9, 1, 0
+    state.step = Step.MV_GOOD_BIN
+
+    checkpoint = Checkpoint(path)
+    checkpoint.record(state)
+    checkpoint.close()
+
+    restored = new_state()
+    assert Checkpoint(path).restore(restored)
+    assert restored.step == Step.MV_GOOD_BIN
+    assert restored.input_taken == state.input_taken
+    assert restored.good_occupied == state.good_occupied
+    assert restored.defect_occupied == state.defect_occupied
+    assert (restored.input_idx, restored.good_idx, restored.defect_idx) == (9, 1, 0)
+
+
+def test_inspection_is_restarted(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    state = new_state()
+    state.step = Step.CHECK_ANOMALIES
+    checkpoint = Checkpoint(path)
+    checkpoint.record(state)
+    checkpoint.close()
+
+    restored = new_state()
+    assert Checkpoint(path).restore(restored)
+    assert restored.step == Step.CHECK_QR
+
+
+def test_torn_record_is_ignored(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    state = new_state()
+    checkpoint = Checkpoint(path)
+    state.input_idx, state.step = 1, Step.MV_INPUT
+    checkpoint.record(state)
+    state.input_idx, state.step = 2, Step.CHECK_QR
+    checkpoint.record(state)
+    checkpoint.close()
+
+    # The server died while writing the last record
+    os.truncate(path, os.path.getsize(path) - 3)
+    restored = new_state()
+    assert Checkpoint(path).restore(restored)
+    assert (restored.input_idx, restored.step) == (1, Step.MV_INPUT)
+
+
+def test_nothing_to_resume(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    assert not Checkpoint(path).restore(new_state())
+
+    state = new_state()
+    state.step = Step.DONE
+    checkpoint = Checkpoint(path)
+    checkpoint.record(state)
+    checkpoint.close()
+    assert not Checkpoint(path).restore(new_state())
+
+
+def test_largest_bin(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    state = new_state(MAX_CELLS, 1)
+    state.input_taken[-1] = True
+    state.input_idx, state.step = MAX_CELLS - 1, Step.MV_GOOD_BIN
+    checkpoint = Checkpoint(path)
+    checkpoint.record(state)
+    checkpoint.close()
+
+    restored = new_state(MAX_CELLS, 1)
+    assert Checkpoint(path).restore(restored)
+    assert restored.input_idx == MAX_CELLS - 1
+    assert restored.input_taken == state.input_taken
+
+
+def test_other_layout_is_not_resumed(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    state = new_state()
+    state.step = Step.MV_INPUT
+    checkpoint = Checkpoint(path)
+    checkpoint.record(state)
+    checkpoint.close()
+
+    # Same bitmap sizes, but not the same cell counts
+    assert not Checkpoint(path).restore(new_state(3, 5))
+    # Not even the same record size
+    assert not Checkpoint(path).restore(new_state(5, 5))
@@ -0,0 +1,25 @@
+import time
+
+from _custom_logger import LogLevel, LogWriter
+
+
+def record(msg: str) -> tuple:
+    return (LogLevel.INFO, time.monotonic_ns(), "Test", msg, ())
+
+
+def test_dropped_records_are_reported(capsys):
+    writer = LogWriter(capacity=4)
+    for i in range(10):
+        writer.push(record(f"message {i}"))
+    writer.stop()
+    lines = capsys.readouterr().out.splitlines()
+    assert "6 log records dropped" in lines[0]
+    assert [line.split("] ")[-1].strip() for line in lines[1:]] == [
+        f"message {i}" for i in range(6, 10)
+    ]
+
+    # Reported once
+    writer.push(record("later"))
+    writer.stop()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1 and "later" in lines[0]
@@ -0,0 +1,59 @@
+from _journal import Journal, JournalReader, RecordKind, Verdict
+from _state import Step
+
+# Longer than the text of a record: continued in the next ones
+LONG_REPLY = "gtcp," + ",".join(f"{0.1 * i:.6f}" for i in range(12))
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "run.jrn")
+    # Small capacity: the file grows while written
+    journal = Journal(path, capacity=2)
+    journal.step(Step.MV_INPUT)
+    journal.command("gtcp")
+    journal.reply(LONG_REPLY, 0.004)
+    journal.step(Step.CHECK_QR)
+    journal.verdict(Verdict.QR, False)
+    journal.verdict(Verdict.DEFECT, True)
+    journal.timing("plc", 0.25)
+    journal.step(Step.MV_GOOD_BIN)
+    journal.close()
+
+    reader = JournalReader(path)
+    records = list(reader)
+    assert [r.kind for r in records] == [
+        RecordKind.STEP,
+        RecordKind.COMMAND,
+        RecordKind.REPLY,
+        RecordKind.STEP,
+        RecordKind.VERDICT,
+        RecordKind.VERDICT,
+        RecordKind.TIMING,
+        RecordKind.STEP,
+    ]
+    assert [r.t for r in records] == sorted(r.t for r in records)
+    command, reply = records[1], records[2]
+    assert command.text == "gtcp"
+    assert reply.text == LONG_REPLY and reply.value == 0.004
+    verdicts = list(reader.records(RecordKind.VERDICT))
+    assert [(r.code, r.value) for r in verdicts] == [(Verdict.QR, 0.0), (1, 1.0)]
+    timing = records[6]
+    assert (timing.text, timing.value) == ("plc", 0.25)
+
+    times = reader.step_times()
+    assert list(times) == ["MV_INPUT", "CHECK_QR"]
+    assert times["MV_INPUT"][0] == records[3].value
+    reader.close()
+
+
+def test_crashed_run_is_readable(tmp_path):
+    path = str(tmp_path / "run.jrn")
+    journal = Journal(path)
+    journal.command("gtcp")
+    journal.reply("gtcp,0,0,0,0,0,0", 0.001)
+
+    # Not closed: the file keeps its pre-sized length
+    reader = JournalReader(path)
+    assert [r.text for r in reader] == ["gtcp", "gtcp,0,0,0,0,0,0"]
+    reader.close()
+    journal.close()
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from _calibration import BinCalibration, CalibrationData
+from _custom_types import Vec3
+from _planner import RowOrderPlanner, TravelPlanner, travel
+from _state import APPROACH, Bin, State
+
+# 3x4 input tray, output bins on both sides of the checking approach pose
+LAYOUT = CalibrationData(
+    input_bin=BinCalibration(Vec3(0.10, -0.30, 0.05), 0.05, 0.04, 0.04, 3, 4),
+    good_bin=BinCalibration(Vec3(0.25, 0.10, 0.05), 0.05, 0.04, 0.04, 3, 4),
+    defect_bin=BinCalibration(Vec3(-0.15, 0.10, 0.05), 0.05, 0.04, 0.04, 3, 4),
+    checking_approach=Vec3(0.05, 0.05, 0.25),
+)
+
+
+def approach(state: State, bin: Bin, idx: int):
+    return state.poses(bin)[idx][APPROACH]
+
+
+def run_tray(planner: RowOrderPlanner, defects: list[bool]):
+    """
+    Process a full input tray, return the input and output cells in order and the
+    travel of the robot.
+    """
+    state = State(LAYOUT)
+    checking = state.get_checking_approach_pos()
+    planner.reset()
+    inputs, drops = [], []
+    position, distance = checking, 0.0
+    for defect in defects:
+        idx = planner.next_input(state)
+        state.input_taken[idx] = True
+        inputs.append(idx)
+        cell = approach(state, Bin.INPUT, idx)
+        distance += travel(position, cell) + travel(cell, checking)
+
+        bin = Bin.DEFECT if defect else Bin.GOOD
+        drop = planner.next_drop(state, bin)
+        state.occupancy(bin)[drop] = True
+        drops.append((bin, drop))
+        position = approach(state, bin, drop)
+        distance += travel(checking, position)
+    assert planner.next_input(state) is None
+    return inputs, drops, distance
+
+
+def defects(seed: int) -> list[bool]:
+    rng = random.Random(seed)
+    return [rng.random() < 0.3 for _ in range(12)]
+
+
+def test_row_order():
+    inputs, drops, _ = run_tray(RowOrderPlanner(), [False, True] * 6)
+    assert inputs == list(range(12))
+    assert [d for b, d in drops if b == Bin.GOOD] == list(range(6))
+    assert [d for b, d in drops if b == Bin.DEFECT] == list(range(6))
+
+
+def test_full_bin():
+    state = State(LAYOUT)
+    state.good_occupied[:] = [True] * len(state.good_occupied)
+    assert RowOrderPlanner().next_drop(state, Bin.GOOD) is None
+    assert TravelPlanner().next_drop(state, Bin.GOOD) is None
+
+
+def test_nearest_input_first():
+    state = State(LAYOUT)
+    checking = state.get_checking_approach_pos()
+    idx = TravelPlanner().next_input(state)
+    nearest = min(travel(checking, approach(state, Bin.INPUT, i)) for i in range(12))
+    assert travel(checking, approach(state, Bin.INPUT, idx)) == nearest
+
+
+def test_drop_looks_ahead():
+    state = State(LAYOUT)
+    planner = TravelPlanner()
+    state.input_taken[planner.next_input(state)] = True
+    drop = planner.next_drop(state, Bin.GOOD)
+
+    # Travel to the drop cell and on to the nearest remaining input cell
+    checking = state.get_checking_approach_pos()
+    remaining = [
+        approach(state, Bin.INPUT, i) for i in range(12) if not state.input_taken[i]
+    ]
+
+    def cost(idx: int) -> float:
+        cell = approach(state, Bin.GOOD, idx)
+        return travel(checking, cell) + min(travel(cell, p) for p in remaining)
+
+    assert cost(drop) == min(cost(i) for i in range(12))
+    # The next cartridge is the remaining one nearest to the drop cell
+    cell = approach(state, Bin.GOOD, drop)
+    idx = planner.next_input(state)
+    assert travel(cell, approach(state, Bin.INPUT, idx)) == pytest.approx(
+        min(travel(cell, p) for p in remaining)
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_every_cell_once_and_less_travel(seed):
+    row_inputs, _, row_travel = run_tray(RowOrderPlanner(), defects(seed))
+    inputs, drops, planned = run_tray(TravelPlanner(), defects(seed))
+    assert sorted(inputs) == sorted(row_inputs) == list(range(12))
+    assert len(set(drops)) == len(drops)
+    assert planned <= row_travel
@@ -0,0 +1,48 @@
+import asyncio
+
+from _plc_client import PlcClient
+from fake_plc import GOOD_QR, BAD_QR, FakePlc, LocalBroker, LocalMqttClient
+
+
+async def read_codes(status: bool) -> tuple[list[str | None], PlcClient, FakePlc]:
+    broker = LocalBroker()
+    plc = FakePlc(broker.client(), qr_codes=[GOOD_QR, BAD_QR], status=status)
+    plc.start()
+    client = PlcClient("local", client=broker.client())
+    assert await client.connect()
+    codes = [await client.read_qr(), await client.read_qr()]
+    await client.close()
+    plc.stop()
+    return codes, client, plc
+
+
+def test_acknowledged_steps():
+    codes, client, plc = asyncio.run(read_codes(status=True))
+    assert codes == [GOOD_QR, BAD_QR]
+    assert client.acknowledges
+    assert plc.triggered == 2
+
+
+def test_timed_steps_without_acknowledgement():
+    # Like mqtt/callback.scl: the PLC never publishes its status
+    codes, client, plc = asyncio.run(read_codes(status=False))
+    assert codes == [GOOD_QR, BAD_QR]
+    assert not client.acknowledges
+    assert plc.triggered == 2
+
+
+class UnreachableBroker(LocalMqttClient):
+    def loop_start(self) -> None:
+        # Never connected
+        pass
+
+
+def test_connect_timeout():
+    async def connect() -> bool:
+        client = PlcClient("local", client=UnreachableBroker(LocalBroker()))
+        client.connect_timeout = 0.05
+        connected = await client.connect()
+        assert not client.is_connected()
+        return connected
+
+    assert not asyncio.run(connect())
@@ -0,0 +1,55 @@
+import math
+
+import pytest
+
+from _calibration import BinCalibration
+from _custom_types import Vec3
+from _robot_calibration import corner_cells, fit_bin_grid
+
+
+def taught_corners(bin: BinCalibration, offset: float = 0.0) -> list:
+    points = []
+    for i, (row, col) in enumerate(corner_cells(bin.nrow, bin.ncol)):
+        x, y = bin.cell(row, col)
+        # Alternating teaching error along x
+        points.append((row, col, Vec3(x + offset * (-1) ** i, y, bin.origin.z)))
+    return points
+
+
+@pytest.mark.parametrize("rot", [0.0, 25.0, -60.0])
+def test_rotated_grid(rot):
+    bin = BinCalibration(
+        Vec3(0.2, -0.1, 0.05), 0.05, 0.03, 0.025, 4, 5, math.radians(rot)
+    )
+    fitted, rms = fit_bin_grid(taught_corners(bin), bin.nrow, bin.ncol, bin.dz)
+    assert rms < 1e-9
+    assert fitted.origin.x == pytest.approx(bin.origin.x, abs=1e-9)
+    assert fitted.origin.y == pytest.approx(bin.origin.y, abs=1e-9)
+    assert fitted.drow == pytest.approx(bin.drow, abs=1e-9)
+    assert fitted.dcol == pytest.approx(bin.dcol, abs=1e-9)
+    assert fitted.rot == pytest.approx(bin.rot, abs=1e-9)
+
+
+def test_half_turn_is_folded():
+    # A grid rotated by 150 deg is the grid rotated by -30 deg with opposite pitches
+    bin = BinCalibration(
+        Vec3(0.2, 0.1, 0.05), 0.05, 0.03, 0.025, 3, 3, math.radians(150)
+    )
+    fitted, rms = fit_bin_grid(taught_corners(bin), 3, 3, bin.dz)
+    assert rms < 1e-9
+    assert fitted.rot == pytest.approx(math.radians(-30))
+    assert (fitted.drow, fitted.dcol) == pytest.approx((-0.03, -0.025))
+
+
+def test_teaching_error_is_reported():
+    bin = BinCalibration(Vec3(0.2, 0.1, 0.05), 0.05, 0.03, 0.025, 3, 4, 0.3)
+    fitted, rms = fit_bin_grid(taught_corners(bin, 0.002), 3, 4, bin.dz)
+    # Partly absorbed by the fitted grid
+    assert 1e-4 < rms <= 0.002
+    assert fitted.rot == pytest.approx(0.3, abs=0.05)
+
+
+def test_untaught_first_cell():
+    bin = BinCalibration(Vec3(0.2, 0.1, 0.05), 0.05, 0.03, 0.025, 3, 4)
+    with pytest.raises(ValueError):
+        fit_bin_grid(taught_corners(bin)[1:], 3, 4, bin.dz)
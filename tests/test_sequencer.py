@@ -0,0 +1,117 @@
+import asyncio
+import socket
+
+import pytest
+
+from _async_robot_proxy import AsyncRobotProxy
+from _calibration import BinCalibration, CalibrationData
+from _custom_types import JointState, Vec3
+from _inspection import Inspector
+from _sequencer import CartridgeSequencer
+from sim_robot import SimConfig, SimRobot, run_virtual
+
+HOST = "127.0.0.1"
+# Time taken by the vision system to give a verdict (s)
+VERDICT_TIME = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def layout() -> CalibrationData:
+    """
+    2x2 trays around the checking pose, in reach of the simulated robot.
+    """
+    return CalibrationData(
+        input_bin=BinCalibration(Vec3(0.20, -0.25, 0.05), 0.05, 0.04, 0.04, 2, 2),
+        good_bin=BinCalibration(Vec3(0.20, 0.10, 0.05), 0.05, 0.04, 0.04, 2, 2),
+        defect_bin=BinCalibration(Vec3(-0.10, 0.20, 0.05), 0.05, 0.04, 0.04, 2, 2),
+        checking_approach=Vec3(0.25, 0.0, 0.25),
+        qr_checking=JointState(0.0, -1.2, 1.2, -1.5708, -1.5708, 0.0),
+        defect_checking=JointState(*SimConfig.home),
+    )
+
+
+class ScriptedInspector(Inspector):
+    """
+    Inspector giving the scripted verdicts, VERDICT_TIME after each acquisition.
+    """
+
+    def __init__(self, qr: list[bool], defects: list[bool]) -> None:
+        super().__init__()
+        self.qr = list(qr)
+        self.defects = list(defects)
+
+    @staticmethod
+    async def __verdict(defect: bool) -> bool:
+        await asyncio.sleep(VERDICT_TIME)
+        return defect
+
+    async def start_qr_check(self) -> asyncio.Future:
+        return asyncio.ensure_future(ScriptedInspector.__verdict(self.qr.pop(0)))
+
+    async def start_defect_check(self) -> asyncio.Future:
+        defect = self.defects.pop(0)
+        return asyncio.ensure_future(ScriptedInspector.__verdict(defect))
+
+
+async def _no_operator() -> str:
+    return ""
+
+
+async def run_tray(inspector: Inspector, overlap: bool):
+    """
+    Run a tray on the simulated robot, return the sequencer and the run time.
+    """
+    port = free_port()
+    proxy = AsyncRobotProxy(HOST, port)
+    await proxy.open_socket()
+    robot = SimRobot()
+    await robot.start(HOST, port)
+    sequencer = CartridgeSequencer(
+        proxy,
+        "",
+        inspector=inspector,
+        overlap_inspection=overlap,
+        operator_input=_no_operator,
+    )
+    sequencer.state.set_calibration(layout(), force=True)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        await sequencer.run()
+    finally:
+        await proxy.close_socket()
+        await robot.wait()
+    return sequencer, loop.time() - start
+
+
+# QR-Code verdicts, then anomaly verdicts of the cartridges checked for anomalies:
+# the second cartridge is rejected at the QR-Code check, the third one for an
+# anomaly. With the overlap, the second one is checked for anomalies anyway (its
+# QR-Code verdict is still pending), and that verdict is ignored.
+QR = [False, True, False, False]
+DEFECTS = {False: [False, True, False], True: [False, False, True, False]}
+
+
+@pytest.mark.parametrize("overlap", [False, True])
+def test_cartridges_are_sorted(overlap):
+    inspector = ScriptedInspector(QR, DEFECTS[overlap])
+    sequencer, _ = run_virtual(run_tray(inspector, overlap))
+    state = sequencer.state
+    assert all(state.input_taken)
+    assert state.good_occupied == [True, True, False, False]
+    assert state.defect_occupied == [True, True, False, False]
+    assert len(inspector.defects) == 0
+
+
+def test_overlap_hides_the_verdict_time():
+    inspector = ScriptedInspector(QR, DEFECTS[False])
+    _, sequential = run_virtual(run_tray(inspector, False))
+    inspector = ScriptedInspector(QR, DEFECTS[True])
+    _, overlapped = run_virtual(run_tray(inspector, True))
+    # The QR-Code verdicts come while the robot moves to the defect checking pose
+    assert overlapped < sequential - len(QR) * VERDICT_TIME / 2
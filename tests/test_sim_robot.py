@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+import sim_robot
+from sim_robot import SimConfig, SimRobot, run_virtual
+
+TARGET = [0.25, 0.0, 0.25, 0.0, 3.14, 0.0]
+
+
+def slow_ik(monkeypatch) -> None:
+    ik = sim_robot.inverse_kinematics
+
+    def slow(*args, **kwargs):
+        time.sleep(0.05)
+        return ik(*args, **kwargs)
+
+    monkeypatch.setattr(sim_robot, "inverse_kinematics", slow)
+
+
+async def timed_move() -> tuple[float, float]:
+    robot = SimRobot()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await robot.movel(TARGET)
+    return loop.time() - start, robot.motion_time
+
+
+def test_move_takes_its_modeled_time(monkeypatch):
+    elapsed, modeled = run_virtual(timed_move())
+    assert modeled > 0
+    assert elapsed == pytest.approx(modeled, abs=1e-9)
+    # The host time spent in the kinematics does not count
+    slow_ik(monkeypatch)
+    assert run_virtual(timed_move()) == (elapsed, modeled)
+
+
+async def exchange() -> list[tuple[str, float]]:
+    """
+    Run a move with the steadiness events on, return each message of the robot
+    with the time it was received at.
+    """
+    loop = asyncio.get_running_loop()
+    connected = loop.create_future()
+    server = await asyncio.start_server(
+        lambda r, w: connected.set_result((r, w)), "127.0.0.1", 0
+    )
+    robot = SimRobot()
+    await robot.start("127.0.0.1", server.sockets[0].getsockname()[1])
+    reader, writer = await connected
+
+    async def receive(n: int) -> list[tuple[str, float]]:
+        messages = []
+        while len(messages) < n:
+            data = (await reader.readuntil(b";"))[:-1].lstrip(b"\x00").decode()
+            messages.append((data, loop.time()))
+        return messages
+
+    writer.write(b"evt;")
+    messages = await receive(1)
+    writer.write(f"mvl,{','.join(str(v) for v in TARGET)};".encode())
+    messages += await receive(2)
+    writer.write(b"stp;")
+    messages += await receive(1)
+    await robot.wait()
+    writer.close()
+    server.close()
+    return messages
+
+
+def test_exchange_is_deterministic(monkeypatch):
+    first = run_virtual(exchange())
+    slow_ik(monkeypatch)
+    # Same virtual times, even with the host slowed down
+    assert run_virtual(exchange()) == first
+
+    (evt, _), (mvl, moved), (std, steady), (stp, _) = first
+    assert [evt, mvl, std, stp] == ["evtok", "mvlok", "std,1", "stpok"]
+    # Pushed at the first controller cycle once settled
+    c = SimConfig()
+    assert c.settle_time <= steady - moved <= c.settle_time + c.control_period
@@ -0,0 +1,69 @@
+import math
+from dataclasses import replace
+
+import pytest
+
+from _calibration import BinCalibration, CalibrationData
+from _custom_types import Vec3
+from _state import APPROACH, GRAB, Bin, State, compute_bin_poses
+
+INPUT = BinCalibration(Vec3(0.10, -0.30, 0.05), 0.05, 0.04, 0.03, 2, 3)
+
+
+def layout(input_bin: BinCalibration = INPUT) -> CalibrationData:
+    return CalibrationData(
+        input_bin=input_bin,
+        good_bin=BinCalibration(Vec3(0.25, 0.10, 0.05), 0.04, 0.04, 0.04, 2, 2),
+        defect_bin=BinCalibration(Vec3(-0.15, 0.10, 0.06), 0.05, 0.04, 0.04, 1, 2),
+        checking_approach=Vec3(0.05, 0.05, 0.25),
+    )
+
+
+def test_cells_in_traversal_order():
+    poses = compute_bin_poses(INPUT)
+    assert len(poses) == 6
+    for i, (grab, approach) in enumerate(poses):
+        # Row first, then column
+        row, col = divmod(i, INPUT.ncol)
+        assert (grab.x, grab.y, grab.z) == pytest.approx(
+            (0.10 + 0.04 * row, -0.30 + 0.03 * col, 0.05)
+        )
+        assert (approach.x, approach.y, approach.z) == pytest.approx(
+            (grab.x, grab.y, grab.z + INPUT.dz)
+        )
+
+
+def test_rotated_bin():
+    rotated = replace(INPUT, rot=math.pi / 2)
+    poses = compute_bin_poses(rotated)
+    # Rows go along y, columns along -x
+    grab = poses[INPUT.ncol + 1][GRAB]
+    assert (grab.x, grab.y) == pytest.approx((0.10 - 0.03, -0.30 + 0.04))
+
+
+def test_state_poses():
+    state = State(layout())
+    state.input_idx, state.good_idx, state.defect_idx = 4, 3, 1
+    cell = state.poses(Bin.INPUT)[4]
+    assert state.get_input_grabbing_pos() == cell[GRAB]
+    assert state.get_input_grabbing_approach_pos() == cell[APPROACH]
+    assert state.get_good_dropping_pos() == state.poses(Bin.GOOD)[3][GRAB]
+    assert state.get_defect_dropping_approach_pos().z == pytest.approx(0.11)
+    checking = state.get_checking_approach_pos()
+    assert (checking.x, checking.y, checking.z) == (0.05, 0.05, 0.25)
+
+
+def test_only_changed_tables_are_recomputed():
+    state = State(layout())
+    good, defect = state.poses(Bin.GOOD), state.poses(Bin.DEFECT)
+    state.input_taken[:2] = [True, True]
+    state.good_occupied[0] = True
+
+    # One more row in the input bin
+    state.set_calibration(layout(replace(INPUT, nrow=3)))
+    assert len(state.poses(Bin.INPUT)) == 9
+    assert state.poses(Bin.GOOD) is good
+    assert state.poses(Bin.DEFECT) is defect
+    # Occupancy kept, new cells free
+    assert state.input_taken == [True, True] + [False] * 7
+    assert state.good_occupied == [True, False, False, False]
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+
+from _state_stream import RobotStateStream
+from sim_robot import run_virtual
+
+HOST = "127.0.0.1"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def frame(seq: int, steady: bool = False) -> bytes:
+    # Joint i at seq + i / 10 rad, TCP at seq mm
+    joints = [round((seq + i / 10) * RobotStateStream.SCALE) for i in range(6)]
+    tcp = [seq * 1000] * 6
+    return RobotStateStream.FRAME.pack(seq, *joints, *tcp, int(steady))
+
+
+async def stream(capacity: int = RobotStateStream.DEFAULT_CAPACITY):
+    port = free_port()
+    server = RobotStateStream(HOST, port, capacity)
+    await server.open_socket()
+    _, writer = await asyncio.open_connection(HOST, port)
+    return server, writer
+
+
+async def push(server: RobotStateStream, writer, frames: list[bytes]) -> None:
+    target = server.n_samples() + len(frames)
+    writer.write(b"".join(frames))
+    while server.n_samples() < target:
+        await server.next_sample()
+
+
+def test_latest_sample():
+    async def run():
+        server, writer = await stream()
+        assert server.latest() is None
+        await push(server, writer, [frame(1), frame(2, steady=True)])
+        sample = server.latest()
+        writer.close()
+        await server.close()
+        return server, sample
+
+    server, sample = asyncio.run(run())
+    assert server.n_samples() == 2
+    assert sample.seq == 2 and sample.steady
+    assert sample.joints.wrist3 == 2.5
+    assert sample.tcp.x == 0.002
+
+
+def test_ring_keeps_the_latest_samples():
+    async def run():
+        server, writer = await stream(capacity=4)
+        await push(server, writer, [frame(seq) for seq in range(1, 11)])
+        history = server.history(10)
+        writer.close()
+        await server.close()
+        return history
+
+    # Older samples were overwritten, oldest first
+    assert [s.seq for s in asyncio.run(run())] == [7, 8, 9, 10]
+
+
+def test_stale_sample():
+    async def run():
+        server, writer = await stream()
+        await push(server, writer, [frame(1)])
+        fresh = server.is_fresh()
+        await asyncio.sleep(2 * RobotStateStream.MAX_AGE)
+        stale = server.latest(RobotStateStream.MAX_AGE)
+        writer.close()
+        await server.close()
+        return fresh, stale, server.latest()
+
+    fresh, stale, latest = run_virtual(run())
+    assert fresh and stale is None
+    # Still there without an age limit
+    assert latest.seq == 1
+
+
+def test_wait_steady():
+    async def run():
+        server, writer = await stream()
+        steady = asyncio.ensure_future(server.wait_steady(timeout=1))
+        await push(server, writer, [frame(1), frame(2)])
+        assert not steady.done()
+        writer.write(frame(3, steady=True))
+        assert await steady
+        # No sample after the call: timed out
+        assert await server.wait_steady(timeout=0.1) is False
+
+        lost = asyncio.ensure_future(server.wait_steady())
+        await asyncio.sleep(0)
+        writer.close()
+        assert await lost is None
+        assert not server.is_connected()
+        await server.close()
+
+    run_virtual(run())
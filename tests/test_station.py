@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from _station import InspectionStation
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.t = 0.0
+
+    def __call__(self) -> float:
+        return self.t
+
+
+def learnt_station(shortest_first: bool, holds: dict[str, float]):
+    """
+    Station whose cells already held it once for their given time.
+    """
+    clock = Clock()
+    station = InspectionStation(shortest_first, clock=clock)
+
+    async def learn():
+        for cell_id, hold in holds.items():
+            access = station.add_cell(cell_id)
+            await access.acquire()
+            clock.t += hold
+            access.release()
+
+    asyncio.run(learn())
+    return station, clock
+
+
+async def admitted(station: InspectionStation, holder: str, waiting: list[str]):
+    """
+    Queue the waiting cells in order behind the holder, return the order in which
+    they are admitted.
+    """
+    order = []
+
+    async def use(cell_id: str) -> None:
+        await station.cells[cell_id].acquire()
+        order.append(cell_id)
+        await asyncio.sleep(0)
+        station.cells[cell_id].release()
+
+    await station.cells[holder].acquire()
+    tasks = []
+    for cell_id in waiting:
+        tasks.append(asyncio.create_task(use(cell_id)))
+        await asyncio.sleep(0)
+    station.cells[holder].release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.parametrize(
+    "shortest_first, order", [(True, ["b", "c", "a"]), (False, ["a", "b", "c"])]
+)
+def test_admission_order(shortest_first, order):
+    station, _ = learnt_station(shortest_first, {"a": 30, "b": 10, "c": 20, "h": 5})
+    assert asyncio.run(admitted(station, "h", ["a", "b", "c"])) == order
+
+
+def test_bypass_is_bounded():
+    station, _ = learnt_station(True, {"long": 30, "short": 10, "h": 5})
+    long, short = station.cells["long"], station.cells["short"]
+
+    async def run():
+        order = []
+        await station.cells["h"].acquire()
+        long_turn = asyncio.create_task(long.acquire())
+        await asyncio.sleep(0)
+        while station.holder() != "long":
+            # A shorter slot is requested again before each release
+            asyncio.create_task(short.acquire())
+            await asyncio.sleep(0)
+            station.cells[station.holder()].release()
+            await asyncio.sleep(0)
+            order.append(station.holder())
+        await long_turn
+        return order
+
+    order = asyncio.run(run())
+    assert order == ["short"] * InspectionStation.MAX_BYPASS + ["long"]
+
+
+def test_cancelled_request_is_dropped():
+    station, _ = learnt_station(True, {"a": 10, "b": 20, "h": 5})
+
+    async def run():
+        await station.cells["h"].acquire()
+        cancelled = asyncio.create_task(station.cells["a"].acquire())
+        waiting = asyncio.create_task(station.cells["b"].acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        station.cells["h"].release()
+        await waiting
+        return station.holder()
+
+    assert asyncio.run(run()) == "b"
+
+
+def test_statistics():
+    station, clock = learnt_station(True, {"a": 10, "b": 30})
+    # Both held it once, the station was never idle
+    assert station.utilisation() == pytest.approx(1.0)
+    stats = station.stats()["cells"]
+    assert stats["a"]["slots"] == stats["b"]["slots"] == 1
+    assert (stats["a"]["hold_mean"], stats["b"]["hold_mean"]) == (10, 30)
+
+    clock.t += 40
+    assert station.utilisation() == pytest.approx(0.5)
@@ -0,0 +1,85 @@
+from _wire_protocol import BinaryProtocol, TextProtocol
+
+
+def replies(protocol) -> list[str]:
+    return [protocol.pop() for _ in range(protocol.pending())]
+
+
+def test_text_replies_split_across_segments():
+    text = TextProtocol(";")
+    text.feed(b"gjp,1,2")
+    assert replies(text) == []
+    text.feed(b",3;mvl")
+    text.feed(b"ok;")
+    assert replies(text) == ["gjp,1,2,3", "mvlok"]
+    assert text.buffered() == 0
+
+
+def test_text_drops_socket_probes():
+    text = TextProtocol(";")
+    for data in (b"mvlok;\x00", b"gop;\x00", b"\x00\x00gt", b"p,1\x00;"):
+        text.feed(data)
+    assert replies(text) == ["mvlok", "gop", "gtp,1"]
+    assert text.buffered() == 0
+
+
+def test_text_probe_only_segment():
+    text = TextProtocol(";")
+    text.feed(b"\x00")
+    assert replies(text) == []
+    assert text.buffered() == 0
+
+
+def test_text_encode():
+    assert TextProtocol(";").encode("gtp") == b"gtp;"
+
+
+def frame(opcode: int, seq: int, *ints: int) -> bytes:
+    ints = ints + (0,) * (6 - len(ints))
+    return BinaryProtocol.FRAME.pack(opcode, seq, *ints)
+
+
+def test_binary_round_trip():
+    binary = BinaryProtocol()
+    sent = binary.encode("gtp")
+    assert len(sent) == BinaryProtocol.FRAME.size
+    opcode, seq, *_ = BinaryProtocol.FRAME.unpack(sent)
+    assert opcode == BinaryProtocol.OPCODES["gtp"]
+
+    reply = frame(opcode, seq, 100000, -200000, 300000, 0, 0, 1500000)
+    binary.feed(reply[:10])
+    assert replies(binary) == []
+    binary.feed(reply[10:])
+    assert replies(binary) == ["gtp,0.1,-0.2,0.3,0.0,0.0,1.5"]
+
+
+def test_binary_resynchronises_after_socket_probes():
+    binary = BinaryProtocol()
+    cmds = ("mvl,0,0,0,0,0,0", "gop", "std", "gcl")
+    seqs = [BinaryProtocol.FRAME.unpack(binary.encode(c))[1] for c in cmds]
+
+    stream = (
+        b"\x00"
+        + frame(4, seqs[0])
+        + b"\x00"
+        + frame(5, seqs[1])
+        + b"\x00\x00"
+        + frame(7, seqs[2])
+        + b"\x00"
+        # gcl not supported: unknown command
+        + frame(-1, seqs[3])
+        + b"\x00"
+    )
+    # Byte per byte: probes may arrive in their own segment
+    for i in range(len(stream)):
+        binary.feed(stream[i : i + 1])
+    assert replies(binary) == ["mvlok", "gop", "std", "ukn"]
+    assert binary.buffered() <= 1
+
+
+def test_binary_steady_event_between_replies():
+    binary = BinaryProtocol()
+    seq = BinaryProtocol.FRAME.unpack(binary.encode("gop"))[1]
+    event = frame(BinaryProtocol.STEADY, BinaryProtocol.EVENT_SEQ, 12)
+    binary.feed(event + b"\x00" + frame(5, seq))
+    assert replies(binary) == ["std,12", "gop"]